@@ -0,0 +1,62 @@
+"""
+Search index benchmark with synthetic entries, as if a CA had issued a lot of certificates.
+
+Usage: python benchmarks/bench_index.py [--certs 500000]
+"""
+import os
+import time
+import random
+import hashlib
+import argparse
+import datetime
+import tempfile
+from pathlib import Path
+from certmaestro.index import CertIndex, IndexEntry
+from certmaestro.wrapper import SerialNumber
+
+
+def make_entries(count):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for i in range(count):
+        name = f'host{i}.team{i % 1000}.example.com'
+        digest = hashlib.sha256(name.encode()).hexdigest()
+        terms = {('cn', name), ('san', name), ('san', f'*.team{i % 1000}.example.com'),
+                 ('issuer', 'example ca'), ('sha1', digest[:40]), ('sha256', digest),
+                 ('spki', digest[::-1])}
+        not_after = now + datetime.timedelta(days=random.randint(1, 365))
+        yield IndexEntry(SerialNumber.from_int(i + 1), name, not_after, frozenset(terms))
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:<45}{(time.perf_counter() - start) * 1000:>10.1f} ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--certs', type=int, default=500_000, help='Number of certificates')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with CertIndex(Path(tmp_dir) / 'index.sqlite3') as index:
+            timed(f'rebuild with {args.certs} certificates',
+                  lambda: index.rebuild(make_entries(args.certs)))
+            print(f'{"index size":<45}{os.path.getsize(index.path) / 2**20:>10.1f} MB')
+            middle = args.certs // 2
+            queries = [
+                f'host{middle}.team{middle % 1000}.example.com',
+                '.team42.example.com',
+                f'host{middle}*',
+                '*.team7.example.com',
+                hashlib.sha256(f'host{middle}.team{middle % 1000}.example.com'
+                               .encode()).hexdigest(),
+            ]
+            for query in queries:
+                results = timed(f'search {query[:36]}', lambda: list(index.search(query)))
+                print(f'{"":<10}{len(results)} results')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Migration benchmark: SQLite to SQLite with many certificates, the rate and the memory growth
+of streaming them in batches, and of comparing the two databases at the end.
+
+Usage: python benchmarks/bench_migrate.py [--rows 500000] [--batch-size 1000]
+"""
+import time
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+from certmaestro.backends.interfaces import CertRecord
+from certmaestro.backends.sqlite import Backend
+from certmaestro.csr import CsrBuilder
+from certmaestro.migrate import Migration
+from certmaestro.wrapper import Cert
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_records(template: Cert, key, count):
+    """Copies of the template with other serial numbers, the signatures are not valid."""
+    asn1 = template.asn1.copy()
+    for serial in range(1, count + 1):
+        asn1['tbs_certificate']['serial_number'] = serial
+        yield CertRecord(Cert.from_der(asn1.dump(force=True)), key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--rows', type=int, default=500_000, help='Certificates to migrate')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Certificates per batch')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Backend(Path(tmp_dir) / 'source.sqlite3', busy_timeout=30, pool_size=2)
+        source.setup(common_name='Benchmark CA', ca_days=365, cert_days=30, key_type='ec',
+                     crl_days=7)
+        csr = CsrBuilder(source.get_csr_policy(), source.get_csr_defaults())
+        csr['common_name'] = 'template.example.com'
+        key, template = source.signer.issue(csr, 30, 'ec')
+        records = synthetic_records(template, key, args.rows)
+        source.import_records(records, batch_size=10_000)
+        source.revoke_certs(hex(serial) for serial in range(1, args.rows + 1, 100))
+
+        destination = Backend(Path(tmp_dir) / 'destination.sqlite3', busy_timeout=30,
+                              pool_size=2)
+        migration = Migration(source, destination, Path(tmp_dir) / 'checkpoint.json',
+                              args.batch_size)
+        migration.migrate_ca()
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        summary = migration.run()
+        elapsed = time.perf_counter() - start
+        print(f'{"migrate " + str(args.rows):<40}{elapsed:>9.2f} s'
+              f'{args.rows / elapsed:>12.0f} /s')
+        start = time.perf_counter()
+        migration.verify(summary)
+        elapsed = time.perf_counter() - start
+        print(f'{"verify":<40}{elapsed:>9.2f} s{args.rows / elapsed:>12.0f} /s')
+        print(f'{"max RSS growth":<40}{max_rss_mb() - rss_before:>9.1f} MB')
+        print(summary)
+        size = sum(path.stat().st_size for path in Path(tmp_dir).glob('destination.*'))
+        print(f'{"destination size":<40}{size / 2 ** 20:>9.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
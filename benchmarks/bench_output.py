@@ -0,0 +1,79 @@
+"""
+Output format benchmark: time to the first row, total time and memory growth of writing many
+certificates in every format, with the default and with all fields.
+
+Usage: python benchmarks/bench_output.py [--rows 100000]
+"""
+import io
+import time
+import contextlib
+import argparse
+import resource
+from certmaestro.cli import output
+from certmaestro.wrapper import Cert
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_ders(template: Cert, count):
+    """DER encoded copies of the template with other serial numbers."""
+    asn1 = template.asn1.copy()
+    ders = []
+    for serial in range(1, count + 1):
+        asn1['tbs_certificate']['serial_number'] = serial
+        ders.append(asn1.dump(force=True))
+    return ders
+
+
+class FirstRow(io.TextIOBase):
+    """Drops the output, remembers when the first row was written after the header lines."""
+
+    def __init__(self, header_lines):
+        self.header_lines = header_lines
+        self.first_at = None
+
+    def write(self, s):
+        if self.first_at is None:
+            self.header_lines -= s.count('\n')
+            if self.header_lines < 0:
+                self.first_at = time.perf_counter()
+        return len(s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--rows', type=int, default=100_000, help='Certificates to write')
+    args = parser.parse_args()
+
+    # the test helper makes a CA with a 2048 bit RSA key, run from the repository root
+    from tests.certmaker import CertMaker
+    cert_maker = CertMaker()
+    ders = synthetic_ders(Cert(cert_maker.pem(cert_maker.ca)), args.rows)
+    field_sets = {
+        'default': [output.CERT_FIELDS[name] for name in ('common_name', 'not_valid_before',
+                                                         'not_valid_after', 'serial_number')],
+        'all': list(output.CERT_FIELDS.values()),
+    }
+    print(f'{"format":<16}{"first row":>12}{"total":>12}{"rate":>12}{"RSS growth":>12}')
+    for fields_name, fields in field_sets.items():
+        # the table last, the growth of the streamed formats would be hidden by its peak
+        for output_format in sorted(output.FORMATS, key=lambda f: f == 'table'):
+            # only the header line of the csv format is written on its own
+            stream = FirstRow(header_lines=1 if output_format == 'csv' else 0)
+            rss_before = max_rss_mb()
+            start = time.perf_counter()
+            # parsed when listed, like the certificates read from a backend
+            certs = (Cert.from_der(der) for der in ders)
+            with contextlib.redirect_stdout(stream):
+                output.write_rows(certs, fields, output_format)
+            elapsed = time.perf_counter() - start
+            first = stream.first_at - start
+            print(f'{output_format + " " + fields_name:<16}{first * 1000:>9.1f} ms'
+                  f'{elapsed:>10.2f} s{args.rows / elapsed:>10.0f}/s'
+                  f'{max_rss_mb() - rss_before:>9.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+SQL backend benchmark: bulk load, listing, issuance, revocation, CRL generation and queries
+with a big certificate table. The certmaestro tables in the database are dropped and recreated!
+
+Usage: python benchmarks/bench_sql.py --url mysql://root@localhost/bench [--rows 1000000]
+       (postgresql:// URLs use the PostgreSQL backend, sqlite:///path/to/file the SQLite one)
+"""
+import time
+import argparse
+import resource
+import datetime
+from certmaestro.backends.interfaces import CertQuery
+from certmaestro.backends.sql import CA_TABLE, CERTS_TABLE, VALID, serial_hex
+from certmaestro.csr import CsrBuilder
+from certmaestro.wrapper import SerialNumber
+
+
+def make_backend(url):
+    if url.startswith(('postgres://', 'postgresql://')):
+        from certmaestro.backends.postgres import Backend
+        return Backend(url, pool_size=4)
+    elif url.startswith('sqlite://'):
+        from certmaestro.backends.sqlite import Backend
+        return Backend(url[len('sqlite://'):], busy_timeout=30, pool_size=4)
+    from certmaestro.backends.mysql import Backend
+    return Backend(url, pool_size=4)
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40}{elapsed:>9.2f} s{count / elapsed:>12.0f} /s')
+    return result
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def csrs(backend, prefix, count):
+    for i in range(count):
+        csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+        csr['common_name'] = f'{prefix}{i}.example.com'
+        yield csr
+
+
+def fill(backend, template, rows, batch_size=10_000):
+    """Synthetic rows with the same certificate, only the indexed columns differ."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for start in range(0, rows, batch_size):
+        batch = [(serial_hex(i + 1), f'host{i}.example.com', backend._db_time(now),
+                  backend._db_time(now + datetime.timedelta(days=i % 365)), VALID, None, None,
+                  template.der, None)
+                 for i in range(start, min(start + batch_size, rows))]
+        with backend._connection() as connection:
+            backend._insert_rows(connection, batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--url', required=True, help='Database URL')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Rows in the table')
+    parser.add_argument('--issue', type=int, default=2000, help='Certificates to issue')
+    parser.add_argument('--revoke', type=int, default=10_000, help='Certificates to revoke')
+    args = parser.parse_args()
+
+    backend = make_backend(args.url)
+    with backend._connection() as connection:
+        for table in (CERTS_TABLE, CA_TABLE):
+            backend._execute(connection, f'DROP TABLE IF EXISTS {table}')
+    backend.setup(common_name='Benchmark CA', ca_days=365, cert_days=30, key_type='ec',
+                  crl_days=7)
+    _, template = backend.issue_cert(next(csrs(backend, 'template', 1)))
+    with backend._connection() as connection:
+        backend._execute(connection, f'DELETE FROM {CERTS_TABLE}')
+
+    timed(f'bulk load {args.rows} rows', args.rows, lambda: fill(backend, template, args.rows))
+    rss_before = max_rss_mb()
+    count = timed('list all certificates', args.rows,
+                  lambda: sum(1 for _ in backend.list_certs()))
+    assert count == args.rows
+    print(f'{"max RSS growth while listing":<40}{max_rss_mb() - rss_before:>9.1f} MB')
+
+    timed(f'issue {args.issue} one by one', args.issue,
+          lambda: [backend.issue_cert(csr) for csr in csrs(backend, 'single', args.issue)])
+    timed(f'issue {args.issue} in batches of 100', args.issue,
+          lambda: [backend.issue_certs(list(csrs(backend, f'batch{i}-', 100)))
+                   for i in range(args.issue // 100)])
+    serials = [hex(i + 1) for i in range(0, args.rows, max(args.rows // args.revoke, 1))]
+    timed(f'revoke {len(serials)} in one transaction', len(serials),
+          lambda: backend.revoke_certs(serials))
+    timed(f'CRL with {len(serials)} revoked', len(serials), backend.get_crl)
+
+    # done by the database, compare with listing all certificates above
+    now = datetime.datetime.now(datetime.timezone.utc)
+    queries = {
+        'query: expiring in 7 days, by expiry': CertQuery(
+            status='valid', expires_after=now, expires_before=now + datetime.timedelta(days=7),
+            sort='expiry'),
+        'query: first 100 by expiry': CertQuery(sort='expiry', limit=100),
+        'query: 100 after the middle by expiry': CertQuery(
+            sort='expiry', limit=100,
+            after=(now + datetime.timedelta(days=182), SerialNumber.from_int(0))),
+        'query: common name host12345*': CertQuery(common_name='host12345*'),
+        'query: revoked': CertQuery(status='revoked'),
+    }
+    for label, query in queries.items():
+        start = time.perf_counter()
+        count = sum(1 for _ in backend.list_certs(query))
+        elapsed = time.perf_counter() - start
+        print(f'{label:<40}{elapsed * 1000:>9.1f} ms{count:>10} rows')
+    backend.close()
+
+
+if __name__ == '__main__':
+    main()
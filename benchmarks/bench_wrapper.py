@@ -0,0 +1,72 @@
+"""
+Microbenchmarks of the wrapper value types which are created in bulk when listing certificates.
+
+Usage: python benchmarks/bench_wrapper.py [--number 100000]
+"""
+import timeit
+import argparse
+from asn1crypto import x509 as asn1x509
+from certmaestro.wrapper import Cert, Name, SerialNumber
+
+
+SERIAL_HEX = '5f:3a:9c:0e:11:72:aa:04:b2:9d:61:0c:ee:31:7a:0f:42:19:88:e5'
+SERIAL_INT = int(SERIAL_HEX.replace(':', ''), 16)
+NAME = '/C=HU/ST=Pest megye/L=Budapest/O=Certmaestro/CN=vpn.example.com'
+
+
+def serial_number_benchmarks():
+    a, b = SerialNumber(SERIAL_HEX), SerialNumber.from_int(SERIAL_INT)
+    return {
+        'SerialNumber(str)': lambda: SerialNumber(SERIAL_HEX),
+        'SerialNumber.from_int': lambda: SerialNumber.from_int(SERIAL_INT),
+        'SerialNumber ==': lambda: a == b,
+        'SerialNumber <': lambda: a < b,
+        'hash(SerialNumber)': lambda: hash(a),
+        'str(SerialNumber.from_int)': lambda: str(SerialNumber.from_int(SERIAL_INT)),
+    }
+
+
+def name_benchmarks():
+    a, b = Name(NAME), Name.from_dict(Name(NAME).native)
+    # names of parsed certificates are loaded from DER, not built
+    asn1name = asn1x509.Name.load(Name(NAME).asn1.dump())
+    return {
+        'Name(str)': lambda: Name(NAME),
+        'Name.from_asn1': lambda: Name.from_asn1(asn1name),
+        'Name ==': lambda: a == b,
+        'hash(Name)': lambda: hash(a),
+        'Name.common_name': lambda: a.common_name,
+        'asn1 Name.build': lambda: asn1x509.Name.build(dict(b.native)),
+    }
+
+
+def cert_benchmarks():
+    # the test helper makes a CA with a 2048 bit RSA key, run from the repository root
+    from tests.certmaker import CertMaker
+    cert_maker = CertMaker()
+    cert = Cert(cert_maker.pem(cert_maker.ca))
+    public_key = cert.public_key
+    return {
+        'Cert.signature': lambda: cert.signature,
+        'PublicKey.modulus': lambda: public_key.modulus,
+        'PublicKey.exponent': lambda: public_key.exponent,
+        'Cert.public_key.modulus (uncached)': lambda: cert.public_key.modulus,
+    }
+
+
+BENCHMARKS = [serial_number_benchmarks, name_benchmarks, cert_benchmarks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--number', type=int, default=100_000, help='Calls per benchmark')
+    args = parser.parse_args()
+
+    for make_benchmarks in BENCHMARKS:
+        for name, func in make_benchmarks().items():
+            best = min(timeit.repeat(func, number=args.number, repeat=5))
+            print(f'{name:<40}{best / args.number * 1e9:>10.0f} ns/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Load test of the HTTP API with the OpenSSL backend, on a new CA in a temporary directory.
+Clients mostly get certificates, some of them issue new ones.
+
+Usage: python benchmarks/load_api.py [--clients 16] [--requests 2000] [--issue-ratio 0.02]
+"""
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import http.client
+from pathlib import Path
+from collections import defaultdict
+from certmaestro.api import ApiServer
+from certmaestro.csr import CsrBuilder
+from tests.openssl.openssl_ca import make_openssl_ca
+
+
+def issue(backend, common_name):
+    csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+    csr['common_name'] = common_name
+    return backend.issue_cert(csr)[1]
+
+
+def run_client(port, serials, requests, issue_ratio, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    for i in range(requests):
+        if random.random() < issue_ratio:
+            kind, method, path = 'issue', 'POST', '/certs'
+            body = json.dumps({'common_name': f'load{threading.get_ident()}-{i}.example.com'})
+        elif random.random() < 0.1:
+            kind, method, path, body = 'ca', 'GET', '/ca', None
+        else:
+            kind, method, path, body = 'get', 'GET', f'/certs/{random.choice(serials)}', None
+        start = time.perf_counter()
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        response.read()
+        latencies[kind].append(time.perf_counter() - start)
+        if response.status != 200:
+            errors.append(response.status)
+    connection.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--clients', type=int, default=16, help='Number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests in total')
+    parser.add_argument('--issue-ratio', type=float, default=0.02,
+                        help='Ratio of issue requests')
+    parser.add_argument('--certs', type=int, default=50, help='Certificates issued beforehand')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = make_openssl_ca(Path(tmp_dir))
+        serials = [issue(backend, f'host{i}.example.com').serial_number.as_hex()
+                   for i in range(args.certs)]
+        server = ApiServer(backend, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        latencies = defaultdict(list)
+        errors = []
+        per_client = args.requests // args.clients
+        clients = [threading.Thread(target=run_client,
+                                    args=(server.server_address[1], serials, per_client,
+                                          args.issue_ratio, latencies, errors))
+                   for _ in range(args.clients)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f'{backend.name} backend, {args.clients} clients, '
+          f'backend calls {"parallel" if backend.threadsafe else "serialized"}')
+    print(f'{"throughput":<12}{total / elapsed:>10.1f} requests/s')
+    print(f'{"coalesced":<12}{server.executor.coalesced:>10} calls')
+    print(f'{"errors":<12}{len(errors):>10}')
+    for kind, values in sorted(latencies.items()):
+        print(f'{kind:<12}{len(values):>10} requests  p50 {percentile(values, 0.5) * 1000:>8.1f} ms'
+              f'  p99 {percentile(values, 0.99) * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
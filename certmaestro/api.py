@@ -0,0 +1,225 @@
+"""
+    HTTP API for requesting and managing certificates from other services.
+
+    GET  /ca                        CA certificate
+    GET  /certs                     all issued certificates
+    GET  /certs/<serial>            one certificate
+    POST /certs                     issue a certificate, the body is the subject, e.g.
+                                    {"common_name": "example.com"}, the response has the key too
+    POST /certs/<serial>/revoke     revoke a certificate
+    GET  /crl                       certificate revocation list
+
+    Every response is JSON, errors are {"error": message}. There is no authentication and
+    private keys are sent in responses, so only listen on addresses trusted clients can reach.
+"""
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+import asn1crypto.pem as asn1pem
+from .backends.interfaces import IBackend
+from .csr import CsrBuilder
+from .exceptions import BackendError
+from .wrapper import Cert, Crl, RevokedCert
+
+
+DEFAULT_PORT = 8740
+CONTENT_TYPE = 'application/json'
+
+
+class BackendExecutor:
+    """Runs backend calls on a thread pool if the backend is thread-safe, otherwise one by one
+    on a single thread. Waiting calls of a serialized backend are coalesced: a read which is
+    already queued with the same arguments is not queued again, the callers share its result.
+    """
+
+    def __init__(self, backend: IBackend, workers: Optional[int]=None):
+        self.backend = backend
+        self.serialized = not backend.threadsafe
+        self._executor = ThreadPoolExecutor(1 if self.serialized else workers,
+                                            thread_name_prefix='certmaestro-backend')
+        self._queued = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def submit(self, func: Callable, *args, coalesce=False) -> Future:
+        """Run func(backend, *args). Only pass coalesce=True for calls without side effects."""
+        if not (coalesce and self.serialized):
+            return self._executor.submit(func, self.backend, *args)
+        key = (func, args)
+        with self._lock:
+            future = self._queued.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._queued[key] = self._executor.submit(self._run_queued, key, func, args)
+            return future
+
+    def _run_queued(self, key, func, args):
+        # callers coming from now on need a new call, which sees the changes made until then
+        with self._lock:
+            del self._queued[key]
+        return func(self.backend, *args)
+
+    def call(self, func: Callable, *args, coalesce=False):
+        return self.submit(func, *args, coalesce=coalesce).result()
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def _format_time(value):
+    return value.isoformat() if value is not None else None
+
+
+def cert_to_json(cert: Cert) -> dict:
+    return {
+        'serial_number': cert.serial_number.as_hex(),
+        'common_name': cert.subject.common_name,
+        'issuer': cert.issuer.common_name,
+        'not_valid_before': _format_time(cert.not_valid_before),
+        'not_valid_after': _format_time(cert.not_valid_after),
+        'pem': str(cert),
+    }
+
+
+def revoked_cert_to_json(revoked_cert: RevokedCert) -> dict:
+    return {
+        'serial_number': revoked_cert.serial_number.as_hex(),
+        'revocation_date': _format_time(revoked_cert.revocation_date),
+        'reason': revoked_cert.reason.native if revoked_cert.reason is not None else None,
+    }
+
+
+def crl_to_json(crl: Crl) -> dict:
+    return {
+        'issuer': crl.issuer.common_name,
+        'this_update': _format_time(crl.this_update),
+        'next_update': _format_time(crl.next_update),
+        'revoked': [revoked_cert_to_json(revoked_cert) for revoked_cert in crl],
+        'pem': asn1pem.armor('X509 CRL', crl.der).decode(),
+    }
+
+
+# these run on the backend executor, generators have to be consumed there too
+
+def _get_ca_cert(backend):
+    return backend.get_ca_cert()
+
+
+def _get_cert(backend, serial):
+    return backend.get_cert(serial)
+
+
+def _get_crl(backend):
+    return backend.get_crl()
+
+
+def _list_certs(backend):
+    return list(backend.list_certs())
+
+
+def _issue_cert(backend, values):
+    csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults() or {})
+    for field, value in values:
+        try:
+            csr[field] = value
+        except KeyError:
+            raise ValueError(f'Unknown subject field: {field}') from None
+    if not csr.common_name:
+        raise ValueError('common_name is required')
+    return backend.issue_cert(csr)
+
+
+def _revoke_cert(backend, serial):
+    revoked_cert = backend.revoke_cert(serial)
+    if revoked_cert is None:
+        raise BackendError(f'Certificate {serial} could not be revoked')
+    return revoked_cert
+
+
+class _NotFound(Exception):
+    pass
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # keep-alive, clients issuing many requests shouldn't have to connect every time
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        executor = self.server.executor
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        try:
+            if method == 'GET' and parts == ['ca']:
+                result = cert_to_json(executor.call(_get_ca_cert, coalesce=True))
+            elif method == 'GET' and parts == ['certs']:
+                result = [cert_to_json(c) for c in executor.call(_list_certs, coalesce=True)]
+            elif method == 'GET' and len(parts) == 2 and parts[0] == 'certs':
+                result = cert_to_json(executor.call(_get_cert, parts[1].lower(), coalesce=True))
+            elif method == 'GET' and parts == ['crl']:
+                crl = executor.call(_get_crl, coalesce=True)
+                if crl is None:
+                    raise _NotFound('No CRL has been made yet')
+                result = crl_to_json(crl)
+            elif method == 'POST' and parts == ['certs']:
+                values = tuple(sorted(self._read_json().items()))
+                key, cert = executor.call(_issue_cert, values)
+                result = {'key': str(key), 'cert': cert_to_json(cert)}
+            elif method == 'POST' and len(parts) == 3 and parts[::2] == ['certs', 'revoke']:
+                result = revoked_cert_to_json(executor.call(_revoke_cert, parts[1].lower()))
+            else:
+                raise _NotFound(f'Not found: {method} {self.path}')
+        except _NotFound as e:
+            self._send(404, {'error': str(e)})
+        except FileNotFoundError:
+            self._send(404, {'error': f'Not found: {self.path}'})
+        except (BackendError, ValueError) as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            self._send(500, {'error': f'{e.__class__.__name__}: {e}'})
+        else:
+            self._send(200, result)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            values = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON: {e}')
+        if not isinstance(values, dict):
+            raise ValueError('Expected a JSON object')
+        return values
+
+    def _send(self, status, message):
+        body = json.dumps(message).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Every connection has its own thread, backend calls go through a BackendExecutor."""
+    daemon_threads = True
+
+    def __init__(self, backend: IBackend, address='127.0.0.1', port=DEFAULT_PORT,
+                 workers: Optional[int]=None, verbose=False):
+        super().__init__((address, port), _RequestHandler)
+        self.executor = BackendExecutor(backend, workers)
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
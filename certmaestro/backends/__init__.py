@@ -13,6 +13,7 @@ _BACKEND_NAME_MODULE_MAP = {
     'Easy-RSA 2.X': '.easy_rsa',
     'PostgreSQL': '.postgres',
     'MySQL': '.mysql',
+    'SQLite': '.sqlite',
 }
 
 
@@ -22,19 +23,22 @@ def load_all_backends():
     setup, only the relevant backend will be imported, mostly to avoid unnecessary dependencies
     and faster startup time.
     """
-    from . import vault, openssl, easy_rsa, postgres, mysql
-    return [vault.Backend, openssl.Backend, easy_rsa.Backend, postgres.Backend, mysql.Backend]
+    from . import vault, openssl, easy_rsa, postgres, mysql, sqlite
+    return [vault.Backend, openssl.Backend, easy_rsa.Backend, postgres.Backend, mysql.Backend,
+            sqlite.Backend]
 
 
 def get_backend(config):
-    BackendCls = _load_backend(config.backend_name)
+    BackendCls = _load_backend(config.backend_type)
     init_param_names = set(p.name for p in BackendCls.init_requires)
     extra_parameters = set(config.backend_config) - init_param_names
     if extra_parameters:
         paramlist = ', '.join(extra_parameters)
         raise BackendError(f"Invalid parameters in certmaestro config: {paramlist}")
     params = make_params(BackendCls.init_requires, config.backend_config)
-    return BackendCls(**params)
+    # every write goes through here: the CLI, the daemon, the API and migrations
+    from ..index import IndexingBackend
+    return IndexingBackend(BackendCls(**params), config.index_path)
 
 
 def _load_backend(backend_name):
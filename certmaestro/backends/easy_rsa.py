@@ -1,19 +1,20 @@
 import os
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, Optional
 from subprocess import run, PIPE, DEVNULL
 from ..wrapper import PrivateKey, Cert, RevokedCert, SerialNumber, Crl
 from ..config import Param
 from ..exceptions import BackendError
 from ..csr import CsrBuilder
-from .interfaces import IBackend
+from .interfaces import CertQuery, CertRecord, IBackend
 from .openssl import Backend as OpenSSLBackend
 
 
 class Backend(IBackend):
     name = 'Easy-RSA 2.X'
     description = "OpenVPN's simple shell-based CA utility: https://github.com/OpenVPN/easy-rsa"
-    threadsafe = False
+    # pkitool and revoke-full run under the lock of the OpenSSL backend
+    threadsafe = True
 
     init_requires = (
         Param('root_dir', help=f'Where the files of {name} are stored '
@@ -71,6 +72,9 @@ class Backend(IBackend):
     def get_ca_cert(self) -> Cert:
         return self._openssl_backend.get_ca_cert()
 
+    def get_ca_key(self) -> PrivateKey:
+        return self._openssl_backend.get_ca_key()
+
     def get_csr_policy(self):
         return self._openssl_backend.get_csr_policy()
 
@@ -78,25 +82,46 @@ class Backend(IBackend):
         return self._openssl_backend.get_csr_defaults()
 
     def issue_cert(self, csr: CsrBuilder) -> (PrivateKey, Cert):
-        self._run('pkitool', '--batch', csr.common_name)
-        key_path = self._key_dir / f'{csr.common_name}.key'
-        cert_path = self._key_dir / f'{csr.common_name}.crt'
-        return PrivateKey.from_file(key_path), Cert.from_file(cert_path)
+        # the key and cert files are named by the common name, so they are read under the lock
+        with self._openssl_backend.lock:
+            self._run('pkitool', '--batch', csr.common_name)
+            key_path = self._key_dir / f'{csr.common_name}.key'
+            cert_path = self._key_dir / f'{csr.common_name}.crt'
+            cert = Cert.from_file(cert_path)
+            key = PrivateKey.from_file(key_path)
+            self._openssl_backend._add_to_store(cert)
+        return key, cert
 
     def revoke_cert(self, serial: str) -> RevokedCert:
-        entry = self._openssl_backend._db.get_by_serial(serial)
-        # TODO: check for CalledProcessError and raise RevocationError()
-        self._run('revoke-full', entry.name.common_name)
-        for rc in Crl.from_file(self._key_dir / 'crl.pem'):
+        with self._openssl_backend.lock:
+            entry = self._openssl_backend._db.get_by_serial(serial)
+            # TODO: check for CalledProcessError and raise RevocationError()
+            self._run('revoke-full', entry.name.common_name)
+            crl = Crl.from_file(self._key_dir / 'crl.pem')
+        for rc in crl:
             if rc.serial_number == SerialNumber(serial):
                 return rc
 
-    def list_certs(self) -> Iterator[Cert]:
-        yield from self._openssl_backend.list_certs()
+    def list_certs(self, query: Optional[CertQuery]=None) -> Iterator[Cert]:
+        yield from self._openssl_backend.list_certs(query)
 
     def get_cert(self, serial: str) -> Cert:
         return self._openssl_backend.get_cert(serial)
 
+    def export_certs(self) -> Iterator[CertRecord]:
+        yield from self._openssl_backend.export_certs(self._find_key)
+
+    def _find_key(self, cert: Cert) -> Optional[PrivateKey]:
+        # the key files are named by the common name, they are overwritten by reissuing
+        key_path = self._key_dir / f'{cert.subject.common_name}.key'
+        if not key_path.exists():
+            return None
+        key = PrivateKey.from_file(key_path)
+        return key if key.matches(cert) else None
+
+    def pack_certs(self) -> int:
+        return self._openssl_backend.pack_certs()
+
     @property
     def version(self) -> str:
         pkitool_version = self._run('pkitool', '--version').rstrip()
@@ -1,6 +1,138 @@
-from typing import Iterator
+import re
+import datetime
+import itertools
+from typing import Callable, Iterable, Iterator, Optional, Set
 from abc import ABCMeta, abstractmethod
-from ..wrapper import PrivateKey, Cert, RevokedCert, Crl
+import attr
+from ..wrapper import PrivateKey, Cert, RevokedCert, Crl, SerialNumber
+
+
+STATUSES = ('valid', 'revoked', 'expired')
+SORT_KEYS = ('serial', 'expiry')
+
+
+@attr.s(slots=True)
+class CertRecord:
+    """Everything a backend knows about an issued certificate, for moving it to another one."""
+    cert = attr.ib()
+    private_key = attr.ib(default=None)
+    # timezone aware, None if the certificate is not revoked
+    revoked_at = attr.ib(default=None)
+    # name from asn1crypto.crl.CRLReason, e.g. key_compromise
+    reason = attr.ib(default=None)
+    # (serial number, common name, not valid before, not valid after), if the source has them
+    # without parsing the certificate, parsing is the slowest part of moving certificates
+    fields = attr.ib(default=None)
+
+    @property
+    def serial_number(self) -> SerialNumber:
+        return self.fields[0] if self.fields is not None else self.cert.serial_number
+
+
+@attr.s(slots=True, frozen=True)
+class CertQuery:
+    """Which certificates list_certs gives and in which order. Backends do as much of it in
+    their own store as they can, and leave the rest to apply().
+
+    The common name is matched case-insensitively, * and ? are wildcards. Time ranges are
+    inclusive and timezone aware. The cursor is the sort key of the last certificate of the
+    previous page, see next_page(), the sort key is (not valid after, serial number) for
+    expiry and (serial number,) otherwise.
+    """
+    # one of STATUSES, valid and expired are not revoked
+    status = attr.ib(default=None)
+    common_name = attr.ib(default=None)
+    issued_after = attr.ib(default=None)
+    issued_before = attr.ib(default=None)
+    expires_after = attr.ib(default=None)
+    expires_before = attr.ib(default=None)
+    # one of SORT_KEYS, None is the order of the backend
+    sort = attr.ib(default=None)
+    limit = attr.ib(default=None)
+    offset = attr.ib(default=0)
+    after = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.status is not None and self.status not in STATUSES:
+            raise ValueError(f'Unknown status: {self.status}')
+        if self.sort is not None and self.sort not in SORT_KEYS:
+            raise ValueError(f'Unknown sort key: {self.sort}')
+        if self.after is not None and self.sort is None:
+            raise ValueError('A cursor needs a sort key.')
+
+    @property
+    def filtered(self) -> bool:
+        return any(value is not None for value in (
+            self.status, self.common_name, self.issued_after, self.issued_before,
+            self.expires_after, self.expires_before))
+
+    def key(self, serial_number: SerialNumber, not_after: datetime.datetime) -> tuple:
+        return (not_after, serial_number) if self.sort == 'expiry' else (serial_number,)
+
+    def cert_key(self, cert: Cert) -> tuple:
+        if self.sort == 'expiry':
+            return cert.not_valid_after, cert.serial_number
+        return (cert.serial_number,)
+
+    def next_page(self, last_cert: Cert) -> 'CertQuery':
+        return attr.evolve(self, after=self.cert_key(last_cert), offset=0)
+
+    def status_matches(self, revoked: bool, not_after: datetime.datetime, now=None) -> bool:
+        if self.status is None:
+            return True
+        if self.status == 'revoked' or revoked:
+            return self.status == 'revoked' and revoked
+        expired = not_after < (now or datetime.datetime.now(datetime.timezone.utc))
+        return expired == (self.status == 'expired')
+
+    def common_name_matches(self, common_name: Optional[str]) -> bool:
+        if self.common_name is None:
+            return True
+        return common_name is not None and \
+            self._common_name_regex.fullmatch(common_name) is not None
+
+    @property
+    def _common_name_regex(self):
+        # re caches the compiled patterns
+        pattern = ''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c)
+                          for c in self.common_name)
+        return re.compile(pattern, re.IGNORECASE | re.DOTALL)
+
+    def expiry_matches(self, not_after: datetime.datetime) -> bool:
+        return _in_range(not_after, self.expires_after, self.expires_before)
+
+    def issued_matches(self, not_before: datetime.datetime) -> bool:
+        return _in_range(not_before, self.issued_after, self.issued_before)
+
+    def page(self, items: Iterable) -> Iterator:
+        """The offset and the limit of already filtered and sorted items."""
+        stop = self.offset + self.limit if self.limit is not None else None
+        return itertools.islice(items, self.offset, stop)
+
+    def apply(self, certs: Iterable[Cert],
+              revoked_serials: Optional[Callable[[], Set[SerialNumber]]]=None) -> Iterator[Cert]:
+        """Everything in Python, for what a backend can't do natively.
+        revoked_serials is only called when filtering by status.
+        """
+        if self.filtered:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            revoked = revoked_serials() if self.status is not None else ()
+            certs = (c for c in certs if self.cert_matches(c, c.serial_number in revoked, now))
+        if self.sort is not None:
+            certs = sorted(certs, key=self.cert_key)
+        if self.after is not None:
+            certs = (c for c in certs if self.cert_key(c) > self.after)
+        return self.page(certs)
+
+    def cert_matches(self, cert: Cert, revoked: bool, now=None) -> bool:
+        return (self.status_matches(revoked, cert.not_valid_after, now) and
+                self.expiry_matches(cert.not_valid_after) and
+                self.issued_matches(cert.not_valid_before) and
+                self.common_name_matches(cert.subject.common_name))
+
+
+def _in_range(value, start, end) -> bool:
+    return (start is None or start <= value) and (end is None or value <= end)
 
 
 class IBackend(metaclass=ABCMeta):
@@ -48,8 +180,8 @@ class IBackend(metaclass=ABCMeta):
     def revoke_cert(self, serial: str) -> RevokedCert:
         """Revoke certificate by serial number."""
 
-    def list_certs(self) -> Iterator[Cert]:
-        """Get the list of all the issued certificates."""
+    def list_certs(self, query: Optional[CertQuery]=None) -> Iterator[Cert]:
+        """Get the issued certificates, all of them without a query."""
 
     def get_cert(self, serial: str) -> Cert:
         """Get certificate."""
@@ -1,8 +1,11 @@
 import os
 import re
 import mmap
+import time
 import shutil
-from typing import Optional, Mapping
+import datetime
+import threading
+from typing import Callable, Optional, Mapping
 from configparser import (MissingSectionHeaderError, Interpolation, InterpolationSyntaxError,
                           InterpolationMissingOptionError, ConfigParser)
 from pathlib import Path
@@ -12,14 +15,32 @@ import attr
 from ..wrapper import Cert, PrivateKey, Crl, SerialNumber, FromFileMixin, Name
 from ..config import Param
 from ..exceptions import BackendError
+from ..lock import FileLock
 from ..csr import CsrPolicy, CsrBuilder
-from .interfaces import IBackend
+from ..store import PackedCertStore
+from .interfaces import CertQuery, CertRecord, IBackend
+
+
+# seconds to wait for other processes issuing or revoking certificates
+LOCK_TIMEOUT = 60
+# revocation reasons in index.txt -> names in asn1crypto.crl.CRLReason
+_REVOCATION_REASONS = {
+    'unspecified': 'unspecified',
+    'keyCompromise': 'key_compromise',
+    'CACompromise': 'ca_compromise',
+    'affiliationChanged': 'affiliation_changed',
+    'superseded': 'superseded',
+    'cessationOfOperation': 'cessation_of_operation',
+    'certificateHold': 'certificate_hold',
+    'removeFromCRL': 'remove_from_crl',
+}
 
 
 class Backend(IBackend):
     name = 'OpenSSL'
     description = 'Command line tools with openssl.cnf, https://www.openssl.org'
-    threadsafe = False
+    # changes to the database are made under a file lock, see the lock property
+    threadsafe = True
 
     init_requires = (
         Param('openssl_binary', help='Path to the openssl binary', convert=Path),
@@ -70,6 +91,15 @@ class Backend(IBackend):
         if not db_path.exists():
             raise BackendError(f'OpenSSL database file ({db_path}) is missing.')
         self._db = OpenSSLDbParser(db_path)
+        self._lock = FileLock(db_path.with_name(db_path.name + '.lock'), timeout=LOCK_TIMEOUT)
+        self._store = PackedCertStore(self._new_certs_dir / 'certs.pack')
+
+    @property
+    def lock(self) -> FileLock:
+        """Held while the database, the serial file or the packed store is changed.
+        Processes running openssl ca on the same CA have to take it too (index.txt.lock).
+        """
+        return self._lock
 
     @staticmethod
     def _check_file(openssl_binary):
@@ -112,6 +142,9 @@ class Backend(IBackend):
         ca_cert_path = self._root_dir / self._ca_section['certificate']
         return Cert.from_file(ca_cert_path)
 
+    def get_ca_key(self) -> PrivateKey:
+        return PrivateKey.from_file(self._root_dir / self._ca_section['private_key'])
+
     def _adapt_policy(self, policy):
         policy = policy.lower()
         if policy == 'supplied':
@@ -149,8 +182,12 @@ class Backend(IBackend):
         # openssl req -newkey rsa -nodes -subj "/C=HU/ST=Pest megye/L=Budapest/O=Company/CN=Domain"
         key_and_csr_pem = self._openssl('req', '-newkey', 'rsa', '-nodes', '-subj', csr.subject)
         key_pem, csr_pem = self._split_pem(key_and_csr_pem)
-        cert_pem = self._openssl('ca', '-batch', '-notext', '-in', '/dev/stdin', input=csr_pem)
-        cert = Cert(cert_pem)
+        # only signing changes the database, key generation can run in parallel
+        with self._lock:
+            cert_pem = self._openssl('ca', '-batch', '-notext', '-in', '/dev/stdin',
+                                     input=csr_pem)
+            cert = Cert(cert_pem)
+            self._add_to_store(cert)
         serial_hex = cert.serial_number.as_hex()
         self._save_pem(cert_pem, serial_hex + '.pem')
         self._save_pem(key_pem, serial_hex + '.key')
@@ -169,14 +206,78 @@ class Backend(IBackend):
         path.write_text(pem_data)
 
     def get_cert(self, serial: str) -> Cert:
-        serial_hex = SerialNumber(serial).as_hex()
-        cert_path = self._new_certs_dir / f'{serial_hex}.pem'
-        return Cert.from_file(cert_path)
-
-    def list_certs(self) -> Iterator[Cert]:
+        return self._get_cert(SerialNumber(serial))
+
+    def _get_cert(self, serial_number: SerialNumber) -> Cert:
+        # certificates issued with the openssl command since packing are only in PEM files
+        if self._store.exists():
+            cert = self._store.get(serial_number)
+            if cert is not None:
+                return cert
+        return Cert.from_file(self._new_cert_path(serial_number))
+
+    def _new_cert_path(self, serial_number: SerialNumber) -> Path:
+        # openssl ca names the files by the serial in upper case hex
+        return self._new_certs_dir / f'{serial_number.as_hex().upper()}.pem'
+
+    def list_certs(self, query: Optional[CertQuery]=None) -> Iterator[Cert]:
+        """The status, the common name, the expiry and the order are decided with the columns
+        of the database, only the certificates listed are read.
+        """
+        entries = iter(self._db)
+        if query is None:
+            yield from (self._get_cert(entry.serial_number) for entry in entries)
+            return
+        if query.filtered:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            entries = (e for e in entries
+                       if query.status_matches(e.status == 'R', e.expires_at, now) and
+                       query.expiry_matches(e.expires_at) and
+                       query.common_name_matches(e.name.common_name))
+        if query.sort is not None:
+            entries = sorted(entries, key=lambda e: query.key(e.serial_number, e.expires_at))
+        if query.after is not None:
+            entries = (e for e in entries
+                       if query.key(e.serial_number, e.expires_at) > query.after)
+        if query.issued_after is None and query.issued_before is None:
+            yield from (self._get_cert(e.serial_number) for e in query.page(entries))
+            return
+        # the issuing date is not in the database
+        certs = (self._get_cert(e.serial_number) for e in entries)
+        yield from query.page(c for c in certs if query.issued_matches(c.not_valid_before))
+
+    def export_certs(self, find_key: Optional[Callable[[Cert], Optional[PrivateKey]]]=None
+                     ) -> Iterator[CertRecord]:
+        """Certificates with the revocation state from the database, and with their keys if
+        they were issued by this backend.
+        """
+        find_key = find_key or self._find_key
         for entry in self._db:
-            filename = entry.serial_number.as_hex() + '.pem'
-            yield Cert.from_file(self._new_certs_dir / filename)
+            cert = self._get_cert(entry.serial_number)
+            revoked_at, reason = entry.revocation_info
+            yield CertRecord(cert, find_key(cert), revoked_at, reason)
+
+    def _find_key(self, cert: Cert) -> Optional[PrivateKey]:
+        key_path = self._certs_dir / f'{cert.serial_number.as_hex()}.key'
+        return PrivateKey.from_file(key_path) if key_path.exists() else None
+
+    def pack_certs(self) -> int:
+        """Build the packed certificate store from the PEM files in new_certs_dir."""
+        with self._lock:
+            # only the positions are kept while writing, not the certificates
+            certs = (Cert.from_file(self._new_cert_path(entry.serial_number))
+                     for entry in self._db)
+            store = PackedCertStore.create(self._store.path, certs)
+        return len(store)
+
+    def add_to_store(self, cert: Cert):
+        """Keep the packed store in sync, if there is one."""
+        with self._lock:
+            self._add_to_store(cert)
+
+    def _add_to_store(self, cert):
+        if self._store.exists():
+            self._store.add(cert)
 
     def get_crl(self):
         return Crl.from_file(self._crl_file)
@@ -238,6 +339,24 @@ class OpenSSLDbEntry:
     filename = attr.ib()
     name = attr.ib(convert=Name)
 
+    @property
+    def revocation_info(self):
+        """(revocation date, reason) of revoked certificates, (None, None) otherwise."""
+        if self.status != 'R' or not self.revocation:
+            return None, None
+        date, _, reason = self.revocation.partition(',')
+        return _parse_db_time(date), _REVOCATION_REASONS.get(reason)
+
+    @property
+    def expires_at(self) -> datetime.datetime:
+        return _parse_db_time(self.expiration)
+
+
+def _parse_db_time(date: str) -> datetime.datetime:
+    # YYMMDDHHMMSSZ, or YYYYMMDDHHMMSSZ from 2050
+    date_format = '%y%m%d%H%M%SZ' if len(date) == 13 else '%Y%m%d%H%M%SZ'
+    return datetime.datetime.strptime(date, date_format).replace(tzinfo=datetime.timezone.utc)
+
 
 class OpenSSLDbParser:
     """Parses OpenSSL's index.txt certificate database.
@@ -250,35 +369,60 @@ class OpenSSLDbParser:
     6. Distinguished name.
     from: http://pki-tutorial.readthedocs.io/en/latest/cadb.html
     """
+    REPLACE_RETRIES = 100
 
     def __init__(self, db_file: Path):
         self._file = db_file
-        if not self._is_db_empty():
-            # have to keep the reference to the opened file
-            self._open_file = db_file.open('r+b')
-            self._mm = mmap.mmap(self._open_file.fileno(), 0)
-        else:
-            self._open_file = None
-            self._mm = None
-
-    def _is_db_empty(self):
-        return self._file.stat().st_size == 0
+        self._mm = None
+        self._file_id = None
+        self._map_lock = threading.Lock()
+
+    def _snapshot(self) -> Optional[mmap.mmap]:
+        """Map the file again if it changed, e.g. openssl ca added a certificate since.
+        openssl writes index.txt.new and renames it over index.txt, so a mapping is a
+        consistent snapshot, which readers can keep using while the file is replaced.
+        """
+        for _ in range(self.REPLACE_RETRIES):
+            try:
+                with self._file.open('rb') as f, self._map_lock:
+                    stat = os.fstat(f.fileno())
+                    file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                    if file_id != self._file_id:
+                        self._mm = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                                    if stat.st_size else None)
+                        self._file_id = file_id
+                    return self._mm
+            except FileNotFoundError:
+                # between moving index.txt to index.txt.old and index.txt.new to index.txt
+                time.sleep(0.01)
+        raise BackendError(f'OpenSSL database file ({self._file}) is missing.')
 
     def __iter__(self):
-        # it can have content since we last tried
-        if self._is_db_empty():
+        mm = self._snapshot()
+        if mm is None:
             return iter(())
-        self._mm.seek(0)
-        return self._iter_file()
-
-    def __del__(self):
-        if self._open_file is not None:
-            self._open_file.close()
-            self._mm.close()
-
-    def _iter_file(self):
-        for line in iter(self._mm.readline, b''):
-            columns = line.rstrip().decode().split('\t')
+        return self._iter_lines(mm)
+
+    def _iter_lines(self, mm):
+        # positions instead of readline, the mapping can be shared between threads
+        start = 0
+        while True:
+            end = mm.find(b'\n', start)
+            if end == -1:
+                break
+            line = mm[start:end].rstrip()
+            start = end + 1
+            if not line:
+                continue
+            columns = line.decode().split('\t')
+            if len(columns) != 6:
+                raise BackendError(f'Corrupt line in OpenSSL database file ({self._file}): '
+                                   + '\t'.join(columns))
+            yield OpenSSLDbEntry(*columns)
+        # the last line without a newline: complete in files edited by hand, but it could be
+        # a line still being written by a tool updating the file in place, skipped if partial
+        columns = mm[start:].rstrip().decode(errors='replace').split('\t')
+        if len(columns) == 6:
             yield OpenSSLDbEntry(*columns)
 
     def get_by_serial(self, serial: str):
@@ -1,7 +1,95 @@
-from .interfaces import IBackend
+import io
+import csv
+import uuid
+from typing import Iterator, List
+from ..config import Param
+from ..exceptions import BackendError
+from .sql import CERT_COLUMNS, CERTS_TABLE, ConnectionPool, SqlBackend
 
 
-class Backend(IBackend):
+# optional dependency, all backends are imported when choosing one at setup
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class Backend(SqlBackend):
     name = 'PostgreSQL'
     description = 'Storing certificates in a PostgreSQL database'
     threadsafe = True
+
+    init_requires = (
+        Param('dsn', help='Connection string, e.g. postgresql://certmaestro@localhost/certmaestro'),
+        Param('pool_size', default=8, convert=int, help='Maximum number of connections'),
+    )
+
+    blob_type = 'BYTEA'
+    timestamp_type = 'TIMESTAMPTZ'
+    # LIKE is case-sensitive in PostgreSQL
+    like_operator = 'ILIKE'
+    # rows fetched at once by the server-side cursor of list_certs
+    itersize = 2000
+
+    def __init__(self, dsn: str, pool_size: int):
+        super().__init__()
+        if psycopg2 is None:
+            raise BackendError('The PostgreSQL backend needs psycopg2, '
+                               'install it with: pip install certmaestro[postgres]')
+        # psycopg2's own pools raise PoolError instead of waiting when all connections are used
+        self._pool = ConnectionPool(lambda: psycopg2.connect(dsn), pool_size, ping=self._ping)
+        # fail early with wrong credentials
+        try:
+            with self._connection():
+                pass
+        except psycopg2.Error as e:
+            raise BackendError(f'Could not connect to PostgreSQL: {e}'.strip())
+
+    def close(self):
+        self._pool.close()
+
+    def _connection(self):
+        return self._pool.connection()
+
+    @staticmethod
+    def _ping(connection):
+        # set by psycopg2 when it noticed that the server closed the connection
+        if connection.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+
+    def _iter_rows(self, query, params=()) -> Iterator[tuple]:
+        # a named cursor is a server-side cursor, only itersize rows are in memory at once
+        with self._connection() as connection:
+            with connection.cursor(name=f'certmaestro_{uuid.uuid4().hex}') as cursor:
+                cursor.itersize = self.itersize
+                cursor.execute(query, params)
+                yield from cursor
+
+    def _insert_rows(self, connection, rows: List[tuple]):
+        """Bulk insert with COPY, much faster than INSERT statements for big batches."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(self._copy_value(value) for value in row)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {CERTS_TABLE} ({", ".join(CERT_COLUMNS)}) '
+                               f"FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+    @staticmethod
+    def _copy_value(value):
+        if value is None:
+            # the csv module writes None and empty strings the same way, as an empty field,
+            # which would be NULL with the default NULL string of the CSV format
+            return '\\N'
+        elif isinstance(value, bytes):
+            return '\\x' + value.hex()
+        elif hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    @property
+    def version(self) -> str:
+        with self._connection() as connection:
+            server_version = self._execute(connection, 'SHOW server_version').fetchone()[0]
+        return f'{self.name} {server_version} (psycopg2 {psycopg2.__version__.split()[0]})'
@@ -0,0 +1,437 @@
+"""
+    Common part of the backends storing certificates in an SQL database and signing them in the
+    process with certmaestro.signer. The subclasses provide pooled DB-API connections, the
+    column types and the fast paths of their database for streaming and bulk inserts.
+
+    Certificates are stored as DER with the columns needed for finding them indexed, their
+    private keys as PEM in the same row. The CA certificate, its key and the issuing settings
+    are in a separate, single-row table.
+"""
+import queue
+import datetime
+import itertools
+import threading
+import contextlib
+from abc import abstractmethod
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+from ..config import Param
+from ..csr import CsrBuilder, CsrPolicy, SUBJECT_FIELDS
+from ..exceptions import BackendError
+from ..signer import KEY_TYPES, Signer, revoked_entry
+from ..wrapper import Cert, Crl, PrivateKey, RevokedCert, SerialNumber
+from .interfaces import CertQuery, CertRecord, IBackend
+
+
+CA_TABLE = 'certmaestro_ca'
+CERTS_TABLE = 'certmaestro_certs'
+CERT_COLUMNS = ('serial', 'common_name', 'not_before', 'not_after', 'status', 'revoked_at',
+                'reason', 'der', 'private_key')
+VALID, REVOKED = 'V', 'R'
+BATCH_SIZE = 1000
+# no LIMIT, but an OFFSET needs one in some databases
+MAX_LIMIT = 2 ** 63 - 1
+
+
+def serial_hex(serial: SerialNumber) -> str:
+    """Fixed width, so the text order of the column is the numeric order."""
+    return format(int(serial), '040x')
+
+
+def _like_pattern(pattern: str) -> str:
+    """LIKE pattern with ! as the escape character, from a pattern with * and ? wildcards."""
+    pattern = pattern.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    return pattern.replace('*', '%').replace('?', '_')
+
+
+class ConnectionPool:
+    """Thread-safe pool for DB-API drivers which don't have one. Connections are made when
+    needed, up to max_size, and closed instead of reused after an error.
+    """
+
+    def __init__(self, connect: Callable, max_size: int, ping: Optional[Callable]=None):
+        self._connect = connect
+        self._ping = ping
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Committed at the end of the block, rolled back on errors."""
+        with self._slots:
+            connection = self._get()
+            try:
+                yield connection
+                connection.commit()
+            except BaseException:
+                with contextlib.suppress(Exception):
+                    connection.rollback()
+                    connection.close()
+                raise
+            self._idle.put(connection)
+
+    def _get(self):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        if self._ping is not None:
+            try:
+                self._ping(connection)
+            except Exception:
+                # e.g. the server closed it after being idle for too long
+                with contextlib.suppress(Exception):
+                    connection.close()
+                return self._connect()
+        return connection
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SqlBackend(IBackend):
+    threadsafe = True
+
+    setup_requires = (
+        Param('common_name', help='Common Name of the CA certificate'),
+        Param('ca_days', default=3650, convert=int, help='Validity of the CA certificate (days)'),
+        Param('cert_days', default=365, convert=int,
+              help='Validity of issued certificates (days)'),
+        Param('key_type', default='rsa', help=f'Type of keys ({", ".join(KEY_TYPES)})'),
+        Param('crl_days', default=7, convert=int, help='Validity of CRLs (days)'),
+    )
+
+    # the driver's placeholder, the queries are written with %s
+    placeholder = '%s'
+    # column types differing between databases
+    blob_type = 'BYTEA'
+    timestamp_type = 'TIMESTAMP'
+    # most values in one IN (...) list
+    in_list_size = BATCH_SIZE
+    # case-insensitive LIKE
+    like_operator = 'LIKE'
+
+    def __init__(self):
+        self._signer = None
+        self._settings = None
+        self._signer_lock = threading.Lock()
+
+    def _cert_row(self, cert: Cert, key: Optional[PrivateKey]=None,
+                  revoked_at: Optional[datetime.datetime]=None, reason: Optional[str]=None,
+                  fields: Optional[tuple]=None):
+        serial, common_name, not_before, not_after = fields or (
+            cert.serial_number, cert.subject.common_name, cert.not_valid_before,
+            cert.not_valid_after)
+        return (serial_hex(serial), common_name, self._db_time(not_before),
+                self._db_time(not_after), VALID if revoked_at is None else REVOKED,
+                self._db_time(revoked_at) if revoked_at is not None else None, reason,
+                cert.der, str(key) if key is not None else None)
+
+    def _db_time(self, value: datetime.datetime):
+        """Timestamp as the driver stores it, timezone aware by default."""
+        return value
+
+    @abstractmethod
+    def _connection(self):
+        """Context manager of a pooled connection, committed at the end of the block,
+        rolled back on errors.
+        """
+
+    def _sql(self, query: str) -> str:
+        if self.placeholder != '%s':
+            query = query.replace('%s', self.placeholder)
+        return query
+
+    def _execute(self, connection, query, params=()):
+        cursor = connection.cursor()
+        cursor.execute(self._sql(query), params)
+        return cursor
+
+    def _schema(self) -> List[str]:
+        return [
+            f'''CREATE TABLE IF NOT EXISTS {CA_TABLE} (
+                id INTEGER PRIMARY KEY,
+                der {self.blob_type} NOT NULL,
+                private_key TEXT NOT NULL,
+                cert_days INTEGER NOT NULL,
+                key_type VARCHAR(16) NOT NULL,
+                crl_days INTEGER NOT NULL
+            )''',
+            f'''CREATE TABLE IF NOT EXISTS {CERTS_TABLE} (
+                serial CHAR(40) PRIMARY KEY,
+                common_name VARCHAR(255),
+                not_before {self.timestamp_type} NOT NULL,
+                not_after {self.timestamp_type} NOT NULL,
+                status CHAR(1) NOT NULL,
+                revoked_at {self.timestamp_type} NULL,
+                reason VARCHAR(32) NULL,
+                der {self.blob_type} NOT NULL,
+                private_key TEXT NULL
+            )''',
+            f'CREATE INDEX IF NOT EXISTS {CERTS_TABLE}_common_name '
+            f'ON {CERTS_TABLE} (common_name)',
+            f'CREATE INDEX IF NOT EXISTS {CERTS_TABLE}_not_after ON {CERTS_TABLE} (not_after)',
+            f'CREATE INDEX IF NOT EXISTS {CERTS_TABLE}_status '
+            f'ON {CERTS_TABLE} (status, revoked_at)',
+        ]
+
+    def validate_setup(self, **setup_params):
+        if setup_params.get('key_type', 'rsa') not in KEY_TYPES:
+            raise ValueError(f'Unknown key type: {setup_params["key_type"]}')
+        try:
+            self._load()
+        except BackendError:
+            return
+        raise ValueError('The database already has a CA.')
+
+    def setup(self, *, common_name: str, ca_days: int, cert_days: int, key_type: str,
+              crl_days: int):
+        signer, ca_key = Signer.create_ca({'common_name': common_name}, ca_days, key_type)
+        self.import_ca(signer.ca_cert, ca_key, cert_days=cert_days, key_type=key_type,
+                       crl_days=crl_days)
+
+    def import_ca(self, ca_cert: Cert, ca_key: PrivateKey, *, cert_days: int, key_type: str,
+                  crl_days: int):
+        """Set up with an existing CA, replacing the current one, e.g. when migrating from
+        another backend.
+        """
+        with self._connection() as connection:
+            for statement in self._schema():
+                self._execute(connection, statement)
+            self._execute(connection, f'DELETE FROM {CA_TABLE}')
+            self._execute(connection, f'INSERT INTO {CA_TABLE} VALUES (1, %s, %s, %s, %s, %s)',
+                          (ca_cert.der, str(ca_key), cert_days, key_type, crl_days))
+        with self._signer_lock:
+            self._signer = self._settings = None
+
+    def _load(self):
+        with self._connection() as connection:
+            try:
+                row = self._execute(connection, f'SELECT der, private_key, cert_days, key_type, '
+                                                f'crl_days FROM {CA_TABLE}').fetchone()
+            except Exception as e:
+                raise BackendError(f'The database is not set up: {e}')
+        if row is None:
+            raise BackendError('The database has no CA, run config setup first.')
+        der, private_key, cert_days, key_type, crl_days = row
+        signer = Signer(Cert.from_der(bytes(der)), PrivateKey(private_key))
+        return signer, {'cert_days': cert_days, 'key_type': key_type, 'crl_days': crl_days}
+
+    def _loaded(self) -> Tuple[Signer, dict]:
+        """The signer with the CA key and the issuing settings, read from the database once."""
+        if self._signer is None:
+            with self._signer_lock:
+                if self._signer is None:
+                    self._signer, self._settings = self._load()
+        return self._signer, self._settings
+
+    @property
+    def signer(self) -> Signer:
+        return self._loaded()[0]
+
+    @property
+    def settings(self) -> dict:
+        return self._loaded()[1]
+
+    def get_ca_cert(self) -> Cert:
+        return self.signer.ca_cert
+
+    def get_ca_key(self) -> PrivateKey:
+        with self._connection() as connection:
+            row = self._execute(connection, f'SELECT private_key FROM {CA_TABLE}').fetchone()
+        return PrivateKey(row[0])
+
+    def get_csr_policy(self):
+        policy = dict.fromkeys((field for field, _ in SUBJECT_FIELDS), CsrPolicy.OPTIONAL)
+        policy['common_name'] = CsrPolicy.REQUIRED
+        return policy
+
+    def get_csr_defaults(self):
+        return dict.fromkeys(field for field, _ in SUBJECT_FIELDS)
+
+    def issue_cert(self, csr: CsrBuilder) -> Tuple[PrivateKey, Cert]:
+        return self.issue_certs([csr])[0]
+
+    def issue_certs(self, csrs: Iterable[CsrBuilder]) -> List[Tuple[PrivateKey, Cert]]:
+        """Sign all of them first, then store them in one transaction."""
+        signer, settings = self._loaded()
+        issued = [signer.issue(csr, settings['cert_days'], settings['key_type']) for csr in csrs]
+        with self._connection() as connection:
+            self._insert_rows(connection, [self._cert_row(cert, key) for key, cert in issued])
+        return issued
+
+    def import_certs(self, certs: Iterable[Cert], batch_size=BATCH_SIZE) -> int:
+        """Store certificates issued elsewhere (without keys), in batches. Returns the count."""
+        return self.import_records((CertRecord(cert) for cert in certs), batch_size)
+
+    def import_records(self, records: Iterable[CertRecord], batch_size=BATCH_SIZE) -> int:
+        """Store certificates with their keys and revocation state, one transaction per batch.
+        Returns the count.
+        """
+        count = 0
+        records = iter(records)
+        while True:
+            rows = [self._cert_row(r.cert, r.private_key, r.revoked_at, r.reason, r.fields)
+                    for r in itertools.islice(records, batch_size)]
+            if not rows:
+                return count
+            with self._connection() as connection:
+                self._insert_rows(connection, rows)
+            count += len(rows)
+
+    def _insert_rows(self, connection, rows: List[tuple]):
+        placeholders = ', '.join(['%s'] * len(CERT_COLUMNS))
+        connection.cursor().executemany(
+            self._sql(f'INSERT INTO {CERTS_TABLE} ({", ".join(CERT_COLUMNS)}) '
+                      f'VALUES ({placeholders})'), rows)
+
+    def revoke_cert(self, serial: str, reason: Optional[str]=None) -> RevokedCert:
+        serial_number = SerialNumber(serial)
+        revoked_at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        with self._connection() as connection:
+            cursor = self._execute(
+                connection, f'UPDATE {CERTS_TABLE} SET status = %s, revoked_at = %s, reason = %s '
+                            f'WHERE serial = %s AND status = %s',
+                (REVOKED, self._db_time(revoked_at), reason, serial_hex(serial_number), VALID))
+            if cursor.rowcount != 1:
+                raise BackendError(f'No valid certificate with serial number: {serial}')
+        return RevokedCert.from_asn1(revoked_entry(serial_number, revoked_at, reason))
+
+    def revoke_certs(self, serials: Iterable[str], reason: Optional[str]=None,
+                     batch_size=BATCH_SIZE) -> int:
+        """Revoke many certificates in one transaction, with one UPDATE per batch.
+        Returns the number of revoked certificates, the already revoked ones don't count.
+        """
+        revoked_at = self._db_time(
+            datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0))
+        serials = (serial_hex(SerialNumber(serial)) for serial in serials)
+        batch_size = min(batch_size, self.in_list_size)
+        count = 0
+        with self._connection() as connection:
+            while True:
+                batch = list(itertools.islice(serials, batch_size))
+                if not batch:
+                    return count
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor = self._execute(
+                    connection, f'UPDATE {CERTS_TABLE} SET status = %s, revoked_at = %s, '
+                                f'reason = %s WHERE serial IN ({placeholders}) AND status = %s',
+                    (REVOKED, revoked_at, reason, *batch, VALID))
+                count += cursor.rowcount
+
+    def _iter_rows(self, query: str, params=()) -> Iterator[tuple]:
+        """All rows of the query without loading them into memory at once."""
+        with self._connection() as connection:
+            cursor = self._execute(connection, query, params)
+            while True:
+                rows = cursor.fetchmany(BATCH_SIZE)
+                if not rows:
+                    return
+                yield from rows
+
+    def _iter_cert_rows(self, columns: str) -> Iterator[tuple]:
+        """The columns of every certificate, ordered by serial number."""
+        return self._iter_rows(f'SELECT {columns} FROM {CERTS_TABLE} ORDER BY serial')
+
+    def list_certs(self, query: Optional[CertQuery]=None) -> Iterator[Cert]:
+        """Everything in the query is done by the database, with the indexes on not_after and
+        status. Ordered by serial number by default.
+        """
+        if query is None:
+            rows = self._iter_cert_rows('der')
+        else:
+            rows = self._iter_query_rows('der', query)
+        for der, in rows:
+            yield Cert.from_der(bytes(der))
+
+    def _iter_query_rows(self, columns: str, query: CertQuery) -> Iterator[tuple]:
+        return self._iter_rows(*self._select_certs(columns, query))
+
+    def _select_certs(self, columns: str, query: CertQuery) -> Tuple[str, list]:
+        conditions, params = [], []
+
+        def add(condition, *values):
+            conditions.append(condition)
+            params.extend(values)
+
+        if query.status == 'revoked':
+            add('status = %s', REVOKED)
+        elif query.status is not None:
+            now = self._db_time(datetime.datetime.now(datetime.timezone.utc))
+            add('status = %s', VALID)
+            add('not_after >= %s' if query.status == 'valid' else 'not_after < %s', now)
+        if query.common_name is not None:
+            add(f"common_name {self.like_operator} %s ESCAPE '!'", _like_pattern(query.common_name))
+        for column, operator, value in (('not_before', '>=', query.issued_after),
+                                        ('not_before', '<=', query.issued_before),
+                                        ('not_after', '>=', query.expires_after),
+                                        ('not_after', '<=', query.expires_before)):
+            if value is not None:
+                add(f'{column} {operator} %s', self._db_time(value))
+        if query.sort == 'expiry':
+            order = 'not_after, serial'
+            if query.after is not None:
+                not_after, serial = self._db_time(query.after[0]), serial_hex(query.after[1])
+                add('(not_after > %s OR not_after = %s AND serial > %s)',
+                    not_after, not_after, serial)
+        else:
+            order = 'serial'
+            if query.after is not None:
+                add('serial > %s', serial_hex(query.after[0]))
+        sql = f'SELECT {columns} FROM {CERTS_TABLE}'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {order}'
+        if query.limit is not None or query.offset:
+            sql += ' LIMIT %s OFFSET %s'
+            params += [query.limit if query.limit is not None else MAX_LIMIT, query.offset]
+        return sql, params
+
+    def export_certs(self) -> Iterator[CertRecord]:
+        rows = self._iter_cert_rows('der, private_key, revoked_at, reason, serial, common_name, '
+                                    'not_before, not_after')
+        for der, private_key, revoked_at, reason, serial, common_name, not_before, not_after \
+                in rows:
+            fields = (SerialNumber.from_int(int(serial, 16)), common_name,
+                      self._python_time(not_before), self._python_time(not_after))
+            yield CertRecord(Cert.from_der(bytes(der)),
+                             PrivateKey(private_key) if private_key is not None else None,
+                             self._python_time(revoked_at) if revoked_at is not None else None,
+                             reason, fields)
+
+    def existing_serials(self, serials: Iterable[SerialNumber]) -> Set[SerialNumber]:
+        """Which of the serial numbers are already in the database."""
+        serials = [serial_hex(serial) for serial in serials]
+        existing = set()
+        with self._connection() as connection:
+            for start in range(0, len(serials), self.in_list_size):
+                batch = serials[start:start + self.in_list_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                rows = self._execute(connection, f'SELECT serial FROM {CERTS_TABLE} '
+                                                 f'WHERE serial IN ({placeholders})', batch)
+                existing.update(SerialNumber.from_int(int(serial, 16)) for serial, in rows)
+        return existing
+
+    def get_cert(self, serial: str) -> Cert:
+        with self._connection() as connection:
+            row = self._execute(connection, f'SELECT der FROM {CERTS_TABLE} WHERE serial = %s',
+                                (serial_hex(SerialNumber(serial)),)).fetchone()
+        if row is None:
+            raise BackendError(f'No such certificate: {serial}')
+        return Cert.from_der(bytes(row[0]))
+
+    def get_crl(self) -> Crl:
+        # answered from the status index, the certificates themselves are not read
+        rows = self._iter_rows(f'SELECT serial, revoked_at, reason FROM {CERTS_TABLE} '
+                               f'WHERE status = %s ORDER BY revoked_at', (REVOKED,))
+        revoked = ((SerialNumber(serial), self._python_time(revoked_at), reason)
+                   for serial, revoked_at, reason in rows)
+        signer, settings = self._loaded()
+        return signer.make_crl(revoked, settings['crl_days'])
+
+    def _python_time(self, value) -> datetime.datetime:
+        """Timezone aware datetime from what the driver returned for a timestamp column."""
+        return value
@@ -0,0 +1,78 @@
+import sqlite3
+import datetime
+from pathlib import Path
+from ..config import Param
+from ..exceptions import BackendError
+from .sql import ConnectionPool, SqlBackend
+
+
+# ISO 8601 in UTC with fixed width, so the text order of the columns is the time order
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class Backend(SqlBackend):
+    name = 'SQLite'
+    description = 'Storing certificates in an SQLite database file, no server needed'
+    threadsafe = True
+
+    init_requires = (
+        Param('path', convert=Path,
+              help="Path to the database file, created when it doesn't exist"),
+        Param('busy_timeout', default=30, convert=float,
+              help='Seconds to wait for another process writing the database'),
+        Param('pool_size', default=8, convert=int, help='Maximum number of connections'),
+    )
+
+    placeholder = '?'
+    blob_type = 'BLOB'
+    timestamp_type = 'TEXT'
+    # prepared statements kept by every connection, the queries are the same strings every time
+    cached_statements = 256
+    # the limit of host parameters in a statement is only 999 before SQLite 3.32
+    in_list_size = 900
+
+    def __init__(self, path: Path, busy_timeout: float, pool_size: int):
+        super().__init__()
+        path = Path(path)
+        if not path.parent.is_dir():
+            raise BackendError(f"The directory of the database doesn't exist: {path.parent}")
+        self._path = path
+        self._busy_timeout = busy_timeout
+        self._pool = ConnectionPool(self._connect, pool_size)
+        try:
+            with self._connection() as connection:
+                # persistent in the database file, readers don't block the writer and the
+                # writer doesn't block readers, also in other processes
+                mode, = connection.execute('PRAGMA journal_mode = WAL').fetchone()
+        except sqlite3.Error as e:
+            raise BackendError(f'Could not open the SQLite database {path}: {e}')
+        if mode != 'wal':
+            raise BackendError(f'Could not switch {path} to WAL mode, it is in {mode} mode.')
+
+    def _connect(self):
+        # IMMEDIATE: write transactions take the write lock at BEGIN, waiting for it at most
+        # busy_timeout, instead of failing when a read has to be upgraded to a write
+        connection = sqlite3.connect(str(self._path), timeout=self._busy_timeout,
+                                     isolation_level='IMMEDIATE', check_same_thread=False,
+                                     cached_statements=self.cached_statements)
+        # NORMAL would be enough against corruption in WAL mode, FULL also keeps the last
+        # committed certificates after a power loss, batched issuance syncs once per batch
+        connection.execute('PRAGMA synchronous = FULL')
+        return connection
+
+    def close(self):
+        self._pool.close()
+
+    def _connection(self):
+        return self._pool.connection()
+
+    def _db_time(self, value: datetime.datetime) -> str:
+        return value.astimezone(datetime.timezone.utc).strftime(_TIME_FORMAT)
+
+    def _python_time(self, value: str) -> datetime.datetime:
+        # a lot faster than strptime
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc)
+
+    @property
+    def version(self) -> str:
+        return f'{self.name} {sqlite3.sqlite_version}'
@@ -1,11 +1,11 @@
-from typing import Iterator
+from typing import Iterator, Optional, Set
 import hvac
 from requests.exceptions import RequestException
 from ..csr import CsrPolicy
 from ..exceptions import BackendError
 from ..wrapper import Cert, PrivateKey, Crl, SerialNumber
 from ..config import strtobool, Param
-from .interfaces import IBackend
+from .interfaces import CertQuery, IBackend
 
 
 class Backend(IBackend):
@@ -112,11 +112,28 @@ class Backend(IBackend):
         return self._client.write(f'{self.mount_point}/revoke',
                                   serial_number=str(SerialNumber(serial)))
 
-    def list_certs(self) -> Iterator[Cert]:
+    def list_certs(self, query: Optional[CertQuery]=None) -> Iterator[Cert]:
+        """Only the serial numbers are listed by Vault, so only the certificates of the page
+        are read when sorting by serial number without filters.
+        """
         res = self._client.list(f'{self.mount_point}/certs')
-        for serial in res['data']['keys']:
+        serials = res['data']['keys']
+        if query is not None and (query.filtered or query.sort == 'expiry'):
+            yield from query.apply(map(self.get_cert, serials), self._revoked_serials)
+            return
+        if query is not None:
+            serial_numbers = map(SerialNumber, serials)
+            if query.sort is not None:
+                serial_numbers = sorted(serial_numbers)
+            if query.after is not None:
+                serial_numbers = (s for s in serial_numbers if (s,) > query.after)
+            serials = map(str, query.page(serial_numbers))
+        for serial in serials:
             yield self.get_cert(serial)
 
+    def _revoked_serials(self) -> Set[SerialNumber]:
+        return {revoked_cert.serial_number for revoked_cert in self.get_crl()}
+
     def get_cert(self, serial: str) -> Cert:
         serial_number = SerialNumber(serial)
         res = self._client.read(f'{self.mount_point}/cert/{serial_number}')
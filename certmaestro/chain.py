@@ -0,0 +1,258 @@
+"""
+    Certificate chain building and validation.
+    Issuers are looked up by Authority/Subject Key Identifier or by subject name, signature
+    verification results are cached, and inventories can be verified in multiple processes.
+    Only signatures, validity periods, CA flags and path lengths are checked: name
+    constraints, policies and revocation are not.
+"""
+import os
+import datetime
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+import attr
+from oscrypto import asymmetric
+from oscrypto.errors import SignatureError
+from .exceptions import ChainError
+from .wrapper import Cert, iter_certs
+
+
+MAX_DEPTH = 10
+_VERIFY_FUNCTIONS = {
+    'rsassa_pkcs1v15': asymmetric.rsa_pkcs1v15_verify,
+    'rsassa_pss': asymmetric.rsa_pss_verify,
+    'dsa': asymmetric.dsa_verify,
+    'ecdsa': asymmetric.ecdsa_verify,
+}
+
+
+class TrustStore:
+    """Trusted roots and known intermediate certificates, indexed for finding issuers."""
+
+    def __init__(self, roots: Iterable[Cert]=(), intermediates: Iterable[Cert]=()):
+        self._by_fingerprint = {}
+        self._by_key_identifier = {}
+        self._by_subject = {}
+        self._roots = set()
+        for cert in roots:
+            self.add(cert, root=True)
+        for cert in intermediates:
+            self.add(cert)
+
+    @classmethod
+    def from_files(cls, root_files: Iterable[Path]=(), intermediate_files: Iterable[Path]=()):
+        roots = (cert for path in root_files for cert in iter_certs(path))
+        intermediates = (cert for path in intermediate_files for cert in iter_certs(path))
+        return cls(roots, intermediates)
+
+    def add(self, cert: Cert, root=False):
+        fingerprint = cert.asn1.sha256
+        if root:
+            self._roots.add(fingerprint)
+        if fingerprint in self._by_fingerprint:
+            return
+        self._by_fingerprint[fingerprint] = cert
+        if cert.key_identifier is not None:
+            self._by_key_identifier.setdefault(cert.key_identifier, []).append(cert)
+        self._by_subject.setdefault(cert.subject, []).append(cert)
+
+    def is_root(self, cert: Cert):
+        return cert.asn1.sha256 in self._roots
+
+    def get(self, fingerprint: bytes) -> Optional[Cert]:
+        return self._by_fingerprint.get(fingerprint)
+
+    def find_issuers(self, cert: Cert) -> List[Cert]:
+        """Possible issuers of cert, more than one if the CA key or certificate was renewed."""
+        key_identifier = cert.authority_key_identifier
+        if key_identifier is not None and key_identifier in self._by_key_identifier:
+            return [c for c in self._by_key_identifier[key_identifier]
+                    if c.subject == cert.issuer]
+        return list(self._by_subject.get(cert.issuer, ()))
+
+    @property
+    def certs(self):
+        return list(self._by_fingerprint.values())
+
+    @property
+    def roots(self):
+        return [self._by_fingerprint[fingerprint] for fingerprint in self._roots]
+
+
+class SignatureCache:
+    """Results of signature checks by (certificate, issuer) fingerprints. Intermediates are
+    checked by every chain going through them, but only have to be verified once.
+    """
+
+    def __init__(self, max_size=100_000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._public_keys = {}
+
+    def is_signed_by(self, cert: Cert, issuer: Cert) -> bool:
+        key = (cert.asn1.sha256, issuer.asn1.sha256)
+        result = self._results.get(key)
+        if result is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return result
+        self.misses += 1
+        result = self._results[key] = self._verify(cert, issuer)
+        if len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+        return result
+
+    def _verify(self, cert, issuer):
+        asn1_cert = cert.asn1
+        algorithm = asn1_cert['signature_algorithm']
+        verify = _VERIFY_FUNCTIONS.get(algorithm.signature_algo)
+        if verify is None:
+            raise ChainError(f'Unsupported signature algorithm: {algorithm.signature_algo}')
+        public_key = self._public_keys.get(issuer.asn1.sha256)
+        if public_key is None:
+            public_key = asymmetric.load_public_key(issuer.asn1.public_key)
+            self._public_keys[issuer.asn1.sha256] = public_key
+        try:
+            verify(public_key, asn1_cert.signature, asn1_cert['tbs_certificate'].dump(),
+                   algorithm.hash_algo)
+        except SignatureError:
+            return False
+        return True
+
+
+@attr.s(slots=True, frozen=True)
+class ValidationResult:
+    cert = attr.ib()
+    # from the certificate to the root, empty if no chain could be built
+    chain = attr.ib(default=())
+    error = attr.ib(default=None)
+
+    @property
+    def valid(self):
+        return self.error is None
+
+
+class ChainValidator:
+    def __init__(self, trust_store: TrustStore, signature_cache: Optional[SignatureCache]=None,
+                 at: Optional[datetime.datetime]=None, max_depth=MAX_DEPTH):
+        self.trust_store = trust_store
+        self.signature_cache = signature_cache if signature_cache is not None else SignatureCache()
+        self.at = at
+        self.max_depth = max_depth
+
+    def build_chain(self, cert: Cert) -> List[Cert]:
+        """Find a path of correctly signed certificates from cert to a trusted root."""
+        chain = self._extend([cert])
+        if chain is None:
+            raise ChainError(self._missing_issuer_message(cert))
+        return chain
+
+    def _extend(self, chain):
+        current = chain[-1]
+        if self.trust_store.is_root(current):
+            return chain
+        if len(chain) > self.max_depth:
+            return None
+        for issuer in self.trust_store.find_issuers(current):
+            if any(issuer.asn1.sha256 == c.asn1.sha256 for c in chain):
+                continue
+            if self.signature_cache.is_signed_by(current, issuer):
+                found = self._extend(chain + [issuer])
+                if found is not None:
+                    return found
+        return None
+
+    def _missing_issuer_message(self, cert):
+        current = cert
+        for _ in range(self.max_depth + 1):
+            if self.trust_store.is_root(current):
+                break
+            if (current.subject == current.issuer
+                    and self.signature_cache.is_signed_by(current, current)):
+                return f'Self-signed certificate is not trusted: {current.subject.common_name}'
+            issuers = self.trust_store.find_issuers(current)
+            if not issuers:
+                return f'Issuer not found: {current.issuer.common_name}'
+            signed = [i for i in issuers if self.signature_cache.is_signed_by(current, i)]
+            if not signed:
+                return f'Signature of {current.subject.common_name} does not match the issuer'
+            current = signed[0]
+        return 'No valid path to a trusted root'
+
+    def validate(self, cert: Cert) -> ValidationResult:
+        try:
+            chain = self.build_chain(cert)
+            self._check_chain(chain)
+        except ChainError as e:
+            return ValidationResult(cert, (), str(e))
+        return ValidationResult(cert, tuple(chain))
+
+    def _check_chain(self, chain):
+        at = self.at or datetime.datetime.now(datetime.timezone.utc)
+        for depth, cert in enumerate(chain):
+            name = cert.subject.common_name
+            if at < cert.not_valid_before:
+                raise ChainError(f'Not valid yet: {name}')
+            elif at > cert.not_valid_after:
+                raise ChainError(f'Expired: {name}')
+            if depth == 0:
+                continue
+            if not cert.ca:
+                raise ChainError(f'Issuer is not a CA: {name}')
+            # the number of intermediates below, the leaf doesn't count
+            if cert.max_path_length is not None and depth - 1 > cert.max_path_length:
+                raise ChainError(f'Path length constraint exceeded: {name}')
+
+
+_worker_validator = None
+
+
+def _init_worker(root_ders, intermediate_ders, at):
+    global _worker_validator
+    trust_store = TrustStore((Cert.from_der(der) for der in root_ders),
+                             (Cert.from_der(der) for der in intermediate_ders))
+    _worker_validator = ChainValidator(trust_store, at=at)
+
+
+def _validate_batch(ders):
+    results = []
+    for der in ders:
+        result = _worker_validator.validate(Cert.from_der(der))
+        # only the fingerprints go back, the parent has the same certificates
+        results.append((tuple(c.asn1.sha256 for c in result.chain[1:]), result.error))
+    return results
+
+
+def validate_certs(certs: Iterable[Cert], trust_store: TrustStore, workers: Optional[int]=None,
+                   batch_size=256, at: Optional[datetime.datetime]=None
+                   ) -> Iterator[ValidationResult]:
+    """Validate many certificates in parallel processes, results are in the input order.
+    Only a limited number of batches are in flight, so certs can be an arbitrarily long
+    iterator. Every worker builds its own TrustStore and SignatureCache once.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        validator = ChainValidator(trust_store, at=at)
+        yield from (validator.validate(cert) for cert in certs)
+        return
+
+    init_args = ([c.der for c in trust_store.roots],
+                 [c.der for c in trust_store.certs if not trust_store.is_root(c)], at)
+    certs = iter(certs)
+    pending = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args) as executor:
+        while True:
+            batch = list(itertools.islice(certs, batch_size))
+            if batch:
+                pending.append((batch, executor.submit(_validate_batch, [c.der for c in batch])))
+            if pending and (not batch or len(pending) >= workers * 2):
+                batch_certs, future = pending.popleft()
+                for cert, (fingerprints, error) in zip(batch_certs, future.result()):
+                    chain = (cert, *(trust_store.get(f) for f in fingerprints))
+                    yield ValidationResult(cert, chain if error is None else (), error)
+            elif not batch:
+                return
@@ -1,29 +1,228 @@
 import ssl
 import enum
+import time
+import errno
 import socket
+import random
+import threading
+import collections
 import certifi
 from concurrent import futures
+from typing import Optional
 import attr
 from oscrypto.errors import TLSError
 from oscrypto.tls import TLSSocket
 from .url import parse_url
+from .exceptions import UrlParseError
+from .resolver import Timings, default_resolver, open_connection
+from .wrapper import Cert
 
 
-def openssl_check_hostname(hostname):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(1)
-    context = ssl.create_default_context(cafile=certifi.where())
-    ssl_sock = context.wrap_socket(sock, server_hostname=hostname)
+DEFAULT_PORT = 443
+DEFAULT_TIMEOUT = 3.0
+TIMED_OUT = 'Timed out'
+
+# Connection level errors which might go away by themselves, so it's worth to try again.
+# Certificate and handshake errors are never retried, those will be the same the next time.
+_TRANSIENT_ERRNOS = {
+    errno.ECONNREFUSED,
+    errno.ECONNRESET,
+    errno.ECONNABORTED,
+    errno.EHOSTUNREACH,
+    errno.ENETUNREACH,
+    errno.ENETDOWN,
+    errno.ETIMEDOUT,
+    errno.EPIPE,
+}
+_TRANSIENT_GAIERRORS = {socket.EAI_AGAIN}
+
+
+@attr.s(slots=True, frozen=True)
+class CheckError:
+    message = attr.ib()
+    transient = attr.ib(default=False)
+
+    def __str__(self):
+        return self.message
+
+
+def _error_from_invalid_hostname(exc):
+    # the IDNA codec raises UnicodeError for names like "a..example.com"
+    return CheckError(f'Invalid hostname: {exc}')
+
+
+def _error_from_oserror(exc):
+    if isinstance(exc, socket.gaierror):
+        return CheckError(exc.strerror or str(exc), exc.errno in _TRANSIENT_GAIERRORS)
+    message = exc.strerror or str(exc)
+    return CheckError(message, exc.errno in _TRANSIENT_ERRNOS)
+
+
+@attr.s(slots=True)
+class Handshake:
+    """Details of a single check attempt: durations and the certificate of the server."""
+    timings = attr.ib(default=attr.Factory(Timings))
+    cert = attr.ib(default=None)
+    resumed = attr.ib(default=False)
+
+
+class TLSStats:
+    """Counts how much time the TLSClientCache saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contexts_created = 0
+        self.context_seconds = 0.0
+        self.contexts_reused = 0
+        self.full_handshakes = 0
+        self.full_seconds = 0.0
+        self.resumed_handshakes = 0
+        self.resumed_seconds = 0.0
+
+    def add_context(self, seconds):
+        with self._lock:
+            self.contexts_created += 1
+            self.context_seconds += seconds
+
+    def add_context_reuse(self):
+        with self._lock:
+            self.contexts_reused += 1
+
+    def add_handshake(self, seconds, resumed):
+        with self._lock:
+            if resumed:
+                self.resumed_handshakes += 1
+                self.resumed_seconds += seconds
+            else:
+                self.full_handshakes += 1
+                self.full_seconds += seconds
+
+    @property
+    def context_seconds_saved(self):
+        if not self.contexts_created:
+            return 0.0
+        return self.contexts_reused * self.context_seconds / self.contexts_created
+
+    @property
+    def handshake_seconds_saved(self):
+        if not self.full_handshakes or not self.resumed_handshakes:
+            return 0.0
+        full_average = self.full_seconds / self.full_handshakes
+        resumed_average = self.resumed_seconds / self.resumed_handshakes
+        return max(full_average - resumed_average, 0) * self.resumed_handshakes
+
+    def __str__(self):
+        return (f'SSL contexts created: {self.contexts_created}, reused: {self.contexts_reused} '
+                f'(saved {self.context_seconds_saved * 1000:.1f}ms); '
+                f'handshakes full: {self.full_handshakes}, resumed: {self.resumed_handshakes} '
+                f'(saved {self.handshake_seconds_saved * 1000:.1f}ms)')
+
+
+class TLSClientCache:
+    """Shares SSL contexts between checks and keeps TLS sessions for resumption.
+    Creating a context means parsing the whole CA bundle, so there is only one per CA file.
+    Sessions are kept for max_session_age seconds per (hostname, port) at most, after that
+    a full handshake verifies the certificate chain again. TLS 1.3 servers send session
+    tickets after the handshake, so without a saved session the check waits a bit for one.
+    """
+
+    def __init__(self, cafile=None, max_sessions=10_000, max_session_age=3600, ticket_wait=0.25):
+        self.cafile = cafile
+        self.max_sessions = max_sessions
+        self.max_session_age = max_session_age
+        self.ticket_wait = ticket_wait
+        self.stats = TLSStats()
+        self._contexts = {}
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_context(self, cafile=None) -> ssl.SSLContext:
+        cafile = cafile or self.cafile or certifi.where()
+        with self._lock:
+            context = self._contexts.get(cafile)
+            if context is None:
+                start = time.perf_counter()
+                context = self._contexts[cafile] = ssl.create_default_context(cafile=cafile)
+                self.stats.add_context(time.perf_counter() - start)
+            else:
+                self.stats.add_context_reuse()
+        return context
+
+    def get_session(self, hostname, port) -> Optional[ssl.SSLSession]:
+        with self._lock:
+            saved = self._sessions.get((hostname, port))
+        if saved is None:
+            return None
+        saved_at, session = saved
+        if time.monotonic() - saved_at > self.max_session_age:
+            return None
+        return session
+
+    def save_session(self, hostname, port, ssl_sock: ssl.SSLSocket, rtt):
+        if ssl_sock.session_reused:
+            return
+        session = ssl_sock.session
+        if ssl_sock.version() == 'TLSv1.3' and not (session and session.has_ticket):
+            session = self._wait_for_ticket(ssl_sock, rtt)
+        if session is None:
+            return
+        with self._lock:
+            self._sessions.pop((hostname, port), None)
+            self._sessions[(hostname, port)] = (time.monotonic(), session)
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _wait_for_ticket(self, ssl_sock, rtt):
+        # the ticket is processed when reading, no application data is expected at all
+        ssl_sock.settimeout(min(max(2 * rtt, 0.01), self.ticket_wait))
+        try:
+            ssl_sock.recv(1)
+        except OSError:
+            pass
+        session = ssl_sock.session
+        return session if session is not None and session.has_ticket else None
+
+
+default_tls_cache = TLSClientCache()
+
+
+def openssl_check_hostname(hostname, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT,
+                           resolver=default_resolver, handshake=None, tls_cache=None,
+                           full_handshake=False):
+    """Returns None if the certificate is valid for hostname or a CheckError.
+    With full_handshake, saved TLS sessions of tls_cache are not used, so the certificate
+    chain is always sent by the server and verified again.
+    """
+    # IPv6 literals come in brackets from URLs. When the hostname is an IP address,
+    # the ssl module doesn't send SNI (not allowed by RFC 6066) and matches the IP address
+    # against the subjectAltName entries of the certificate instead.
+    hostname = hostname.strip('[]')
+    handshake = handshake if handshake is not None else Handshake()
+    timings = handshake.timings
+    tls_cache = tls_cache if tls_cache is not None else default_tls_cache
+    context = tls_cache.get_context()
+    session = None if full_handshake else tls_cache.get_session(hostname, port)
     try:
-        ssl_sock.connect((hostname, 443))
-        ssl_sock.shutdown(socket.SHUT_RDWR)
-        ssl_sock.close()
-    except socket.timeout as e:
-        return 'Timed out'
-    except OSError as e:
-        return parse_socket_error_message(e.args[1])
+        with open_connection(resolver, hostname, port, timeout, timings) as sock:
+            tls_start = time.perf_counter()
+            with context.wrap_socket(sock, server_hostname=hostname, session=session) as ssl_sock:
+                timings.tls = time.perf_counter() - tls_start
+                handshake.resumed = ssl_sock.session_reused
+                tls_cache.stats.add_handshake(timings.tls, handshake.resumed)
+                handshake.cert = Cert.from_der(ssl_sock.getpeercert(binary_form=True))
+                if not full_handshake:
+                    tls_cache.save_session(hostname, port, ssl_sock, timings.connect)
+                ssl_sock.shutdown(socket.SHUT_RDWR)
+    except socket.timeout:
+        return CheckError(TIMED_OUT, transient=True)
     except ssl.CertificateError as e:
-        return str(e)
+        return CheckError(getattr(e, 'verify_message', None) or str(e))
+    except ssl.SSLError as e:
+        return CheckError(parse_socket_error_message(e.args[1]))
+    except OSError as e:
+        return _error_from_oserror(e)
+    except ValueError as e:
+        return _error_from_invalid_hostname(e)
     else:
         return None
 
@@ -38,98 +237,184 @@ def parse_socket_error_message(message):
     return message
 
 
-def oscrypto_check_hostname(hostname):
+def oscrypto_check_hostname(hostname, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT,
+                            resolver=default_resolver, handshake=None):
+    hostname = hostname.strip('[]')
+    handshake = handshake if handshake is not None else Handshake()
+    timings = handshake.timings
     try:
-        # TODO: enable certificate verification with certifi (Mozilla CA bundle)
-        # to make results more consistent and reproducible
-        tls_socket = TLSSocket(hostname, 443)
-        tls_socket.shutdown()
+        with open_connection(resolver, hostname, port, timeout, timings) as sock:
+            tls_start = time.perf_counter()
+            # TODO: enable certificate verification with certifi (Mozilla CA bundle)
+            # to make results more consistent and reproducible
+            tls_socket = TLSSocket.wrap(sock, hostname)
+            timings.tls = time.perf_counter() - tls_start
+            handshake.cert = Cert.from_der(tls_socket.certificate.dump())
+            tls_socket.shutdown()
     except TLSError as e:
-        return e.message
-    except socket.gaierror as e:
-        return (str(e))
-    except socket.timeout as e:
-        return 'Timed out'
+        return CheckError(e.message)
+    except socket.timeout:
+        return CheckError(TIMED_OUT, transient=True)
+    except OSError as e:
+        return _error_from_oserror(e)
+    except ValueError as e:
+        return _error_from_invalid_hostname(e)
     else:
         return None
 
 
+def format_target(hostname, port):
+    return hostname if port == DEFAULT_PORT else f'{hostname}:{port}'
+
+
+def backoff_delay(attempt, base=0.25, cap=8.0):
+    """Exponential backoff with "full jitter" for the given (0-based) attempt.
+    Randomizing the whole interval spreads out retries of many hosts failing at the same time.
+    See: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_target(url):
+    """Return the (hostname, port) pair to check for the url and the reason if it's skipped."""
+    try:
+        purl = parse_url(url.strip())
+    except UrlParseError:
+        return None, 'invalid url'
+    if not purl.host or not purl.host.strip():
+        return None, 'invalid hostname'
+    # any other protocoll will be None and as we cannot make a difference,
+    # we will check those. Maybe we shouldn't?
+    elif purl.scheme == 'http':
+        return None, 'not https://'
+    else:
+        return (purl.host, purl.port or DEFAULT_PORT), None
+
+
 class CheckSiteManager:
-    def __init__(self, urls, redirect, timeout, retries):
+    """Checks the sites from urls, which can be any iterable, e.g. lines of a file.
+    At most max_in_flight checks are running or waiting at the same time and only counters
+    are kept about the results, so any number of sites can be checked in constant memory.
+    Duplicate sites are only recognized among the last dedupe_window ones.
+    Every result is recorded in metrics (a SiteCheckMetrics) if given.
+    SSL contexts are shared through tls_cache between checks. TLS sessions are only saved and
+    resumed without full_handshake, which is only worth it when the same sites are checked
+    again, like in site watch: waiting for the session tickets slows down a single round.
+    """
+
+    def __init__(self, urls, redirect, timeout=DEFAULT_TIMEOUT, retries=0, max_workers=3,
+                 resolver=default_resolver, max_in_flight=None, dedupe_window=100_000,
+                 metrics=None, tls_cache=default_tls_cache, full_handshake=True):
         self.redirect = redirect
         self.timeout = timeout
         self.retries = retries
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight or max_workers * 4
+        self.dedupe_window = dedupe_window
+        self.resolver = resolver
+        self.metrics = metrics
+        self.tls_cache = tls_cache
+        self.full_handshake = full_handshake
         self.urls = urls
-        self.skipped = []
-        self.succeeded = []
-        self.failed = []
+        self.total_count = 0
+        self.success_count = 0
+        self.skip_count = 0
+        self.fail_count = 0
+        self._seen = collections.OrderedDict()
 
     def check_sites(self):
-        skipped_urls = self._skip_urls()
-        hostnames = {parse_url(url).host for url in self.urls if url not in skipped_urls}
-
-        with futures.ThreadPoolExecutor(max_workers=3) as executor:
-            futures_to_urls = {executor.submit(self._check, hostname) for hostname in hostnames}
-            # we start yielding after starting requests, so the perceived speed might be better
-            # if the client does something with the return values
-            yield from self.skipped
-            for future in futures.as_completed(futures_to_urls):
-                result = self._make_result(future)
-                if result.succeeded:
-                    self.succeeded.append(result)
-                elif result.failed:
-                    self.failed.append(result)
-                yield result
+        with futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = set()
+            for url, target, skip_reason in self._prefetch_ahead(self._parse_urls()):
+                if target is None:
+                    yield self._count(CheckedSite(url, CheckResult.SKIPPED, skip_reason))
+                    continue
+                if len(in_flight) >= self.max_in_flight:
+                    done, in_flight = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+                    yield from (self._count(self._make_result(future)) for future in done)
+                in_flight.add(executor.submit(self._check, *target))
 
-    @property
-    def success_count(self):
-        return len(self.succeeded)
+            for future in futures.as_completed(in_flight):
+                yield self._count(self._make_result(future))
 
-    @property
-    def skip_count(self):
-        return len(self.skipped)
+    def _parse_urls(self):
+        for url in self.urls:
+            url = url.strip()
+            if not url:
+                continue
+            self.total_count += 1
+            target, skip_reason = parse_target(url)
+            if target is not None and self._is_duplicate(target):
+                continue
+            yield url, target, skip_reason
 
-    @property
-    def fail_count(self):
-        return len(self.failed)
+    def _is_duplicate(self, target):
+        if target in self._seen:
+            self._seen.move_to_end(target)
+            return True
+        self._seen[target] = None
+        if len(self._seen) > self.dedupe_window:
+            self._seen.popitem(last=False)
+        return False
 
-    def _skip_urls(self):
-        skipped_urls = set()
+    def _prefetch_ahead(self, parsed_urls):
+        """DNS lookups are cheap compared to handshakes, so resolve names in the background
+        max_in_flight sites ahead; checks will find the addresses in the cache.
+        """
+        window = collections.deque()
+        for item in parsed_urls:
+            target = item[1]
+            if target is not None:
+                self.resolver.prefetch([target[0].strip('[]')])
+            window.append(item)
+            if len(window) > self.max_in_flight:
+                yield window.popleft()
+        yield from window
 
-        for url in self.urls:
-            purl = parse_url(url)
-            if not purl.host or not purl.host.strip():
-                self._skip(url, 'invalid hostname')
-                skipped_urls.add(url)
-            # any other protocoll will be None and as we cannot make a difference,
-            # we will check those. Maybe we shouldn't?
-            elif purl.scheme == 'http':
-                self._skip(url, 'not https://')
-                skipped_urls.add(url)
-
-        return skipped_urls
-
-    def _skip(self, url, reason):
-        skipresult = CheckedSite(url, CheckResult.SKIPPED, reason)
-        self.skipped.append(skipresult)
+    def _count(self, result):
+        if result.succeeded:
+            self.success_count += 1
+        elif result.skipped:
+            self.skip_count += 1
+        elif result.failed:
+            self.fail_count += 1
+        if self.metrics is not None:
+            self.metrics.observe(result)
+        return result
 
     def _make_result(self, future):
-        hostname, error_message = future.result()
-        result = CheckResult.FAILED if error_message else CheckResult.SUCCEEDED
-        return CheckedSite(hostname, result, error_message)
+        hostname, port, error, handshake = future.result()
+        result = CheckResult.FAILED if error else CheckResult.SUCCEEDED
+        message = str(error) if error else None
+        return CheckedSite(format_target(hostname, port), result, message, handshake.timings,
+                           handshake.cert, hostname, port)
 
-    def _check(self, hostname):
+    def _check(self, hostname, port):
+        return (hostname, port, *self._check_with_retries(hostname, port))
+
+    def _check_with_retries(self, hostname, port):
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(backoff_delay(attempt - 1))
+            handshake = Handshake()
+            error = self._check_once(hostname, port, handshake)
+            if error is None or not error.transient:
+                break
+        return error, handshake
+
+    def _check_once(self, hostname, port, handshake):
         # OpenSSL is more strict about misconfigured servers, e.g. it recognizes missing chains
-        openssl_error = openssl_check_hostname(hostname)
+        openssl_error = openssl_check_hostname(hostname, port, self.timeout, self.resolver,
+                                               handshake, self.tls_cache, self.full_handshake)
         if not openssl_error:
-            return hostname, None
-        # Timeout is the same for both, don't do it twice unnecessary
-        elif openssl_error == 'Timed out':
-            return hostname, openssl_error
+            return None
+        # Connection problems are the same for both, don't do it twice unnecessary
+        elif openssl_error.transient:
+            return openssl_error
         else:
             # OSCrypto gives better error messages, but is more allowing
-            oscrypto_error = oscrypto_check_hostname(hostname)
-            return hostname, oscrypto_error or openssl_error
+            oscrypto_error = oscrypto_check_hostname(hostname, port, self.timeout, self.resolver)
+            return oscrypto_error or openssl_error
 
 
 class CheckResult(enum.Enum):
@@ -143,6 +428,10 @@ class CheckedSite:
     url = attr.ib()
     result = attr.ib(convert=CheckResult)
     message = attr.ib(default=None)
+    timings = attr.ib(default=None)
+    cert = attr.ib(default=None)
+    host = attr.ib(default=None)
+    port = attr.ib(default=None)
     succeeded = attr.ib(init=False)
     skipped = attr.ib(init=False)
     failed = attr.ib(init=False)
@@ -151,3 +440,17 @@ class CheckedSite:
         self.succeeded = (self.result == CheckResult.SUCCEEDED)
         self.skipped = (self.result == CheckResult.SKIPPED)
         self.failed = (self.result == CheckResult.FAILED)
+
+    def as_dict(self):
+        """JSON serializable representation of the result."""
+        cert = self.cert
+        return {
+            'url': self.url,
+            'host': self.host,
+            'port': self.port,
+            'verdict': self.result.value,
+            'error': self.message,
+            'expiry': cert.not_valid_after.isoformat() if cert is not None else None,
+            'issuer': cert.issuer.common_name if cert is not None else None,
+            'timings': attr.asdict(self.timings) if self.timings is not None else None,
+        }
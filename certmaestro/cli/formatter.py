@@ -1,3 +1,9 @@
-from jinja2 import Environment, PackageLoader
+from functools import lru_cache
 
-env = Environment(loader=PackageLoader('certmaestro.cli', 'templates'))
+
+@lru_cache(maxsize=None)
+def get_env():
+    """The jinja environment is only made when a template is rendered, jinja2 is slow to import."""
+    from jinja2 import Environment, PackageLoader
+
+    return Environment(loader=PackageLoader('certmaestro.cli', 'templates'))
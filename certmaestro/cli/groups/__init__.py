@@ -1,12 +1,37 @@
+from importlib import import_module
 import click
-from certmaestro import Config
-from .config import config
-from .cert import cert
-from .crl import crl
-from .site import site
+from certmaestro.config import Config
 
 
-@click.group(invoke_without_command=True)
+class LazyGroup(click.Group):
+    """Imports the modules of subcommands only when they are used, for faster startup."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # command name -> 'module:attribute', relative to this package
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands and name not in self.commands:
+            module_name, attribute = self.lazy_commands[name].split(':')
+            module = import_module(module_name, package=__name__)
+            self.add_command(getattr(module, attribute), name)
+        return super().get_command(ctx, name)
+
+
+@click.group(cls=LazyGroup, invoke_without_command=True, lazy_commands={
+    'api': '.api:api',
+    'config': '.config:config',
+    'cert': '.cert:cert',
+    'crl': '.crl:crl',
+    'daemon': '.daemon:daemon',
+    'migrate': '.migrate:migrate',
+    'site': '.site:site',
+    'store': '.store:store',
+})
 @click.option('-c', '--config', 'config_path', default=Config.DEFAULT_PATH,
               help=f'Default: {Config.DEFAULT_PATH}',
               type=click.Path(dir_okay=False, writable=True, resolve_path=True))
@@ -29,11 +54,15 @@ def main(ctx, config_path, show_version):
 @click.pass_context
 def version(ctx):
     """Same as --version."""
-    import pkg_resources
+    from importlib.metadata import version as get_version, PackageNotFoundError
     from certmaestro.backends import get_backend, BackendError
     from ..utils import get_config_path
 
-    certmaestro_version = pkg_resources.get_distribution('certmaestro').version
+    try:
+        certmaestro_version = get_version('certmaestro')
+    except PackageNotFoundError:
+        # running from a source checkout
+        certmaestro_version = 'unknown version'
     click.echo('Certmaestro ' + certmaestro_version)
     try:
         config = Config(get_config_path(ctx))
@@ -48,9 +77,3 @@ def version(ctx):
         return
 
     click.echo('Backend: ' + backend.version)
-
-
-main.add_command(config)
-main.add_command(cert)
-main.add_command(crl)
-main.add_command(site)
@@ -0,0 +1,42 @@
+import click
+
+
+@click.command()
+@click.option('-a', '--address', default='127.0.0.1', show_default=True,
+              help='Address to listen on, only expose it to trusted clients.')
+@click.option('-p', '--port', default=8740, show_default=True)
+@click.option('-w', '--workers', type=int,
+              help='Number of parallel backend calls, if the backend is thread-safe.')
+@click.option('-v', '--verbose', is_flag=True, help='Log every request.')
+@click.pass_context
+def api(ctx, address, port, workers, verbose):
+    """Serve the backend over an HTTP API.
+
+    Other services can list, get, issue and revoke certificates and get the CA certificate
+    and the CRL with JSON requests. There is no authentication and issued private keys are
+    in the responses.
+    """
+    from certmaestro import Config
+    from certmaestro.api import ApiServer
+    from certmaestro.backends import get_backend
+    from certmaestro.exceptions import BackendError
+    from ..utils import get_config_path
+
+    config_path = get_config_path(ctx)
+    try:
+        backend = get_backend(Config(config_path))
+    except FileNotFoundError:
+        raise click.UsageError(f'Configuration not found: {config_path}, run config setup first')
+    except BackendError as e:
+        raise click.UsageError(str(e))
+
+    server = ApiServer(backend, address, port, workers, verbose)
+    mode = 'in parallel' if backend.threadsafe else 'one at a time'
+    click.echo(f'Serving the {backend.name} backend on http://{address}:{port}, '
+               f'backend calls run {mode}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,7 +1,23 @@
+import itertools
+from operator import attrgetter
 import click
+from certmaestro.backends.interfaces import SORT_KEYS, STATUSES, CertQuery
+from ..output import CERT_FIELDS, Field, format_options, tag_fields, write_rows
 from .config import ensure_config
 
 
+def _backend_options(command):
+    """Options of the commands which can read more configured backends at once."""
+    command = click.option('--timeout', type=float, default=30, show_default=True,
+                           help='Seconds to wait for a backend before leaving it out.')(command)
+    command = click.option('-A', '--all-backends', is_flag=True,
+                           help='Use every configured backend.')(command)
+    command = click.option('-b', '--backend', 'backend_names', multiple=True,
+                           help='Use this configured backend instead of the current one, '
+                                'can be given multiple times.')(command)
+    return command
+
+
 @click.group()
 def cert():
     """Issue, sign, revoke and view certificates."""
@@ -25,38 +41,93 @@ def issue(obj):
 
 @cert.command()
 @click.argument('serial_number')
+@format_options(CERT_FIELDS)
 @ensure_config
-def show(obj, serial_number):
-    """Show certificate details."""
-    from ..formatter import env
+def show(obj, serial_number, output_format, fields):
+    """Show certificate details.
 
-    template = env.get_template('certmaestro_format.jinja2')
+    Every field is shown by default, as a readable text in the table format.
+    """
     cert = obj.backend.get_cert(serial_number.lower())
-    click.echo(template.render(cert=cert))
+    if output_format != 'table':
+        write_rows([cert], fields or list(CERT_FIELDS.values()), output_format)
+    elif fields is None:
+        from ..formatter import get_env
+
+        template = get_env().get_template('certmaestro_format.jinja2')
+        click.echo(template.render(cert=cert))
+    else:
+        # a field on every line
+        write_rows(fields, [Field('field', 'Field', lambda field: field.header),
+                            Field('value', 'Value', lambda field: field.get(cert))], 'table')
 
 
 @cert.command('show-ca')
 @ensure_config
 def show_ca(obj):
     """Show CA certificate details."""
-    from ..formatter import env
+    from ..formatter import get_env
 
     cert = obj.backend.get_ca_cert()
-    template = env.get_template('certmaestro_format.jinja2')
+    template = get_env().get_template('certmaestro_format.jinja2')
     click.echo(template.render(cert=cert))
 
 
 @cert.command('list')
+@click.option('--status', type=click.Choice(STATUSES), help='Only the certificates in this state.')
+@click.option('--cn', 'common_name',
+              help='Only the certificates with a matching Common Name, * and ? are wildcards.')
+@click.option('-n', '--limit', type=click.IntRange(min=0),
+              help='Show at most this many certificates.')
+@click.option('-s', '--sort', type=click.Choice(SORT_KEYS),
+              help='Sort the certificates, by default they are shown as the backends list them.')
+@format_options(CERT_FIELDS, ['common_name', 'not_valid_before', 'not_valid_after',
+                              'serial_number'])
+@_backend_options
 @ensure_config
-def list_certs(obj):
-    """List issued certificates."""
-    from tabulate import tabulate
+def list_certs(obj, status, common_name, limit, sort, output_format, fields, backend_names,
+               all_backends, timeout):
+    """List issued certificates.
+
+    The filters, the order and the limit are given to the backends, which do them in their
+    own storage where they can. Multiple backends are read at the same time and their rows
+    are tagged with the name of the backend. Sorted rows are merged from the backends as they
+    are read.
+    """
+    query = CertQuery(status=status, common_name=common_name, sort=sort, limit=limit)
+    key = query.cert_key if sort else None
 
-    cert_list = obj.backend.list_certs()
-    cert_table = ((c.subject.common_name, c.not_valid_before, c.not_valid_after, c.serial_number)
-                  for c in cert_list)
-    headers = ['Common Name', 'Not valid before', 'Not valid after', 'Serial Number']
-    click.echo(tabulate(cert_table, headers=headers, numalign='left'))
+    def read(backend, config):
+        return backend.list_certs(query)
+
+    federation, tagged_certs = _federate(obj, backend_names, all_backends, timeout, read, key)
+    if limit is not None:
+        tagged_certs = itertools.islice(tagged_certs, limit)
+    _echo_items(federation, tagged_certs, fields, output_format)
+
+
+@cert.command()
+@click.option('-d', '--days', default=30, show_default=True,
+              help='Show the certificates expiring in this many days.')
+@_backend_options
+@ensure_config
+def expiring(obj, days, backend_names, all_backends, timeout):
+    """List certificates which expire soon, the soonest first."""
+    import datetime
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    query = CertQuery(expires_after=now, expires_before=now + datetime.timedelta(days=days),
+                      sort='expiry')
+
+    def read(backend, config):
+        return backend.list_certs(query)
+
+    federation, tagged_certs = _federate(obj, backend_names, all_backends, timeout, read,
+                                         query.cert_key)
+    fields = [CERT_FIELDS['common_name'], CERT_FIELDS['not_valid_after'],
+              Field('days_left', 'Days left', lambda c: (c.not_valid_after - now).days),
+              CERT_FIELDS['serial_number']]
+    _echo_items(federation, tagged_certs, fields)
 
 
 @cert.command()
@@ -68,6 +139,140 @@ def revoke(obj, serial_number):
     click.echo(result)
 
 
+@cert.command()
+@click.argument('query')
+@click.option('--field', '-f', 'fields', multiple=True,
+              type=click.Choice(['cn', 'san', 'ip', 'issuer', 'sha1', 'sha256', 'spki']),
+              help='Search only in this field, can be given multiple times. '
+                   'Guessed from the query by default.')
+@click.option('--reindex', is_flag=True, help='Rebuild the search index from the backend first.')
+@_backend_options
+@ensure_config
+def search(obj, query, fields, reindex, backend_names, all_backends, timeout):
+    """Search certificates by name, IP address, issuer or fingerprint.
+
+    QUERY can be a name (api.example.com), a domain suffix (.example.com), a shell-style
+    pattern (api-*.example.com) or a SHA-1, SHA-256 or public key (SPKI) fingerprint.
+    Every backend has its own index, multiple backends are searched at the same time.
+    """
+    from certmaestro.index import CertIndex, IndexEntry
+
+    def read(backend, config):
+        with CertIndex(config.index_path) as index:
+            if reindex or index.built_at is None:
+                click.echo(f'Indexing certificates of {config.backend_name}...', err=True)
+                revoked = _revoked_serials(backend)
+                index.rebuild(IndexEntry.from_cert(c, c.serial_number in revoked)
+                              for c in backend.list_certs())
+            return list(index.search(query, fields))
+
+    federation, results = _federate(obj, backend_names, all_backends, timeout, read)
+    # not fields, read() runs in other threads and searches in those
+    columns = [Field('common_name', 'Common Name', attrgetter('common_name')),
+               Field('not_valid_after', 'Not valid after', attrgetter('not_valid_after')),
+               Field('serial_number', 'Serial Number', attrgetter('serial_number')),
+               Field('status', 'Status', lambda r: 'revoked' if r.revoked else 'valid'),
+               Field('matched', 'Matched', lambda r: f'{r.field}: {r.term}')]
+    _echo_items(federation, results, columns)
+
+
+@cert.command()
+@click.argument('cert_files', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--chain', 'chain_files', multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help='PEM or DER bundle of intermediate certificates, can be given multiple times.')
+@click.option('--root', 'root_files', multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help='Trust these root certificates too, not only the CA certificate.')
+@click.option('-j', '--jobs', type=int, help='Number of processes, default: number of CPUs.')
+@click.option('-a', '--all', 'show_all', is_flag=True, help='Show valid certificates too.')
+@ensure_config
+def verify(obj, cert_files, chain_files, root_files, jobs, show_all):
+    """Verify that certificates chain to the CA.
+
+    Checks every issued certificate, or the certificates in CERT_FILES (PEM or DER
+    bundles). Signatures, validity periods, CA flags and path lengths are verified,
+    revocation is not. Exit code is 1 if any certificate is invalid.
+    """
+    from pathlib import Path
+    from certmaestro.chain import TrustStore, validate_certs
+    from certmaestro.wrapper import iter_certs
+
+    trust_store = TrustStore.from_files(map(Path, root_files), map(Path, chain_files))
+    trust_store.add(obj.backend.get_ca_cert(), root=True)
+    if cert_files:
+        certs = (cert for path in cert_files for cert in iter_certs(Path(path)))
+    else:
+        certs = obj.backend.list_certs()
+
+    valid_count = invalid_count = 0
+    for result in validate_certs(certs, trust_store, workers=jobs):
+        name = result.cert.subject.common_name
+        if result.valid:
+            valid_count += 1
+            if show_all:
+                click.secho(f'Valid:     {name} ({result.cert.serial_number})', fg='green')
+        else:
+            invalid_count += 1
+            click.secho(f'Invalid:   {name} ({result.cert.serial_number}): {result.error}',
+                        fg='red')
+
+    click.echo(f'Total: {valid_count + invalid_count}, valid: {valid_count}, '
+               f'invalid: {invalid_count}.')
+    if invalid_count:
+        click.get_current_context().exit(1)
+
+
+def _federate(obj, backend_names, all_backends, timeout, read, key=None):
+    """Federation of read(backend, config) of the selected backends, and the items read.
+    The items are merged in key order if key is given, in arrival order otherwise.
+    """
+    from functools import partial
+    from certmaestro.exceptions import ConfigurationError
+    from certmaestro.federation import Federation
+
+    if all_backends:
+        backend_names = obj.config.backend_names
+    if backend_names:
+        try:
+            configs = {name: obj.config.select(name) for name in backend_names}
+        except ConfigurationError as e:
+            raise click.UsageError(str(e))
+        sources = {name: partial(_read_backend, read, config) for name, config in configs.items()}
+    else:
+        # set up here, it might ask questions
+        backend = obj.backend
+        sources = {obj.config.backend_name: partial(read, backend, obj.config)}
+    federation = Federation(sources, timeout)
+    tagged_items = federation.merged(key) if key is not None else federation.unordered()
+    return federation, tagged_items
+
+
+def _read_backend(read, config):
+    from certmaestro.backends import get_backend
+
+    return read(get_backend(config), config)
+
+
+def _echo_items(federation, tagged_items, fields, output_format='table'):
+    """Rows of the items read by the federation, tagged with the backend when there are more.
+    Failed backends are reported at the end, the exit code is 1 then.
+    """
+    if len(federation.sources) > 1:
+        write_rows(tagged_items, tag_fields(fields), output_format)
+    else:
+        write_rows((item for _, item in tagged_items), fields, output_format)
+    # the items might not have been read to the end, e.g. with a limit
+    federation.close()
+    for name, error in federation.errors.items():
+        click.secho(f'The {name} backend failed: {error}', fg='red', err=True)
+    if federation.errors:
+        click.get_current_context().exit(1)
+
+
+def _revoked_serials(backend):
+    """From the backend's own records, the CRL might not have been made yet."""
+    return {cert.serial_number for cert in backend.list_certs(CertQuery(status='revoked'))}
+
+
 @cert.command()
 @ensure_config
 def deploy(obj):
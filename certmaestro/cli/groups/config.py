@@ -1,6 +1,6 @@
 import click
 from certmaestro.backends import BackendBuilder, get_backend, load_all_backends
-from certmaestro.exceptions import BackendError
+from certmaestro.exceptions import BackendError, ConfigurationError
 from certmaestro import Config
 from ..utils import get_config_path
 
@@ -10,7 +10,14 @@ class Obj:
     def __init__(self):
         self.ctx = click.get_current_context()
         self.config = self._get_config()
-        self.backend = self._get_backend()
+        self._backend = None
+
+    @property
+    def backend(self):
+        """The current backend, only set up when a command needs it."""
+        if self._backend is None:
+            self._backend = self._get_backend()
+        return self._backend
 
     def _get_config(self):
         config_path = get_config_path(self.ctx)
@@ -24,6 +31,14 @@ class Obj:
             return Config(config_path)
 
     def _get_backend(self):
+        import os
+        from certmaestro.daemon import NO_DAEMON_ENV, connect
+
+        # a running daemon has the backend ready
+        if not os.environ.get(NO_DAEMON_ENV):
+            remote_backend = connect(self.config.socket_path)
+            if remote_backend is not None:
+                return remote_backend
         while True:
             try:
                 return get_backend(self.config)
@@ -48,16 +63,31 @@ def config():
 
 
 @config.command()
+@click.option('-n', '--name', help='Name of the backend in the configuration, '
+                                   'default: the type of the backend.')
+@click.option('-a', '--add', is_flag=True,
+              help='Add the backend to the configuration, keeping the others.')
 @click.pass_context
-def setup(ctx):
+def setup(ctx, name, add):
     """Initializes backend storage, settings roles, and generate CA."""
     config_path = get_config_path(ctx)
-    _check_config_path(config_path)
+    if add:
+        try:
+            config = Config(config_path)
+        except FileNotFoundError:
+            raise click.UsageError(f'Configuration not found: {config_path}')
+    else:
+        _check_config_path(config_path)
+        config = Config.make_new(config_path)
     all_backends = load_all_backends()
     BackendCls = _select_backend(all_backends)
+    name = name or BackendCls.name
+    if name in config.backend_names:
+        raise click.UsageError(f'There is already a backend named "{name}", '
+                               f'choose another one with --name')
     builder = _ask_backend_params(BackendCls)
     backend = builder.setup_backend()
-    _make_new_config(builder, config_path)
+    _save_backend(config, name, builder)
     click.echo(f'Saved configuration to {config_path}')
     click.secho(f'Successfully initialized {backend.name}. You can issue certificates now!',
                 fg='green')
@@ -100,11 +130,12 @@ def _ask_backend_params(BackendCls):
     return builder
 
 
-def _make_new_config(builder, config_path):
-    config = Config.make_new(config_path)
-    config.backend_name = builder.backend_name
+def _save_backend(config, name, builder):
     str_values = {k: str(v) for k, v in builder.init_params.items()}
-    config.backend_config.update(str_values)
+    config.add_backend(name, builder.backend_name, str_values)
+    # an added backend only becomes the current one with config switch
+    if len(config.backend_names) == 1:
+        config.backend_name = name
     config.save()
 
 
@@ -115,5 +146,27 @@ def show(obj):
 
 
 @config.command()
-def switch():
-    """Switch to an already configured backend and use that from now on."""
+@click.argument('name', required=False)
+@click.pass_context
+def switch(ctx, name):
+    """Switch to an already configured backend and use that from now on.
+
+    Without NAME, the configured backends are listed, the current one is marked with *.
+    """
+    config_path = get_config_path(ctx)
+    try:
+        config = Config(config_path)
+    except FileNotFoundError:
+        raise click.UsageError(f'Configuration not found: {config_path}, run config setup first')
+    if name is None:
+        for backend_name in config.backend_names:
+            marker = '*' if backend_name == config.backend_name else ' '
+            click.echo(f'{marker} {backend_name} ({config.select(backend_name).backend_type})')
+        return
+    try:
+        config.select(name)
+    except ConfigurationError as e:
+        raise click.UsageError(str(e))
+    config.backend_name = name
+    config.save()
+    click.echo(f'Switched to the {name} backend.')
@@ -1,4 +1,6 @@
+import json
 import click
+from ..output import REVOKED_CERT_FIELDS, format_options, iter_json, write_rows
 from .config import ensure_config
 
 
@@ -14,19 +16,29 @@ def update(obj):
 
 
 @crl.command()
+@format_options(REVOKED_CERT_FIELDS)
 @ensure_config
-def show(obj):
+def show(obj, output_format, fields):
     """Show the Certificate Revocation List."""
-    from tabulate import tabulate
-
     crl = obj.backend.get_crl()
-    click.echo(f'Issuer Common Name:    {crl.issuer.common_name}')
-    click.echo(f'This update:           {crl.this_update}')
-    click.echo(f'Next update:           {crl.next_update}')
-    click.echo()
-    headers = ['Revocation Date', 'Invalidity Date', 'Reason', 'Serial Number']
-    revoked_certs = [(rc.revocation_date, rc.invalidity_date, rc.reason, rc.serial_number)
-                     for rc in crl]
-    click.echo(tabulate(revoked_certs, headers=headers))
-    if not revoked_certs:
-        click.echo('No certificates has been revoked yet!')
+    fields = fields or list(REVOKED_CERT_FIELDS.values())
+    if output_format == 'json':
+        # the revoked certificates are streamed into the object
+        header = json.dumps({'issuer_common_name': crl.issuer.common_name,
+                             'this_update': crl.this_update.isoformat(),
+                             'next_update': crl.next_update.isoformat()})
+        click.echo(header[:-1] + ', "revoked_certs": ', nl=False)
+        for chunk in iter_json(crl, fields):
+            click.echo(chunk, nl=False)
+        click.echo('}')
+    elif output_format != 'table':
+        write_rows(crl, fields, output_format)
+    else:
+        click.echo(f'Issuer Common Name:    {crl.issuer.common_name}')
+        click.echo(f'This update:           {crl.this_update}')
+        click.echo(f'Next update:           {crl.next_update}')
+        click.echo()
+        revoked_certs = list(crl)
+        write_rows(revoked_certs, fields, output_format)
+        if not revoked_certs:
+            click.echo('No certificates has been revoked yet!')
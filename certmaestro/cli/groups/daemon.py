@@ -0,0 +1,38 @@
+import click
+
+
+@click.command()
+@click.pass_context
+def daemon(ctx):
+    """Keep the backend ready and serve other commands from it.
+
+    While the daemon is running, certmaestro commands using the same configuration file
+    are forwarded to it through a Unix socket next to the configuration file, so they don't
+    have to set up the backend every time. The backend is set up again when the
+    configuration file changes. Set CERTMAESTRO_NO_DAEMON=1 to bypass the daemon.
+    """
+    from certmaestro import Config
+    from certmaestro.daemon import BackendDaemon, ConfigBackendLoader
+    from certmaestro.exceptions import BackendError
+    from ..utils import get_config_path
+
+    config_path = get_config_path(ctx)
+    try:
+        config = Config(config_path)
+    except FileNotFoundError:
+        raise click.UsageError(f'Configuration not found: {config_path}, run config setup first')
+
+    load_backend = ConfigBackendLoader(config)
+    try:
+        # fail early if the backend is misconfigured
+        load_backend()
+        backend_daemon = BackendDaemon(config.socket_path, load_backend)
+    except BackendError as e:
+        raise click.UsageError(str(e))
+    click.echo(f'Serving the {config.backend_name} backend on {config.socket_path}')
+    try:
+        backend_daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backend_daemon.close()
@@ -0,0 +1,55 @@
+import click
+
+
+@click.command()
+@click.option('--from', 'source_path', required=True,
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Configuration file of the backend to migrate from.')
+@click.option('--to', 'destination_path', required=True,
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Configuration file of the backend to migrate to.')
+@click.option('-b', '--batch-size', default=1000, show_default=True,
+              help='Certificates stored in one transaction.')
+@click.option('--restart', is_flag=True, help='Start again, ignoring the checkpoint.')
+@click.option('--no-verify', is_flag=True, help='Skip comparing the backends at the end.')
+def migrate(source_path, destination_path, batch_size, restart, no_verify):
+    """Move the CA and the certificates to another backend.
+
+    Certificates are copied with their private keys, where the source has them, and their
+    revocation state. The progress is saved to a checkpoint file next to the destination's
+    configuration, running the same command again continues an interrupted migration.
+    At the end, the certificates of the two backends are compared by counts and fingerprints.
+    """
+    import time
+    from pathlib import Path
+    from certmaestro import Config
+    from certmaestro.backends import get_backend
+    from certmaestro.exceptions import BackendError, MigrationError
+    from certmaestro.migrate import Migration
+
+    try:
+        source = get_backend(Config(Path(source_path)))
+        destination = get_backend(Config(Path(destination_path)))
+        checkpoint_path = Path(destination_path).with_suffix('.migration.json')
+        migration = Migration(source, destination, checkpoint_path, batch_size)
+    except (BackendError, MigrationError) as e:
+        raise click.UsageError(str(e))
+    if restart:
+        migration.remove_checkpoint()
+
+    start = time.perf_counter()
+
+    def progress(done):
+        rate = done / (time.perf_counter() - start)
+        click.echo(f'\rMigrated {done} certificates ({rate:.0f}/s)', nl=False, err=True)
+
+    try:
+        if migration.migrate_ca():
+            click.echo(f'Imported the CA into the {destination.name} backend.')
+        summary = migration.run(progress)
+        click.echo(err=True)
+        if not no_verify:
+            summary = migration.verify(summary)
+    except (BackendError, MigrationError) as e:
+        raise click.ClickException(str(e))
+    click.secho(f'Migrated from {source.name} to {destination.name}: {summary}.', fg='green')
@@ -18,7 +18,7 @@ def show_cert(ctx, hostname, port):
     import ssl
     from certmaestro.wrapper import Cert
     from certmaestro.check import parse_socket_error_message
-    from ..formatter import env
+    from ..formatter import get_env
 
     try:
         cert_pem = ssl.get_server_certificate((hostname, port))
@@ -26,21 +26,41 @@ def show_cert(ctx, hostname, port):
         click.echo('Error: ' + parse_socket_error_message(e.args[1]))
         ctx.abort()
     else:
-        template = env.get_template('certmaestro_format.jinja2')
+        template = get_env().get_template('certmaestro_format.jinja2')
         click.echo(template.render(cert=Cert(cert_pem)))
 
 
 @site.command(short_help='Check website(s) certificate(s).')
 @click.argument('urls', metavar='[SITE1] [SITE2] [...]', nargs=-1)
 @click.option('-t', '--timeout', default=3.0,
-              help='HTTP request timeout in seconds for individual requests.')
-@click.option('-r', '--retries', default=3)
+              help='Timeout in seconds for every connection attempt.')
+@click.option('-r', '--retries', default=3,
+              help='Retry connection errors and timeouts this many times.')
 @click.option('-f', '--follow-redirects', 'redirect', is_flag=True,
               help='Follow redirects (disabled by default).')
+@click.option('--hosts-file', type=click.Path(exists=True, dir_okay=False),
+              help='Resolve hostnames from this file (/etc/hosts format) instead of DNS.')
+@click.option('--timings', 'show_timings', is_flag=True,
+              help='Show DNS, connect and TLS handshake durations for every site.')
+@click.option('-i', '--input', 'input_file', type=click.File('r'),
+              help='Read sites from this file, one per line ("-" for stdin).')
+@click.option('--jsonl', is_flag=True, help='Print every result as a JSON object per line.')
+@click.option('-w', '--workers', default=3, help='Number of sites checked at the same time.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False, writable=True),
+              help='Write Prometheus metrics to this file (for the node_exporter textfile '
+                   'collector).')
+@click.option('--per-site-metrics/--no-per-site-metrics', default=False,
+              help='Export durations and certificate expiration of every site, not only totals. '
+                   'Takes memory for every site, only for a limited number of them.')
+@click.option('--tls-stats', is_flag=True,
+              help='Show how much time shared SSL contexts saved.')
 @click.pass_context
-def check(ctx, urls, timeout, retries, redirect):
+def check(ctx, urls, timeout, retries, redirect, hosts_file, show_timings, input_file, jsonl,
+          workers, metrics_file, per_site_metrics, tls_stats):
     """Checks if all of the websites have a valid certificate.
-    Accepts multiple urls or hostnames. URLs with invalid protocols will be skipped.
+    Accepts multiple urls or hostnames with optional port numbers (e.g. example.com:8443).
+    Sites can be read from a file or standard input too, which can be any long; results are
+    printed as soon as they are ready. URLs with invalid protocols will be skipped.
     This doesn't say anything about your whole webserver configuration, only check
     the certificate. Use it as a quick check!
 
@@ -50,25 +70,47 @@ def check(ctx, urls, timeout, retries, redirect):
         - 1 if there was an unknown protocol (not https://)
         - 2 if at least one failed
     """
+    import json
+    import itertools
+    from pathlib import Path
     from certmaestro.check import CheckSiteManager
+    from certmaestro.resolver import Resolver, default_resolver
+    from certmaestro.metrics import SiteCheckMetrics
 
-    if not urls:
+    if not urls and input_file is None:
         raise click.UsageError('You need to provide at least one site to check!')
 
-    click.echo('Checking certificates...')
-    manager = CheckSiteManager(urls, redirect, timeout, retries)
+    if input_file is not None:
+        urls = itertools.chain(urls, input_file)
+    if not jsonl:
+        click.echo('Checking certificates...')
+    resolver = Resolver(hosts_file=Path(hosts_file)) if hosts_file else default_resolver
+    metrics = SiteCheckMetrics(per_site=per_site_metrics) if metrics_file else None
+    manager = CheckSiteManager(urls, redirect, timeout, retries, max_workers=workers,
+                               resolver=resolver, metrics=metrics)
     for checked_site in manager.check_sites():
+        if jsonl:
+            click.echo(json.dumps(checked_site.as_dict()))
+            continue
+        timings = f' [{checked_site.timings}]' if show_timings and checked_site.timings else ''
         if checked_site.succeeded:
-            click.secho(f'Valid:     {checked_site.url}', fg='green')
+            click.secho(f'Valid:     {checked_site.url}{timings}', fg='green')
         elif checked_site.skipped:
             click.echo(f'Skipped:   {checked_site.url} ({checked_site.message})')
         elif checked_site.failed:
-            click.secho(f'Failed:    {checked_site.url} ({checked_site.message})', fg='red')
+            click.secho(f'Failed:    {checked_site.url} ({checked_site.message}){timings}',
+                        fg='red')
 
-    total_message = click.style(f'Total: {len(urls)}', fg='blue')
-    success_message = click.style(f'success: {manager.success_count}', fg='green')
-    failed_message = click.style(f'failed: {manager.fail_count}.', fg='red')
-    click.echo(f'{total_message}, {success_message}, skipped: {manager.skip_count}, {failed_message}')
+    if not jsonl:
+        total_message = click.style(f'Total: {manager.total_count}', fg='blue')
+        success_message = click.style(f'success: {manager.success_count}', fg='green')
+        failed_message = click.style(f'failed: {manager.fail_count}.', fg='red')
+        click.echo(f'{total_message}, {success_message}, skipped: {manager.skip_count}, '
+                   f'{failed_message}')
+    if tls_stats:
+        click.echo(str(manager.tls_cache.stats), err=jsonl)
+    if metrics is not None:
+        metrics.write_textfile(Path(metrics_file))
 
     if manager.fail_count > 0:
          ctx.exit(2)
@@ -76,3 +118,73 @@ def check(ctx, urls, timeout, retries, redirect):
          ctx.exit(1)
     else:
          ctx.exit(0)
+
+
+@site.command(short_help='Watch website certificates continuously.')
+@click.argument('urls', metavar='[SITE1] [SITE2] [...]', nargs=-1)
+@click.option('-s', '--state-file', type=click.Path(dir_okay=False, writable=True),
+              help='Save the state of the sites here, so it survives restarts.')
+@click.option('-t', '--timeout', default=3.0,
+              help='Timeout in seconds for every connection attempt.')
+@click.option('-r', '--retries', default=3,
+              help='Retry connection errors and timeouts this many times.')
+@click.option('--min-interval', default=5, help='Minimum minutes between checks of a site.')
+@click.option('--max-interval', default=12 * 60,
+              help='Maximum minutes between checks of a healthy site.')
+@click.option('--metrics-port', type=int,
+              help='Serve Prometheus metrics on http://localhost:PORT/metrics.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False, writable=True),
+              help='Write Prometheus metrics to this file after every round of checks.')
+@click.option('--full-handshake', is_flag=True,
+              help='Never resume TLS sessions, verify the whole certificate chain every time. '
+                   'Otherwise it happens at least hourly.')
+def watch(urls, state_file, timeout, retries, min_interval, max_interval, metrics_port,
+          metrics_file, full_handshake):
+    """Keeps checking the websites and reports when something changes.
+    Sites with certificates far from expiration are checked rarely, sites near expiration,
+    with failing checks or with recently changed certificates are checked often.
+    """
+    from pathlib import Path
+    from datetime import datetime
+    from certmaestro.check import CheckSiteManager, default_tls_cache
+    from certmaestro.watch import SiteScheduler, WatchPolicy, WatchEvent, normalize_targets, watch
+    from certmaestro.metrics import SiteCheckMetrics
+
+    if not urls:
+        raise click.UsageError('You need to provide at least one site to watch!')
+
+    targets, skipped = normalize_targets(urls)
+    for skipped_site in skipped:
+        click.echo(f'Skipped:   {skipped_site.url} ({skipped_site.message})')
+
+    policy = WatchPolicy(min_interval=min_interval * 60, max_interval=max_interval * 60)
+    state_path = Path(state_file) if state_file else None
+    scheduler = SiteScheduler(targets, state_path, policy)
+
+    colors = {WatchEvent.FAILED: 'red', WatchEvent.RECOVERED: 'green',
+              WatchEvent.CHANGED: 'yellow', WatchEvent.VALID: 'green'}
+
+    metrics = SiteCheckMetrics() if metrics_port or metrics_file else None
+    if metrics_port:
+        metrics.serve(metrics_port)
+
+    def make_manager(due_targets):
+        return CheckSiteManager(due_targets, False, timeout, retries, metrics=metrics,
+                                full_handshake=full_handshake)
+
+    def after_round():
+        if metrics_file:
+            metrics.write_textfile(Path(metrics_file))
+
+    def on_event(event):
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        message = f' ({event.message})' if event.message else ''
+        click.secho(f'{now} {event.kind.title() + ":":<10} {event.target}{message}',
+                    fg=colors[event.kind])
+
+    click.echo(f'Watching {len(scheduler)} sites...')
+    try:
+        watch(scheduler, make_manager, on_event, after_round)
+    except KeyboardInterrupt:
+        scheduler.save()
+        click.echo(str(default_tls_cache.stats))
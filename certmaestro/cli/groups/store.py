@@ -0,0 +1,28 @@
+import click
+from .config import ensure_config
+
+
+@click.group()
+def store():
+    """Manage how the backend stores certificates."""
+
+
+@store.command()
+@ensure_config
+def pack(obj):
+    """Pack the issued certificates into one file.
+
+    Listing and looking up certificates is faster from the packed store, because
+    certificates don't have to be read from separate files one by one. Newly issued
+    certificates are added to it automatically.
+    """
+    from certmaestro.exceptions import BackendError
+
+    pack_certs = getattr(obj.backend, 'pack_certs', None)
+    if pack_certs is None:
+        raise click.UsageError(f'The {obj.backend.name} backend has no packed store.')
+    try:
+        count = pack_certs()
+    except BackendError as e:
+        raise click.UsageError(str(e))
+    click.echo(f'Packed {count} certificates.')
@@ -0,0 +1,181 @@
+"""
+    Output formats of the listing commands. Rows are written as they are read in the json,
+    jsonl and csv formats, only the table format has to see every row before printing.
+    Only the values of the selected fields are computed, so unused parts of the
+    certificates are never parsed.
+"""
+import sys
+import csv
+import json
+import datetime
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Iterable, List, Optional, Sequence
+import attr
+import click
+
+
+FORMATS = ('table', 'json', 'jsonl', 'csv')
+
+
+@attr.s(slots=True)
+class Field:
+    name = attr.ib()
+    header = attr.ib()
+    get = attr.ib()
+
+
+def _fields(*fields):
+    return OrderedDict((field.name, field) for field in fields)
+
+
+CERT_FIELDS = _fields(
+    Field('common_name', 'Common Name', lambda c: c.subject.common_name),
+    Field('serial_number', 'Serial Number', lambda c: c.serial_number),
+    Field('not_valid_before', 'Not valid before', lambda c: c.not_valid_before),
+    Field('not_valid_after', 'Not valid after', lambda c: c.not_valid_after),
+    Field('subject', 'Subject', lambda c: c.subject),
+    Field('issuer', 'Issuer', lambda c: c.issuer),
+    Field('version', 'Version', lambda c: c.version),
+    Field('ca', 'CA', lambda c: c.ca),
+    Field('max_path_length', 'Path length', lambda c: c.max_path_length),
+    Field('key_usages', 'Key Usages', lambda c: list(c.key_usages)),
+    Field('extended_key_usages', 'Extended Key Usages', lambda c: list(c.extended_key_usages)),
+    Field('dns_names', 'DNS Names', lambda c: c.dns_names),
+    Field('ip_addresses', 'IP Addresses', lambda c: c.ip_addresses),
+    Field('key_algorithm', 'Key Algorithm', lambda c: c.public_key.algorithm),
+    Field('key_size', 'Key Size', lambda c: c.public_key.bit_size),
+    Field('signature_algorithm', 'Signature Algorithm', lambda c: c.signature_algorithm),
+    Field('sha1_fingerprint', 'SHA-1 Fingerprint', lambda c: c.sha1_fingerprint),
+    Field('sha256_fingerprint', 'SHA-256 Fingerprint', lambda c: c.sha256_fingerprint),
+    Field('spki_sha256', 'SPKI SHA-256', lambda c: c.spki_sha256),
+)
+
+REVOKED_CERT_FIELDS = _fields(
+    Field('revocation_date', 'Revocation Date', lambda rc: rc.revocation_date),
+    Field('invalidity_date', 'Invalidity Date', lambda rc: rc.invalidity_date),
+    Field('reason', 'Reason', lambda rc: rc.reason),
+    Field('serial_number', 'Serial Number', lambda rc: rc.serial_number),
+)
+
+
+def format_options(all_fields: 'OrderedDict[str, Field]',
+                   default_fields: Optional[Sequence[str]]=None):
+    """--format and --fields options, the command gets the format and the list of Fields.
+    Without default_fields, the fields are None when not given.
+    """
+    def parse_fields(ctx, param, value):
+        if value is None:
+            return [all_fields[name] for name in default_fields] if default_fields else None
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        if not names:
+            raise click.BadParameter('no fields given')
+        unknown = [name for name in names if name not in all_fields]
+        if unknown:
+            raise click.BadParameter(f'unknown fields: {", ".join(unknown)}, '
+                                     f'choose from: {", ".join(all_fields)}')
+        return [all_fields[name] for name in names]
+
+    fields_help = f'Comma separated fields to show: {", ".join(all_fields)}.'
+
+    def decorator(command):
+        command = click.option('--fields', callback=parse_fields, metavar='FIELD,...',
+                               help=fields_help)(command)
+        command = click.option('-o', '--format', 'output_format', type=click.Choice(FORMATS),
+                               default='table', show_default=True,
+                               help='Output format, json, jsonl and csv are streamed.')(command)
+        return command
+    return decorator
+
+
+def write_rows(items: Iterable, fields: List[Field], output_format: str):
+    """Write a row with the values of the fields for every item. The streamed formats are
+    flushed after every row, stdout is block-buffered when piped into another program.
+    """
+    stream = sys.stdout
+    if output_format == 'table':
+        _write_table(_rows(items, fields), fields, stream)
+    elif output_format == 'csv':
+        _write_csv(_rows(items, fields), fields, stream)
+    else:
+        for chunk in iter_json(items, fields, lines=output_format == 'jsonl'):
+            stream.write(chunk)
+            stream.flush()
+        if output_format == 'json':
+            stream.write('\n')
+
+
+def iter_json(items: Iterable, fields: List[Field], lines=False):
+    """A JSON array of objects, or an object on every line, in chunks of one item."""
+    names = [field.name for field in fields]
+    rows = _rows(items, fields)
+    if lines:
+        for row in rows:
+            yield json.dumps(dict(zip(names, row)), default=_json_value) + '\n'
+        return
+    separator = '['
+    for row in rows:
+        yield separator + '\n' + json.dumps(dict(zip(names, row)), default=_json_value)
+        separator = ','
+    yield '[]' if separator == '[' else '\n]'
+
+
+def tag_fields(fields: List[Field]) -> List[Field]:
+    """Fields of (backend name, item) pairs, the first one is the name of the backend."""
+    return [Field('backend', 'Backend', itemgetter(0))] + [
+        Field(field.name, field.header, lambda item, get=field.get: get(item[1]))
+        for field in fields]
+
+
+def _rows(items, fields):
+    return (tuple(field.get(item) for field in fields) for item in items)
+
+
+def _write_table(rows, fields, stream):
+    from tabulate import tabulate
+
+    rows = ([_text_value(value) for value in row] for row in rows)
+    stream.write(tabulate(rows, headers=[field.header for field in fields], numalign='left'))
+    stream.write('\n')
+
+
+def _write_csv(rows, fields, stream):
+    writer = csv.writer(stream, lineterminator='\n')
+    writer.writerow(field.name for field in fields)
+    stream.flush()
+    for row in rows:
+        writer.writerow(_csv_value(value) for value in row)
+        stream.flush()
+
+
+def _native(value):
+    # asn1crypto values, like the revocation reason, and Names
+    return getattr(value, 'native', value)
+
+
+def _json_value(value):
+    value = _native(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, bytes):
+        return value.hex(':')
+    return str(value)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return _text_value(value)
+
+
+def _text_value(value):
+    if value is None:
+        return ''
+    value = _native(value)
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(_native(v)) for v in value)
+    if isinstance(value, dict):
+        return ', '.join(f'{field}={v}' for field, v in value.items())
+    return value
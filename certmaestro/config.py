@@ -1,6 +1,10 @@
+import re
+import hashlib
 from pathlib import Path
+from typing import List, Mapping
 from configparser import ConfigParser, RawConfigParser
 import attr
+from .exceptions import ConfigurationError
 
 
 CERT_FIELDS = (
@@ -15,11 +19,16 @@ CERT_FIELDS = (
 
 
 class Config:
+    """Every backend has a section named by the user, the type of the backend is in its type
+    option. Without a type option, the section name is the type, e.g. [OpenSSL].
+    The backend option of the [certmaestro] section is the name of the current backend.
+    """
     DEFAULT_PATH = Path('~/.config/certmaestro/certmaestro.ini').expanduser()
 
     def __init__(self, path: Path=DEFAULT_PATH):
         self.path = path.resolve()
         self._cfg = ConfigParser()
+        self._selected = None
         with self.path.open() as f:
             self._cfg.read_file(f)
 
@@ -30,8 +39,19 @@ class Config:
         self.path.parent.mkdir(parents=True, exist_ok=True)
         self._cfg = ConfigParser()
         self._cfg.add_section('certmaestro')
+        self._selected = None
         return self
 
+    def select(self, backend_name: str) -> 'Config':
+        """The same configuration with another current backend, which is not saved."""
+        if backend_name not in self.backend_names:
+            raise ConfigurationError(f'No backend named "{backend_name}" in {self.path}')
+        config = object.__new__(self.__class__)
+        config.path = self.path
+        config._cfg = self._cfg
+        config._selected = backend_name
+        return config
+
     def __repr__(self):
         return f'<Certmaestro Config: {self.path}>'
 
@@ -42,24 +62,64 @@ class Config:
         self._cfg.set('certmaestro', name, value)
 
     def reload(self):
-        self._cfg.read(self.path)
+        # read() would merge into the current values, keeping removed options and sections
+        cfg = ConfigParser()
+        with self.path.open() as f:
+            cfg.read_file(f)
+        self._cfg = cfg
 
     def save(self):
         with self.path.open('w') as configfile:
             self._cfg.write(configfile)
 
+    @property
+    def backend_names(self) -> List[str]:
+        return [name for name in self._cfg.sections() if name != 'certmaestro']
+
     @property
     def backend_name(self):
-        return self._cfg.get('certmaestro', 'backend')
+        return self._selected or self._cfg.get('certmaestro', 'backend')
 
     @backend_name.setter
     def backend_name(self, value):
-        self._cfg.add_section(value)
+        if not self._cfg.has_section(value):
+            self._cfg.add_section(value)
         self._cfg.set('certmaestro', 'backend', value)
+        self._selected = None
+
+    @property
+    def backend_type(self) -> str:
+        """Name of the backend class, as in certmaestro.backends."""
+        return self._cfg.get(self.backend_name, 'type', fallback=self.backend_name)
+
+    @property
+    def backend_config(self) -> dict:
+        return {name: value for name, value in self._cfg[self.backend_name].items()
+                if name != 'type'}
+
+    def add_backend(self, name: str, backend_type: str, params: Mapping[str, str]):
+        if self._cfg.has_section(name):
+            raise ConfigurationError(f'There is already a backend named "{name}"')
+        self._cfg.add_section(name)
+        if name != backend_type:
+            self._cfg.set(name, 'type', backend_type)
+        for param, value in params.items():
+            self._cfg.set(name, param, value)
+
+    @property
+    def socket_path(self) -> Path:
+        """Unix socket of the daemon serving the backend of this configuration."""
+        return self.path.with_suffix('.sock')
 
     @property
-    def backend_config(self):
-        return self._cfg[self.backend_name]
+    def index_path(self) -> Path:
+        """Search index of the backend's certificates, see certmaestro.index.
+        Section names are case sensitive and can have any character, the hash keeps
+        the file names of similar ones like "Prod CA" and "prod-ca" apart.
+        """
+        slug = re.sub(r'[^a-z0-9]+', '-', self.backend_name.lower()).strip('-')
+        digest = hashlib.sha256(self.backend_name.encode()).hexdigest()[:8]
+        return self.path.parent / 'index' / f'{slug}-{digest}.sqlite3'.lstrip('-')
 
 
 def strtobool(value):
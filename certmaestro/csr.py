@@ -0,0 +1,51 @@
+"""
+    Subject fields of a new certificate, collected according to the policy of the CA.
+"""
+from enum import Enum
+from typing import Mapping
+
+
+class CsrPolicy(Enum):
+    REQUIRED = 'required'
+    OPTIONAL = 'optional'
+    # has to be the same as in the CA certificate
+    FROMCA = 'fromca'
+
+
+# field names of certmaestro.config.CERT_FIELDS with the OpenSSL short names, in subject order
+SUBJECT_FIELDS = (
+    ('country', 'C'),
+    ('state', 'ST'),
+    ('locality', 'L'),
+    ('org_name', 'O'),
+    ('org_unit', 'OU'),
+    ('common_name', 'CN'),
+    ('email', 'emailAddress'),
+)
+
+
+class CsrBuilder:
+    """Values of the subject fields, starting from the backend's defaults."""
+
+    def __init__(self, policy: Mapping[str, CsrPolicy], defaults: Mapping[str, str]):
+        self.policy = dict(policy)
+        self._values = {field: defaults.get(field) for field, _ in SUBJECT_FIELDS}
+
+    def __getitem__(self, field):
+        return self._values[field]
+
+    def __setitem__(self, field, value):
+        if field not in self._values:
+            raise KeyError(field)
+        self._values[field] = value
+
+    @property
+    def common_name(self):
+        return self._values['common_name']
+
+    @property
+    def subject(self) -> str:
+        """Subject in OpenSSL's -subj format: /C=HU/CN=example.com, empty fields are left out."""
+        return ''.join(f'/{short_name}=' + value.replace('/', '\\/')
+                       for field, short_name in SUBJECT_FIELDS
+                       for value in [self._values[field]] if value)
@@ -0,0 +1,321 @@
+"""
+    Daemon keeping a backend initialized, serving it to CLI commands over a Unix socket,
+    so they don't have to read the configuration and set up the backend on every call.
+
+    The protocol is one JSON object per line. Requests are {"method": ..., "params": {...}},
+    responses are {"result": ...} or {"error": {"type": ..., "message": ...}}. Methods
+    returning many items answer with {"item": ...} lines, followed by {"end": true}.
+    Certificates, keys and CRLs are sent as base64 encoded DER or PEM.
+"""
+import os
+import json
+import base64
+import socket
+import threading
+import datetime
+import contextlib
+import socketserver
+from pathlib import Path
+from types import GeneratorType
+from typing import Callable, Iterator, Optional
+import attr
+import asn1crypto.crl as asn1crl
+from .backends.interfaces import CertQuery, IBackend
+from .csr import SUBJECT_FIELDS, CsrBuilder, CsrPolicy
+from .exceptions import BackendError
+from .wrapper import Cert, Crl, PrivateKey, RevokedCert, SerialNumber
+
+
+NO_DAEMON_ENV = 'CERTMAESTRO_NO_DAEMON'
+
+
+def _encode_der(der: bytes) -> str:
+    return base64.b64encode(der).decode('ascii')
+
+
+def _decode_der(text: str) -> bytes:
+    return base64.b64decode(text)
+
+
+_QUERY_TIMES = ('issued_after', 'issued_before', 'expires_after', 'expires_before')
+
+
+def _encode_query(query: CertQuery) -> dict:
+    params = attr.asdict(query, recurse=False)
+    for name in _QUERY_TIMES:
+        if params[name] is not None:
+            params[name] = params[name].isoformat()
+    if query.after is not None:
+        # the key is (not valid after, serial number) or (serial number,)
+        *not_after, serial_number = query.after
+        params['after'] = {'serial_number': str(serial_number),
+                           'not_after': not_after[0].isoformat() if not_after else None}
+    return params
+
+
+def _decode_query(params: dict) -> CertQuery:
+    params = dict(params)
+    for name in _QUERY_TIMES:
+        if params.get(name) is not None:
+            params[name] = datetime.datetime.fromisoformat(params[name])
+    after = params.pop('after', None)
+    query = CertQuery(**params)
+    if after is not None:
+        not_after = after['not_after']
+        query = attr.evolve(query, after=query.key(
+            SerialNumber(after['serial_number']),
+            datetime.datetime.fromisoformat(not_after) if not_after is not None else None))
+    return query
+
+
+def _list_certs(backend, query=None):
+    query = _decode_query(query) if query is not None else None
+    return (_encode_der(cert.der) for cert in backend.list_certs(query))
+
+
+def _issue_cert(backend, policy, values):
+    policy = {field: CsrPolicy(value) if value is not None else None
+              for field, value in policy.items()}
+    key, cert = backend.issue_cert(CsrBuilder(policy, values))
+    return {'key': str(key), 'cert': _encode_der(cert.der)}
+
+
+def _revoke_cert(backend, serial):
+    revoked_cert = backend.revoke_cert(serial)
+    return _encode_der(revoked_cert.der) if revoked_cert is not None else None
+
+
+def _get_crl(backend):
+    crl = backend.get_crl()
+    return _encode_der(crl.der) if crl is not None else None
+
+
+def _get_csr_policy(backend):
+    return {field: policy.value if policy is not None else None
+            for field, policy in backend.get_csr_policy().items()}
+
+
+def _pack_certs(backend):
+    pack_certs = getattr(backend, 'pack_certs', None)
+    if pack_certs is None:
+        raise BackendError(f'The {backend.name} backend has no packed store.')
+    return pack_certs()
+
+
+_METHODS = {
+    'info': lambda backend: {'name': backend.name, 'description': backend.description,
+                             'threadsafe': backend.threadsafe},
+    'version': lambda backend: backend.version,
+    'get_ca_cert': lambda backend: _encode_der(backend.get_ca_cert().der),
+    'get_cert': lambda backend, serial: _encode_der(backend.get_cert(serial).der),
+    'list_certs': _list_certs,
+    'get_crl': _get_crl,
+    'get_csr_policy': _get_csr_policy,
+    'get_csr_defaults': lambda backend: backend.get_csr_defaults(),
+    'issue_cert': _issue_cert,
+    'revoke_cert': _revoke_cert,
+    'pack_certs': _pack_certs,
+}
+
+
+class ConfigBackendLoader:
+    """Makes the backend from the configuration, again if the configuration file changed."""
+
+    def __init__(self, config):
+        self.config = config
+        self._backend = None
+        self._mtime = None
+
+    def __call__(self) -> IBackend:
+        from .backends import get_backend
+
+        mtime = self.config.path.stat().st_mtime_ns
+        if self._backend is None or mtime != self._mtime:
+            self.config.reload()
+            self._backend = get_backend(self.config)
+            self._mtime = mtime
+        return self._backend
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            self.server.backend_daemon.handle(json.loads(line), self._write)
+
+    def _write(self, message):
+        self.wfile.write(json.dumps(message).encode() + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class BackendDaemon:
+    """Serves the backend returned by load_backend() on a Unix socket, which only the
+    current user can access, because private keys are sent through it.
+    Calls are serialized if the backend is not thread-safe.
+    """
+
+    def __init__(self, socket_path: Path, load_backend: Callable[[], IBackend]):
+        self.socket_path = Path(socket_path)
+        self._load_backend = load_backend
+        self._lock = threading.Lock()
+        if connect(self.socket_path) is not None:
+            raise BackendError(f'A daemon is already running on {self.socket_path}')
+        with contextlib.suppress(FileNotFoundError):
+            # left behind by a daemon which didn't exit cleanly
+            self.socket_path.unlink()
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _Server(str(self.socket_path), _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.backend_daemon = self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    def close(self):
+        self._server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            self.socket_path.unlink()
+
+    def handle(self, request, write):
+        try:
+            backend = self._load_backend()
+            handler = _METHODS.get(request.get('method'))
+            if handler is None:
+                raise BackendError(f'Unknown method: {request.get("method")}')
+            lock = self._lock if not backend.threadsafe else contextlib.nullcontext()
+            with lock:
+                result = handler(backend, **request.get('params', {}))
+                if isinstance(result, GeneratorType):
+                    for item in result:
+                        write({'item': item})
+                    write({'end': True})
+                else:
+                    write({'result': result})
+        except Exception as e:
+            write({'error': {'type': e.__class__.__name__, 'message': str(e)}})
+
+
+def connect(socket_path: Path) -> Optional['RemoteBackend']:
+    """RemoteBackend if a daemon is running on socket_path, None otherwise."""
+    if not Path(socket_path).exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return RemoteBackend(sock)
+
+
+class RemoteBackend(IBackend):
+    """Forwards every call to the backend of a running daemon."""
+    init_requires = ()
+
+    def __init__(self, sock: socket.socket):
+        self._sock = sock
+        self._file = sock.makefile('rwb')
+        self._streaming = False
+        self._info = self._call('info')
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    @property
+    def name(self):
+        return self._info['name']
+
+    @property
+    def description(self):
+        return self._info['description']
+
+    @property
+    def threadsafe(self):
+        # one connection can't be used from multiple threads
+        return False
+
+    @property
+    def version(self):
+        return self._call('version')
+
+    def _send(self, method, params):
+        if self._streaming:
+            raise BackendError('The previous list has to be read to the end before a new call')
+        self._file.write(json.dumps({'method': method, 'params': params}).encode() + b'\n')
+        self._file.flush()
+
+    def _receive(self):
+        line = self._file.readline()
+        if not line:
+            raise BackendError('The daemon closed the connection')
+        message = json.loads(line)
+        if 'error' in message:
+            error = message['error']
+            if error['type'] == 'BackendError':
+                raise BackendError(error['message'])
+            raise BackendError(f'{error["type"]}: {error["message"]}')
+        return message
+
+    def _call(self, method, **params):
+        self._send(method, params)
+        return self._receive()['result']
+
+    def _iter_call(self, method, **params) -> Iterator:
+        self._send(method, params)
+        self._streaming = True
+        try:
+            while True:
+                message = self._receive()
+                if message.get('end'):
+                    return
+                yield message['item']
+        finally:
+            self._streaming = False
+
+    def get_ca_cert(self) -> Cert:
+        return Cert.from_der(_decode_der(self._call('get_ca_cert')))
+
+    def get_csr_policy(self):
+        return {field: CsrPolicy(value) if value is not None else None
+                for field, value in self._call('get_csr_policy').items()}
+
+    def get_csr_defaults(self):
+        return self._call('get_csr_defaults')
+
+    def issue_cert(self, csr: CsrBuilder) -> (PrivateKey, Cert):
+        policy = {field: policy.value if policy is not None else None
+                  for field, policy in csr.policy.items()}
+        values = {field: csr[field] for field, _ in SUBJECT_FIELDS}
+        result = self._call('issue_cert', policy=policy, values=values)
+        return PrivateKey(result['key']), Cert.from_der(_decode_der(result['cert']))
+
+    def revoke_cert(self, serial: str) -> RevokedCert:
+        der = self._call('revoke_cert', serial=serial)
+        if der is None:
+            return None
+        return RevokedCert.from_asn1(asn1crl.RevokedCertificate.load(_decode_der(der)))
+
+    def list_certs(self, query: Optional[CertQuery]=None) -> Iterator[Cert]:
+        params = {'query': _encode_query(query)} if query is not None else {}
+        for der in self._iter_call('list_certs', **params):
+            yield Cert.from_der(_decode_der(der))
+
+    def get_cert(self, serial: str) -> Cert:
+        return Cert.from_der(_decode_der(self._call('get_cert', serial=serial)))
+
+    def get_crl(self) -> Optional[Crl]:
+        der = self._call('get_crl')
+        if der is None:
+            return None
+        return Crl.from_asn1(asn1crl.CertificateList.load(_decode_der(der)))
+
+    def pack_certs(self) -> int:
+        return self._call('pack_certs')
@@ -24,9 +24,17 @@ class BackendError(CertmaestroError):
     """
 
 
+class ChainError(CertmaestroError):
+    """A certificate chain can't be built, or it's not valid."""
+
+
 class UrlParseError(ValueError, CertmaestroError):
     "Raised when parse_url or similar fails to parse the URL input."
 
     def __init__(self, location):
         super().__init__("Failed to parse: %s" % location)
         self.location = location
+
+
+class MigrationError(CertmaestroError):
+    """Certificates can't be moved between the backends, or they differ after moving."""
@@ -0,0 +1,124 @@
+"""
+    Reading from several backends at once. Every backend is read in its own thread into a
+    bounded queue, and the items are tagged with the name of their backend. They are merged
+    as they arrive, or in key order with a k-way merge. A backend which fails, or doesn't
+    answer in time, is left out and its error is kept, it doesn't stop the others.
+"""
+import heapq
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Tuple
+
+
+# items read ahead from one backend
+QUEUE_SIZE = 1000
+_END = object()
+
+
+class _Failure:
+    __slots__ = ('error',)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class Federation:
+    """Items of the sources: {name: function returning an iterable}, every function is
+    called in its own thread. Waiting for an item of a source longer than timeout seconds
+    drops the source.
+    """
+
+    def __init__(self, sources: Mapping[str, Callable[[], Iterable]],
+                 timeout: Optional[float]=None, queue_size=QUEUE_SIZE):
+        self.sources = dict(sources)
+        self.timeout = timeout
+        self.queue_size = queue_size
+        # name -> exception, of the sources which failed or timed out
+        self.errors = {}
+        self._stop = threading.Event()
+
+    def unordered(self) -> Iterator[Tuple[str, object]]:
+        """(name, item) pairs as soon as any of the sources has one."""
+        items = queue.Queue(self.queue_size)
+        running = set(self.sources)
+        for name in self.sources:
+            self._start(name, items)
+        try:
+            while running:
+                try:
+                    name, item = items.get(timeout=self.timeout)
+                except queue.Empty:
+                    for name in running:
+                        self.errors[name] = self._timeout_error()
+                    return
+                if item is _END or isinstance(item, _Failure):
+                    running.discard(name)
+                    if item is not _END:
+                        self.errors[name] = item.error
+                else:
+                    yield name, item
+        finally:
+            self.close()
+
+    def merged(self, key: Callable) -> Iterator[Tuple[str, object]]:
+        """(name, item) pairs in key order, every source has to yield its items in key order.
+        The next item can only be given when every source has one ready, so a slow source
+        delays the others by timeout seconds at most.
+        """
+        queues = {name: queue.Queue(self.queue_size) for name in self.sources}
+        for name, items in queues.items():
+            self._start(name, items)
+        heap = []
+        try:
+            for index, name in enumerate(queues):
+                self._push_next(heap, key, index, name, queues[name])
+            while heap:
+                _, index, name, item = heapq.heappop(heap)
+                yield name, item
+                self._push_next(heap, key, index, name, queues[name])
+        finally:
+            self.close()
+
+    def _push_next(self, heap, key, index, name, items):
+        try:
+            _, item = items.get(timeout=self.timeout)
+        except queue.Empty:
+            self.errors[name] = self._timeout_error()
+            return
+        if isinstance(item, _Failure):
+            self.errors[name] = item.error
+        elif item is not _END:
+            # the index breaks ties, items themselves might not be comparable
+            heapq.heappush(heap, (key(item), index, name, item))
+
+    def _timeout_error(self):
+        return TimeoutError(f'No answer in {self.timeout:g} seconds')
+
+    def _start(self, name, items):
+        # daemon threads, a backend hanging in a call doesn't keep the process running
+        threading.Thread(target=self._read, args=(name, items), name=f'federation-{name}',
+                         daemon=True).start()
+
+    def _read(self, name, items):
+        try:
+            for item in self.sources[name]():
+                if not self._put(items, (name, item)):
+                    return
+        except Exception as e:
+            self._put(items, (name, _Failure(e)))
+        else:
+            self._put(items, (name, _END))
+
+    def _put(self, items, message) -> bool:
+        """Wait while the queue is full, returns False when the reader stopped."""
+        while not self._stop.is_set():
+            try:
+                items.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def close(self):
+        """Stop reading the sources, e.g. when not all items are needed."""
+        self._stop.set()
@@ -0,0 +1,301 @@
+"""
+    Inverted index over the certificates of a backend, so they can be searched by name,
+    IP address, issuer or fingerprint without parsing every certificate.
+    The index is an SQLite database, stored next to the configuration file.
+"""
+import base64
+import binascii
+import functools
+import sqlite3
+import datetime
+import ipaddress
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+import attr
+from .wrapper import Cert, SerialNumber
+
+
+NAME_FIELDS = ('cn', 'san')
+FINGERPRINT_FIELDS = ('sha1', 'sha256', 'spki')
+FIELDS = NAME_FIELDS + ('ip', 'issuer') + FINGERPRINT_FIELDS
+GLOB_CHARS = '*?['
+# sorts after every other character, so prefix + _MAX_CHAR is the upper bound of a prefix range
+_MAX_CHAR = '\U0010ffff'
+_BATCH_SIZE = 10_000
+# writing methods only some backends have, the index is rebuilt after them
+_BULK_WRITES = ('issue_certs', 'revoke_certs', 'import_certs', 'import_records')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS certs (
+    serial TEXT PRIMARY KEY,
+    common_name TEXT,
+    not_after TEXT,
+    revoked INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS terms (field TEXT, term TEXT, reversed TEXT, serial TEXT);
+"""
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS terms_by_term ON terms (field, term);
+CREATE INDEX IF NOT EXISTS terms_by_reversed ON terms (field, reversed)
+    WHERE reversed IS NOT NULL;
+CREATE INDEX IF NOT EXISTS terms_by_serial ON terms (serial);
+"""
+_DROP_INDEXES = """
+DROP INDEX IF EXISTS terms_by_term;
+DROP INDEX IF EXISTS terms_by_reversed;
+DROP INDEX IF EXISTS terms_by_serial;
+"""
+
+
+def _plain_hex(fingerprint: str):
+    return fingerprint.replace(':', '').lower()
+
+
+@attr.s(slots=True, frozen=True)
+class IndexEntry:
+    """What is stored about one certificate. Terms are (field, term) pairs, lowercase."""
+    serial_number = attr.ib()
+    common_name = attr.ib()
+    not_valid_after = attr.ib()
+    terms = attr.ib()
+    revoked = attr.ib(default=False)
+
+    @classmethod
+    def from_cert(cls, cert: Cert, revoked=False):
+        terms = set()
+        common_name = cert.subject.common_name
+        if common_name:
+            terms.add(('cn', common_name.lower()))
+        terms.update(('san', name.lower()) for name in cert.dns_names)
+        terms.update(('ip', str(ipaddress.ip_address(ip))) for ip in cert.ip_addresses)
+        issuer_name = cert.issuer.common_name
+        if issuer_name:
+            terms.add(('issuer', issuer_name.lower()))
+        terms.add(('sha1', _plain_hex(cert.sha1_fingerprint)))
+        terms.add(('sha256', _plain_hex(cert.sha256_fingerprint)))
+        terms.add(('spki', _plain_hex(cert.spki_sha256)))
+        return cls(cert.serial_number, common_name, cert.not_valid_after, frozenset(terms),
+                   revoked)
+
+
+@attr.s(slots=True, frozen=True)
+class SearchResult:
+    serial_number = attr.ib()
+    common_name = attr.ib()
+    not_valid_after = attr.ib()
+    revoked = attr.ib()
+    field = attr.ib()
+    term = attr.ib()
+
+
+def guess_fields(query: str) -> Sequence[str]:
+    """Fields to search in when they are not given explicitly."""
+    plain = _plain_hex(query)
+    if all(c in '0123456789abcdef' for c in plain):
+        if len(plain) == 40:
+            return ('sha1',)
+        elif len(plain) == 64:
+            return ('sha256', 'spki')
+    try:
+        ipaddress.ip_address(query)
+    except ValueError:
+        return NAME_FIELDS
+    return ('ip',)
+
+
+def _normalize(field, query):
+    query = query.strip()
+    if field == 'spki' and len(query) == 44 and query.endswith('='):
+        # base64 form of key pins (pin-sha256), as in HPKP and curl --pinnedpubkey
+        try:
+            return base64.b64decode(query, validate=True).hex()
+        except binascii.Error:
+            pass
+    if field in FINGERPRINT_FIELDS:
+        return _plain_hex(query)
+    elif field == 'ip':
+        try:
+            return str(ipaddress.ip_address(query))
+        except ValueError:
+            pass
+    return query.lower()
+
+
+class CertIndex:
+    """Maps names, addresses and fingerprints to certificate serial numbers.
+    Queries use the SQLite indexes: exact terms, prefixes and suffixes (with the reversed
+    terms) are looked up, so searching is fast even with hundreds of thousands certificates.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path))
+        self._db.executescript(_SCHEMA + _INDEXES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM certs').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    @property
+    def built_at(self) -> Optional[datetime.datetime]:
+        """When the index was last fully rebuilt, None if it has never been built."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row is not None else None
+
+    def rebuild(self, entries: Iterable[IndexEntry]):
+        """Replace the whole index in one transaction, readers see the old one until done."""
+        with self._db:
+            self._db.execute('DELETE FROM terms')
+            self._db.execute('DELETE FROM certs')
+            # building the indexes at the end is a lot faster than updating them on every insert
+            for statement in _DROP_INDEXES.split(';')[:-1]:
+                self._db.execute(statement)
+            batch = []
+            for entry in entries:
+                batch.append(entry)
+                if len(batch) == _BATCH_SIZE:
+                    self._insert(batch)
+                    batch = []
+            self._insert(batch)
+            for statement in _INDEXES.split(';')[:-1]:
+                self._db.execute(statement)
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (now,))
+
+    def add(self, entry: IndexEntry):
+        """Add or update one certificate, e.g. after it has been issued."""
+        with self._db:
+            self._delete(entry.serial_number.as_hex())
+            self._insert([entry])
+
+    def remove(self, serial: str):
+        with self._db:
+            self._delete(SerialNumber(serial).as_hex())
+
+    def mark_revoked(self, serial: str):
+        with self._db:
+            self._db.execute('UPDATE certs SET revoked = 1 WHERE serial = ?',
+                             (SerialNumber(serial).as_hex(),))
+
+    def invalidate(self):
+        """Mark the index stale, so the next search rebuilds it."""
+        with self._db:
+            self._db.execute("DELETE FROM meta WHERE key = 'built_at'")
+
+    def _delete(self, serial_hex):
+        self._db.execute('DELETE FROM terms WHERE serial = ?', (serial_hex,))
+        self._db.execute('DELETE FROM certs WHERE serial = ?', (serial_hex,))
+
+    def _insert(self, entries):
+        cert_rows, term_rows = [], []
+        for entry in entries:
+            serial_hex = entry.serial_number.as_hex()
+            cert_rows.append((serial_hex, entry.common_name, entry.not_valid_after.isoformat(),
+                              int(entry.revoked)))
+            # only names are searched by suffix
+            term_rows.extend((field, term, term[::-1] if field in NAME_FIELDS else None,
+                              serial_hex) for field, term in entry.terms)
+        self._db.executemany('INSERT OR REPLACE INTO certs VALUES (?, ?, ?, ?)', cert_rows)
+        self._db.executemany('INSERT INTO terms VALUES (?, ?, ?, ?)', term_rows)
+
+    def search(self, query: str, fields: Optional[Sequence[str]]=None) -> Iterator[SearchResult]:
+        """Find certificates by a term in the given fields (guessed from the query if None).
+        The query can be an exact term, a suffix starting with a dot (.example.com) or a
+        shell-style pattern (api-*.example.com). Exact names match wildcard certificates too.
+        Every certificate is returned once, ordered by expiration.
+        """
+        fields = fields or guess_fields(query.strip())
+        found = {}
+        for field in fields:
+            for row in self._search_field(field, _normalize(field, query)):
+                found.setdefault(row[0], row)
+        rows = sorted(found.values(), key=lambda row: (row[2], row[0]))
+        for serial_hex, common_name, not_after, revoked, field, term in rows:
+            yield SearchResult(SerialNumber(serial_hex), common_name,
+                               datetime.datetime.fromisoformat(not_after), bool(revoked),
+                               field, term)
+
+    def _search_field(self, field, term):
+        if any(c in term for c in GLOB_CHARS):
+            condition, params = self._glob_condition(field, term)
+        elif term.startswith('.') and field in NAME_FIELDS:
+            condition, params = self._prefix_condition('reversed', term[::-1])
+        elif field in NAME_FIELDS and '.' in term:
+            # *.example.com covers api.example.com
+            condition = 't.term IN (?, ?)'
+            params = (term, '*.' + term.split('.', 1)[1])
+        else:
+            condition, params = 't.term = ?', (term,)
+        sql = ('SELECT c.serial, c.common_name, c.not_after, c.revoked, t.field, t.term '
+               'FROM terms t JOIN certs c ON c.serial = t.serial '
+               f'WHERE t.field = ? AND {condition}')
+        return self._db.execute(sql, (field, *params))
+
+    def _glob_condition(self, field, pattern):
+        first_glob = min(pattern.find(c) for c in GLOB_CHARS if c in pattern)
+        last_glob = max(pattern.rfind(c) for c in GLOB_CHARS + ']')
+        prefix, suffix = pattern[:first_glob], pattern[last_glob + 1:]
+        # narrow down with the index on the longer literal part, GLOB filters the rest
+        if len(prefix) >= len(suffix) or field not in NAME_FIELDS:
+            condition, params = self._prefix_condition('term', prefix)
+        else:
+            condition, params = self._prefix_condition('reversed', suffix[::-1])
+        return f'{condition} AND t.term GLOB ?', (*params, pattern)
+
+    @staticmethod
+    def _prefix_condition(column, prefix):
+        if not prefix:
+            return '1', ()
+        return f't.{column} >= ? AND t.{column} < ?', (prefix, prefix + _MAX_CHAR)
+
+
+class IndexingBackend:
+    """Forwards everything to the backend and keeps its search index up to date with the
+    certificates issued and revoked through it. Bulk writes only invalidate the index.
+    Nothing is done until the first search has built the index.
+    """
+
+    def __init__(self, backend, index_path: Path):
+        self._backend = backend
+        self.index_path = Path(index_path)
+
+    def __getattr__(self, name):
+        value = getattr(self._backend, name)
+        if name in _BULK_WRITES:
+            return self._invalidating(value)
+        return value
+
+    def issue_cert(self, csr):
+        key, cert = self._backend.issue_cert(csr)
+        self._update('add', IndexEntry.from_cert(cert))
+        return key, cert
+
+    def revoke_cert(self, serial: str, *args, **kwargs):
+        revoked_cert = self._backend.revoke_cert(serial, *args, **kwargs)
+        self._update('mark_revoked', serial)
+        return revoked_cert
+
+    def _invalidating(self, method):
+        @functools.wraps(method)
+        def write(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                # some of it might have been written before an error
+                self._update('invalidate')
+        return write
+
+    def _update(self, method_name, *args):
+        if self.index_path.exists():
+            with CertIndex(self.index_path) as index:
+                getattr(index, method_name)(*args)
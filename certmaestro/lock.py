@@ -0,0 +1,53 @@
+"""
+    Advisory file locks with flock(2), for backends keeping their state in files.
+"""
+import time
+import fcntl
+import threading
+from pathlib import Path
+from typing import Optional
+from .exceptions import BackendError
+
+
+class FileLock:
+    """Exclusive lock on a separate lock file, between processes and threads alike:
+    the file is opened again for every acquire, and flock locks on different open files conflict.
+    Only processes using the same lock file are kept out, it's advisory. Not reentrant.
+    """
+
+    def __init__(self, path: Path, timeout: Optional[float]=None, poll_interval=0.01):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        # the same FileLock can be used from multiple threads, each holding its own open file
+        self._local = threading.local()
+
+    def acquire(self):
+        """Open file object holding the lock, closing it releases the lock."""
+        lock_file = self.path.open('a')
+        try:
+            if self.timeout is None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                self._acquire_until(lock_file, time.monotonic() + self.timeout)
+        except BaseException:
+            lock_file.close()
+            raise
+        return lock_file
+
+    def _acquire_until(self, lock_file, deadline):
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise BackendError(f'Timed out waiting for the lock: {self.path}') from None
+                time.sleep(self.poll_interval)
+
+    def __enter__(self):
+        self._local.__dict__.setdefault('held', []).append(self.acquire())
+        return self
+
+    def __exit__(self, *exc_info):
+        self._local.held.pop().close()
@@ -0,0 +1,179 @@
+"""
+    Site check metrics in Prometheus text exposition format.
+    https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+import os
+import math
+import time
+import bisect
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# from 1 ms to 10 s, TLS handshakes are usually somewhere in the middle
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXPIRY_DAYS_BUCKETS = (0, 1, 3, 7, 14, 30, 60, 90, 180, 365)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self._values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    def samples(self):
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            yield f'{self.name}_bucket', (('le', _format_value(upper_bound)),), cumulative
+        yield f'{self.name}_sum', (), self._sum
+        yield f'{self.name}_count', (), cumulative
+
+
+class SiteCheckMetrics:
+    """Aggregates site check results. Thread-safe, so it can be scraped while checks are running.
+    With per_site=True, the last durations and the certificate expiration of every site
+    are exported too, which is only reasonable for a limited number of sites.
+    """
+
+    def __init__(self, per_site=True, clock=time.time):
+        self.per_site = per_site
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.checks = Counter('certmaestro_site_checks_total', 'Number of site checks by verdict.')
+        self.durations = {
+            phase: Histogram(f'certmaestro_site_{phase}_duration_seconds', description)
+            for phase, description in (('dns', 'DNS resolution time.'),
+                                       ('connect', 'TCP connection time.'),
+                                       ('tls', 'TLS handshake time.'))
+        }
+        self.expiry_days = Histogram('certmaestro_site_cert_expiry_days',
+                                     'Days until the certificates of the sites expire.',
+                                     EXPIRY_DAYS_BUCKETS)
+        self.site_durations = Gauge('certmaestro_site_last_duration_seconds',
+                                    'Duration of the phases of the last check of a site.')
+        self.site_expiry = Gauge('certmaestro_site_cert_not_after_timestamp_seconds',
+                                 'Expiration of the certificate of a site as Unix timestamp.')
+        self.site_up = Gauge('certmaestro_site_check_success',
+                             'Whether the last check of a site succeeded (1) or failed (0).')
+
+    def observe(self, checked_site):
+        with self._lock:
+            self.checks.inc(verdict=checked_site.result.value.lower())
+            if checked_site.skipped:
+                return
+            if checked_site.timings is not None:
+                for phase, histogram in self.durations.items():
+                    duration = getattr(checked_site.timings, phase)
+                    if duration is not None:
+                        histogram.observe(duration)
+                        if self.per_site:
+                            self.site_durations.set(duration, site=checked_site.url, phase=phase)
+            if checked_site.cert is not None:
+                not_after = checked_site.cert.not_valid_after.timestamp()
+                self.expiry_days.observe((not_after - self._clock()) / 86400)
+                if self.per_site:
+                    self.site_expiry.set(not_after, site=checked_site.url)
+            if self.per_site:
+                self.site_up.set(1 if checked_site.succeeded else 0, site=checked_site.url)
+
+    @property
+    def _metrics(self):
+        metrics = [self.checks, *self.durations.values(), self.expiry_days]
+        if self.per_site:
+            metrics += [self.site_durations, self.site_expiry, self.site_up]
+        return metrics
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.type}')
+                for name, labels, value in metric.samples():
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: Path):
+        """Write the metrics for node_exporter's textfile collector.
+        The file is replaced atomically, so the collector never reads a half-written file.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        tmp_path.write_text(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, address=''):
+        """Serve the metrics on http://address:port/metrics from a background thread."""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((address, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
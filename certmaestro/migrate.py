@@ -0,0 +1,154 @@
+"""
+    Moving a CA with its certificates, their keys and revocation states from one backend to
+    another. Certificates are streamed from the source and stored in batches, the progress is
+    saved in a checkpoint file after every batch, so an interrupted migration continues where
+    it stopped. At the end, both backends are compared by counts and fingerprints.
+"""
+import os
+import json
+import hashlib
+import itertools
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+import attr
+from .backends.interfaces import CertRecord, IBackend
+from .exceptions import BackendError, MigrationError
+
+
+BATCH_SIZE = 1000
+_DIGEST_MODULUS = 2 ** 256
+# the source needs these methods, the destination the others
+_SOURCE_METHODS = ('export_certs', 'get_ca_key')
+_DESTINATION_METHODS = ('import_records', 'import_ca', 'existing_serials')
+
+
+@attr.s(slots=True)
+class Summary:
+    """Counts and an order independent digest of certificates: the sum of their SHA-256
+    fingerprints, so it can be computed while streaming them in any order.
+    """
+    count = attr.ib(default=0)
+    revoked = attr.ib(default=0)
+    keys = attr.ib(default=0)
+    digest = attr.ib(default=0)
+
+    def add(self, record: CertRecord):
+        self.count += 1
+        self.revoked += record.revoked_at is not None
+        self.keys += record.private_key is not None
+        fingerprint = int.from_bytes(hashlib.sha256(record.cert.der).digest(), 'big')
+        self.digest = (self.digest + fingerprint) % _DIGEST_MODULUS
+
+    @classmethod
+    def of(cls, records: Iterable[CertRecord]) -> 'Summary':
+        summary = cls()
+        for record in records:
+            summary.add(record)
+        return summary
+
+    def __str__(self):
+        return (f'{self.count} certificates, {self.revoked} revoked, {self.keys} with keys, '
+                f'digest {self.digest:064x}')
+
+
+class Migration:
+    def __init__(self, source: IBackend, destination: IBackend, checkpoint_path: Path,
+                 batch_size=BATCH_SIZE):
+        for backend, methods, action in ((source, _SOURCE_METHODS, 'exported from'),
+                                         (destination, _DESTINATION_METHODS, 'imported into')):
+            if not all(hasattr(backend, method) for method in methods):
+                raise MigrationError(f"The CA and certificates can't be {action} "
+                                     f"the {backend.name} backend.")
+        self.source = source
+        self.destination = destination
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+
+    def migrate_ca(self) -> bool:
+        """Give the CA of the source to the destination, unless it has it already. A CA made
+        when setting up the destination is replaced, if no certificate was issued with it.
+        Returns whether the CA was imported.
+        """
+        ca_cert = self.source.get_ca_cert()
+        try:
+            current_ca_cert = self.destination.get_ca_cert()
+            settings = dict(self.destination.settings)
+        except BackendError:
+            current_ca_cert = settings = None
+        if current_ca_cert is not None:
+            if current_ca_cert.der == ca_cert.der:
+                return False
+            if next(iter(self.destination.list_certs()), None) is not None:
+                raise MigrationError(f'The {self.destination.name} backend already has '
+                                     f'certificates issued by another CA.')
+        ca_key = self.source.get_ca_key()
+        if not ca_key.matches(ca_cert):
+            raise MigrationError(f'The CA key of the {self.source.name} backend does not '
+                                 f'belong to its CA certificate.')
+        if settings is None:
+            settings = {param.name: param.default for param in self.destination.setup_requires
+                        if param.name in ('cert_days', 'key_type', 'crl_days')}
+        self.destination.import_ca(ca_cert, ca_key, **settings)
+        return True
+
+    def run(self, progress: Optional[Callable[[int], None]]=None) -> Summary:
+        """Copy the certificates not copied yet, returns the summary of the source."""
+        done = self._load_checkpoint()
+        summary = Summary()
+        records = self.source.export_certs()
+        # the skipped ones are read, but only to summarize them
+        for record in itertools.islice(records, done):
+            summary.add(record)
+        if summary.count < done:
+            raise MigrationError('The source has fewer certificates than at the checkpoint, '
+                                 'start the migration again.')
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                return summary
+            for record in batch:
+                summary.add(record)
+            # after being interrupted between storing a batch and saving the checkpoint
+            existing = self.destination.existing_serials(r.serial_number for r in batch)
+            self.destination.import_records(
+                (r for r in batch if r.serial_number not in existing), self.batch_size)
+            done += len(batch)
+            self._save_checkpoint(done)
+            if progress is not None:
+                progress(done)
+
+    def verify(self, source_summary: Summary) -> Summary:
+        """Compare the destination with the source and remove the checkpoint if they match."""
+        destination_summary = Summary.of(self.destination.export_certs())
+        if destination_summary != source_summary:
+            raise MigrationError(f'The backends differ after the migration.\n'
+                                 f'  {self.source.name}: {source_summary}\n'
+                                 f'  {self.destination.name}: {destination_summary}')
+        self.remove_checkpoint()
+        return destination_summary
+
+    def _load_checkpoint(self) -> int:
+        try:
+            checkpoint = json.loads(self.checkpoint_path.read_text())
+        except FileNotFoundError:
+            return 0
+        if checkpoint['source'] != self.source.name or \
+                checkpoint['destination'] != self.destination.name:
+            raise MigrationError(f'The checkpoint {self.checkpoint_path} is of another '
+                                 f'migration: {checkpoint["source"]} to '
+                                 f'{checkpoint["destination"]}')
+        return checkpoint['done']
+
+    def _save_checkpoint(self, done: int):
+        checkpoint = {'source': self.source.name, 'destination': self.destination.name,
+                      'done': done}
+        # written next to it and renamed, so it's never half written
+        temp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+        temp_path.write_text(json.dumps(checkpoint))
+        os.replace(temp_path, self.checkpoint_path)
+
+    def remove_checkpoint(self):
+        try:
+            self.checkpoint_path.unlink()
+        except FileNotFoundError:
+            pass
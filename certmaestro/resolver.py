@@ -0,0 +1,237 @@
+"""
+    Caching DNS resolver and Happy Eyeballs (RFC 8305) connection racing for site checks.
+"""
+import os
+import time
+import errno
+import socket
+import selectors
+import threading
+import itertools
+from pathlib import Path
+from concurrent import futures
+from typing import Iterable, List, Optional, Tuple
+import attr
+
+
+# RFC 8305 section 8 recommends 250 ms between connection attempts
+CONNECTION_ATTEMPT_DELAY = 0.25
+DEFAULT_TTL = 300
+DEFAULT_NEGATIVE_TTL = 30
+
+Address = Tuple[int, str]
+
+
+@attr.s(slots=True)
+class Timings:
+    """Durations of the phases of a site check in seconds, None if the phase didn't happen."""
+    dns = attr.ib(default=None)
+    connect = attr.ib(default=None)
+    tls = attr.ib(default=None)
+
+    def __str__(self):
+        phases = (('dns', self.dns), ('connect', self.connect), ('tls', self.tls))
+        return ', '.join(f'{name} {value * 1000:.1f}ms' for name, value in phases
+                         if value is not None)
+
+
+def parse_hosts_file(path: Path):
+    """Parse a file in /etc/hosts format into a {hostname: [(family, ip), ...]} dict."""
+    hosts = {}
+    with Path(path).open() as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if len(fields) < 2:
+                continue
+            ip, names = fields[0], fields[1:]
+            family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+            for name in names:
+                hosts.setdefault(name.lower(), []).append((family, ip))
+    return hosts
+
+
+@attr.s(slots=True)
+class _CacheEntry:
+    expires = attr.ib()
+    addresses = attr.ib(default=None)
+    error = attr.ib(default=None)
+
+
+class Resolver:
+    """Thread-safe resolver which caches getaddrinfo results for ttl seconds.
+    getaddrinfo doesn't tell the TTL of the DNS records, so a fixed TTL is used. Failed lookups
+    are cached for negative_ttl seconds. Concurrent lookups of the same name are made only once.
+    At most max_size names are cached, the least recently resolved ones are dropped first.
+    For testing, a hosts file or a stub getaddrinfo function can be given.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 hosts_file: Optional[Path]=None, getaddrinfo=socket.getaddrinfo, max_workers=20,
+                 max_size=100_000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._hosts = parse_hosts_file(hosts_file) if hosts_file is not None else {}
+        self._getaddrinfo = getaddrinfo
+        self._max_workers = max_workers
+        self._cache = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def resolve(self, hostname: str) -> List[Address]:
+        hostname = hostname.lower()
+        if hostname in self._hosts:
+            return self._hosts[hostname]
+
+        with self._lock:
+            entry = self._cache.get(hostname)
+            if entry is not None and entry.expires > time.monotonic():
+                return self._entry_result(entry)
+            future = self._in_flight.get(hostname)
+            owner = future is None
+            if owner:
+                future = self._in_flight[hostname] = futures.Future()
+
+        if owner:
+            self._lookup(hostname, future)
+        return future.result()
+
+    def prefetch(self, hostnames: Iterable[str]):
+        """Start resolving the hostnames in the background, so later resolve() calls
+        will find the addresses in the cache or wait for the lookup which is already running.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        for hostname in hostnames:
+            self._executor.submit(self._prefetch_one, hostname)
+
+    def _prefetch_one(self, hostname):
+        try:
+            self.resolve(hostname)
+        except Exception:
+            # the error is cached, the check of the name will report it
+            pass
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _lookup(self, hostname, future):
+        try:
+            infos = self._getaddrinfo(hostname, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+            addresses = list(dict.fromkeys((family, sockaddr[0])
+                                           for family, _, _, _, sockaddr in infos))
+        except OSError as e:
+            # don't cache errors which might go away immediately
+            ttl = 0 if getattr(e, 'errno', None) == socket.EAI_AGAIN else self.negative_ttl
+            entry = _CacheEntry(time.monotonic() + ttl, error=e)
+        except Exception as e:
+            # like the UnicodeError of names which can't be IDNA encoded, waiting threads
+            # must get it too, otherwise they would wait for the lookup forever
+            entry = _CacheEntry(time.monotonic() + self.negative_ttl, error=e)
+        else:
+            entry = _CacheEntry(time.monotonic() + self.ttl, addresses=addresses)
+
+        with self._lock:
+            # re-insert, so the dict is ordered by lookup time
+            self._cache.pop(hostname, None)
+            self._cache[hostname] = entry
+            if len(self._cache) > self.max_size:
+                del self._cache[next(iter(self._cache))]
+            del self._in_flight[hostname]
+
+        if entry.error is not None:
+            future.set_exception(entry.error)
+        else:
+            future.set_result(entry.addresses)
+
+    @staticmethod
+    def _entry_result(entry):
+        if entry.error is not None:
+            raise entry.error
+        return entry.addresses
+
+
+def interleave_families(addresses: List[Address]) -> List[Address]:
+    """Order addresses alternating between address families, as in RFC 8305 section 4.
+    The first family is the one preferred by getaddrinfo (the first in the list).
+    """
+    by_family = {}
+    for address in addresses:
+        by_family.setdefault(address[0], []).append(address)
+    ordered = itertools.zip_longest(*by_family.values())
+    return [address for group in ordered for address in group if address is not None]
+
+
+def happy_eyeballs_connect(addresses: List[Address], port: int, timeout: float,
+                           attempt_delay=CONNECTION_ATTEMPT_DELAY) -> socket.socket:
+    """Race TCP connections to the addresses and return the first connected socket.
+    A new attempt is started every attempt_delay seconds or immediately when one fails.
+    Raises socket.timeout if none of them connects in timeout seconds.
+    """
+    pending = interleave_families(addresses)
+    if not pending:
+        raise OSError(errno.EHOSTUNREACH, 'No address to connect to')
+
+    deadline = time.monotonic() + timeout
+    next_attempt = time.monotonic()
+    selector = selectors.DefaultSelector()
+    connecting = set()
+    last_error = None
+    try:
+        while pending or connecting:
+            now = time.monotonic()
+            if now >= deadline:
+                raise socket.timeout('timed out')
+
+            if pending and now >= next_attempt:
+                family, ip = pending.pop(0)
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                error = sock.connect_ex((ip, port))
+                if error in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    connecting.add(sock)
+                    next_attempt = now + attempt_delay
+                else:
+                    sock.close()
+                    last_error = OSError(error, os.strerror(error))
+                continue
+
+            wait = deadline - now
+            if pending:
+                wait = min(wait, next_attempt - now)
+            for key, _ in selector.select(max(wait, 0)):
+                sock = key.fileobj
+                selector.unregister(sock)
+                connecting.discard(sock)
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error == 0:
+                    sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                    return sock
+                sock.close()
+                last_error = OSError(error, os.strerror(error))
+                next_attempt = time.monotonic()
+        raise last_error
+    finally:
+        for sock in connecting:
+            sock.close()
+        selector.close()
+
+
+def open_connection(resolver: Resolver, hostname: str, port: int, timeout: float,
+                    timings: Optional[Timings]=None) -> socket.socket:
+    """Resolve hostname with resolver and connect to port, recording durations into timings."""
+    timings = timings if timings is not None else Timings()
+    start = time.perf_counter()
+    addresses = resolver.resolve(hostname)
+    connect_start = time.perf_counter()
+    timings.dns = connect_start - start
+    sock = happy_eyeballs_connect(addresses, port, timeout)
+    timings.connect = time.perf_counter() - connect_start
+    return sock
+
+
+default_resolver = Resolver()
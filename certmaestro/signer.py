@@ -0,0 +1,183 @@
+"""
+    Certificate authority running in the process: keys are generated and certificates and
+    CRLs are signed with oscrypto, for backends which store everything themselves.
+"""
+import os
+import datetime
+import ipaddress
+from typing import Iterable, Mapping, Optional, Tuple
+import asn1crypto.crl as asn1crl
+import asn1crypto.x509 as asn1x509
+from oscrypto import asymmetric
+from .csr import CsrBuilder, SUBJECT_FIELDS
+from .wrapper import Cert, Crl, PrivateKey, SerialNumber
+
+
+KEY_TYPES = {
+    'rsa': {'bit_size': 2048},
+    'ec': {'curve': 'secp256r1'},
+}
+_SIGNATURES = {
+    'rsa': ('sha256_rsa', asymmetric.rsa_pkcs1v15_sign),
+    'ec': ('sha256_ecdsa', asymmetric.ecdsa_sign),
+}
+# SUBJECT_FIELDS names -> asn1crypto Name attribute names
+_NAME_ATTRIBUTES = {
+    'country': 'country_name',
+    'state': 'state_or_province_name',
+    'locality': 'locality_name',
+    'org_name': 'organization_name',
+    'org_unit': 'organizational_unit_name',
+    'common_name': 'common_name',
+    'email': 'email_address',
+}
+# (serial number, revocation date, reason), the reason is a name from asn1crypto.crl.CRLReason
+RevokedEntry = Tuple[SerialNumber, datetime.datetime, Optional[str]]
+
+
+def random_serial() -> SerialNumber:
+    """Positive, 127 bit serial number, so they don't have to be coordinated."""
+    return SerialNumber.from_int(int.from_bytes(os.urandom(16), 'big') >> 1 or 1)
+
+
+def generate_key(key_type='rsa') -> PrivateKey:
+    if key_type not in KEY_TYPES:
+        raise ValueError(f'Unknown key type: {key_type}, choose from: {", ".join(KEY_TYPES)}')
+    _, private_key = asymmetric.generate_pair(key_type, **KEY_TYPES[key_type])
+    return PrivateKey(asymmetric.dump_private_key(private_key, None).decode())
+
+
+def _time(value: datetime.datetime):
+    # UTCTime can only be used until 2049
+    if value.year >= 2050:
+        return asn1x509.Time({'general_time': value})
+    return asn1x509.Time({'utc_time': value})
+
+
+def _build_name(subject: Mapping[str, str]):
+    return asn1x509.Name.build({_NAME_ATTRIBUTES[field]: subject[field]
+                                for field, _ in SUBJECT_FIELDS if subject.get(field)})
+
+
+def _general_name(name):
+    try:
+        ipaddress.ip_address(name)
+    except ValueError:
+        return asn1x509.GeneralName({'dns_name': name})
+    return asn1x509.GeneralName({'ip_address': name})
+
+
+def revoked_entry(serial: SerialNumber, revocation_date: datetime.datetime,
+                  reason: Optional[str]=None) -> asn1crl.RevokedCertificate:
+    entry = {'user_certificate': int(serial), 'revocation_date': _time(revocation_date)}
+    if reason:
+        entry['crl_entry_extensions'] = [
+            {'extn_id': 'crl_reason', 'critical': False, 'extn_value': reason}]
+    return asn1crl.RevokedCertificate(entry)
+
+
+class Signer:
+    """Signs certificates and CRLs with the CA key."""
+
+    def __init__(self, ca_cert: Cert, ca_key: PrivateKey):
+        self.ca_cert = ca_cert
+        self._key = asymmetric.load_private_key(str(ca_key).encode())
+        self._algorithm, self._sign_function = _SIGNATURES[self._key.algorithm]
+
+    @classmethod
+    def create_ca(cls, subject: Mapping[str, str], days=3650,
+                  key_type='rsa') -> Tuple['Signer', PrivateKey]:
+        """New self-signed CA certificate and key."""
+        ca_key = generate_key(key_type)
+        private_key = asymmetric.load_private_key(str(ca_key).encode())
+        algorithm, sign_function = _SIGNATURES[private_key.algorithm]
+        public_key = private_key.public_key.asn1
+        name = _build_name(subject)
+        tbs = cls._build_tbs(name, name, public_key, random_serial(), days, algorithm, [
+            {'extn_id': 'basic_constraints', 'critical': True, 'extn_value': {'ca': True}},
+            {'extn_id': 'key_usage', 'critical': True,
+             'extn_value': {'key_cert_sign', 'crl_sign'}},
+            {'extn_id': 'key_identifier', 'critical': False, 'extn_value': public_key.sha1},
+        ])
+        cert = cls._build_cert(tbs, algorithm, sign_function(private_key, tbs.dump(), 'sha256'))
+        return cls(cert, ca_key), ca_key
+
+    @staticmethod
+    def _build_tbs(subject, issuer, public_key, serial, days, algorithm, extensions):
+        # a bit back in time, clocks of the clients might be behind
+        not_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+        return asn1x509.TbsCertificate({
+            'version': 'v3',
+            'serial_number': int(serial),
+            'signature': {'algorithm': algorithm},
+            'issuer': issuer,
+            'validity': {'not_before': _time(not_before),
+                         'not_after': _time(not_before + datetime.timedelta(days=days))},
+            'subject': subject,
+            'subject_public_key_info': public_key,
+            'extensions': extensions,
+        })
+
+    @staticmethod
+    def _build_cert(tbs, algorithm, signature) -> Cert:
+        return Cert.from_der(asn1x509.Certificate({
+            'tbs_certificate': tbs,
+            'signature_algorithm': {'algorithm': algorithm},
+            'signature_value': signature,
+        }).dump())
+
+    def _sign(self, data: bytes) -> bytes:
+        return self._sign_function(self._key, data, 'sha256')
+
+    def issue(self, csr: CsrBuilder, days=365, key_type='rsa',
+              serial: Optional[SerialNumber]=None) -> Tuple[PrivateKey, Cert]:
+        """New key and certificate for a server, the Common Name is also the SAN."""
+        key = generate_key(key_type)
+        public_key = asymmetric.load_private_key(str(key).encode()).public_key.asn1
+        key_usage = {'digital_signature', 'key_encipherment'} if key_type == 'rsa' else \
+            {'digital_signature'}
+        extensions = [
+            {'extn_id': 'basic_constraints', 'critical': True, 'extn_value': {'ca': False}},
+            {'extn_id': 'key_usage', 'critical': True, 'extn_value': key_usage},
+            {'extn_id': 'extended_key_usage', 'critical': False,
+             'extn_value': ['server_auth', 'client_auth']},
+            {'extn_id': 'key_identifier', 'critical': False, 'extn_value': public_key.sha1},
+            {'extn_id': 'authority_key_identifier', 'critical': False,
+             'extn_value': {'key_identifier': self.ca_cert.key_identifier}},
+            {'extn_id': 'subject_alt_name', 'critical': False,
+             'extn_value': [_general_name(csr.common_name)]},
+        ]
+        subject = _build_name({field: csr[field] for field, _ in SUBJECT_FIELDS})
+        tbs = self._build_tbs(subject, self.ca_cert.asn1.subject, public_key,
+                              serial or random_serial(), days, self._algorithm, extensions)
+        return key, self._build_cert(tbs, self._algorithm, self._sign(tbs.dump()))
+
+    def make_crl(self, revoked: Iterable[RevokedEntry], days=7,
+                 number: Optional[int]=None) -> Crl:
+        """CRL valid for days, the number should grow with every new CRL, it's the current
+        time by default.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        revoked_certificates = [revoked_entry(*entry) for entry in revoked]
+        tbs = {
+            'version': 'v2',
+            'signature': {'algorithm': self._algorithm},
+            'issuer': self.ca_cert.asn1.subject,
+            'this_update': _time(now),
+            'next_update': _time(now + datetime.timedelta(days=days)),
+            'crl_extensions': [
+                {'extn_id': 'crl_number', 'critical': False,
+                 'extn_value': number if number is not None else int(now.timestamp())},
+                {'extn_id': 'authority_key_identifier', 'critical': False,
+                 'extn_value': {'key_identifier': self.ca_cert.key_identifier}},
+            ],
+        }
+        # has to be left out when empty
+        if revoked_certificates:
+            tbs['revoked_certificates'] = revoked_certificates
+        tbs = asn1crl.TbsCertList(tbs)
+        return Crl.from_asn1(asn1crl.CertificateList({
+            'tbs_cert_list': tbs,
+            'signature_algorithm': {'algorithm': self._algorithm},
+            'signature': self._sign(tbs.dump()),
+        }))
@@ -0,0 +1,208 @@
+"""
+    Packed certificate store: DER certificates appended to a single file, with a separate
+    serial number -> (offset, length) index. Both files are memory-mapped, so looking up and
+    listing certificates doesn't need a file open and a PEM decode per certificate.
+
+    The index is a header and fixed-width records. The first records are sorted by serial
+    number and searched with bisection. Records appended since the last sort form the
+    unsorted tail, which is scanned linearly, and which is sorted in once it gets long.
+"""
+import os
+import mmap
+import struct
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from .wrapper import Cert, SerialNumber
+
+
+DATA_MAGIC = b'CMPACK01'
+INDEX_MAGIC = b'CMPIDX01'
+# magic, generation (the same in both files, so an index of another data file is noticed)
+DATA_HEADER = struct.Struct('>8s8s')
+# magic, generation, number of sorted records
+INDEX_HEADER = struct.Struct('>8s8sQ')
+# serial number (big-endian, signed), offset and length of the DER certificate
+SERIAL_SIZE = 24
+RECORD = struct.Struct(f'>{SERIAL_SIZE}sQI')
+MAX_UNSORTED = 4096
+
+
+def serial_key(serial: SerialNumber) -> bytes:
+    # negative serials don't sort before the positive ones this way, but only equality
+    # and a consistent order matter for the lookups
+    try:
+        return int(serial).to_bytes(SERIAL_SIZE, 'big', signed=True)
+    except OverflowError:
+        raise ValueError(f'Serial number is too long for the packed store: {serial}') from None
+
+
+class PackedCertStore:
+    """Append-only store of certificates. Readers notice when the files are appended to
+    or replaced and map them again. Can be shared between threads, but writers in different
+    processes have to hold a lock of their own, like the OpenSSL backend's.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + '.idx')
+        self._data = None
+        self._index = None
+        self._index_id = None
+        self._sorted_count = 0
+        # remapping must not happen while another thread is reading the old mapping
+        self._lock = threading.RLock()
+
+    @classmethod
+    def create(cls, path: Path, certs: Iterable[Cert]) -> 'PackedCertStore':
+        """Write a new store from the certificates, replacing the existing one."""
+        store = cls(path)
+        generation = os.urandom(8)
+        records = []
+        tmp_path = store.path.with_name(f'.{store.path.name}.{os.getpid()}.tmp')
+        with tmp_path.open('wb') as f:
+            f.write(DATA_HEADER.pack(DATA_MAGIC, generation))
+            for cert in certs:
+                der = cert.der
+                records.append((serial_key(cert.serial_number), f.tell(), len(der)))
+                f.write(der)
+            f.flush()
+            os.fsync(f.fileno())
+        records.sort()
+        for (key, _, _), (next_key, _, _) in zip(records, records[1:]):
+            if key == next_key:
+                tmp_path.unlink()
+                raise ValueError(f'Duplicate serial number: {int.from_bytes(key, "big")}')
+        # the index is replaced last, readers of the old index will find the generation changed
+        os.replace(tmp_path, store.path)
+        store._write_index(generation, records)
+        return store
+
+    def _write_index(self, generation, records):
+        tmp_path = self.index_path.with_name(f'.{self.index_path.name}.{os.getpid()}.tmp')
+        with tmp_path.open('wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, generation, len(records)))
+            f.write(b''.join(RECORD.pack(*record) for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def exists(self):
+        return self.index_path.exists()
+
+    def close(self):
+        for mapping in (self._index, self._data):
+            try:
+                mapping.close()
+            except (AttributeError, BufferError):
+                # memoryviews are still held by callers, it will be closed when they are gone
+                pass
+        self._data = self._index = self._index_id = None
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._record_count
+
+    @property
+    def _record_count(self):
+        return (len(self._index) - INDEX_HEADER.size) // RECORD.size
+
+    def _refresh(self):
+        """Map the files again if the index changed since they were mapped."""
+        stat = os.stat(self.index_path)
+        index_id = (stat.st_ino, stat.st_size)
+        if index_id == self._index_id:
+            return
+        self.close()
+        # map the index first: the data file is always appended to before the index
+        with self.index_path.open('rb') as f:
+            index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self.path.open('rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_magic, index_generation, sorted_count = INDEX_HEADER.unpack_from(index)
+        data_magic, data_generation = DATA_HEADER.unpack_from(data)
+        if (index_magic, data_magic) != (INDEX_MAGIC, DATA_MAGIC):
+            raise ValueError(f'Not a packed certificate store: {self.path}')
+        if index_generation != data_generation:
+            raise ValueError(f'The index does not belong to the store, repack it: {self.path}')
+        self._index, self._data = index, data
+        self._index_id = index_id
+        self._sorted_count = sorted_count
+
+    def _find(self, key) -> Optional[int]:
+        """Position of the index record of the serial number, None if it's not stored."""
+        index = self._index
+        lo, hi = 0, self._sorted_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = INDEX_HEADER.size + mid * RECORD.size
+            if index[pos:pos + SERIAL_SIZE] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        pos = INDEX_HEADER.size + lo * RECORD.size
+        if lo < self._sorted_count and index[pos:pos + SERIAL_SIZE] == key:
+            return pos
+        for pos in range(INDEX_HEADER.size + self._sorted_count * RECORD.size,
+                         INDEX_HEADER.size + self._record_count * RECORD.size, RECORD.size):
+            if index[pos:pos + SERIAL_SIZE] == key:
+                return pos
+        return None
+
+    def get_der(self, serial: SerialNumber) -> Optional[memoryview]:
+        """The DER encoded certificate without copying it, None if it's not in the store."""
+        with self._lock:
+            self._refresh()
+            pos = self._find(serial_key(serial))
+            if pos is None:
+                return None
+            _, offset, length = RECORD.unpack_from(self._index, pos)
+            return memoryview(self._data)[offset:offset + length]
+
+    def get(self, serial: SerialNumber) -> Optional[Cert]:
+        der = self.get_der(serial)
+        # asn1crypto only parses bytes
+        return Cert.from_der(bytes(der)) if der is not None else None
+
+    def __contains__(self, serial: SerialNumber):
+        with self._lock:
+            self._refresh()
+            return self._find(serial_key(serial)) is not None
+
+    def iter_der(self) -> Iterator[memoryview]:
+        """DER certificates in the order they were added."""
+        with self._lock:
+            self._refresh()
+            records = RECORD.iter_unpack(
+                self._index[INDEX_HEADER.size:INDEX_HEADER.size + self._record_count * RECORD.size])
+            data = memoryview(self._data)
+        for _, offset, length in sorted(records, key=lambda record: record[1]):
+            yield data[offset:offset + length]
+
+    def __iter__(self) -> Iterator[Cert]:
+        return (Cert.from_der(bytes(der)) for der in self.iter_der())
+
+    def add(self, cert: Cert):
+        """Append a certificate. The unsorted part of the index is sorted when it gets long."""
+        with self._lock:
+            self._refresh()
+            key = serial_key(cert.serial_number)
+            if self._find(key) is not None:
+                raise ValueError(f'Already in the store: {cert.serial_number}')
+            der = cert.der
+            with self.path.open('ab') as f:
+                offset = f.tell()
+                f.write(der)
+            with self.index_path.open('ab') as f:
+                f.write(RECORD.pack(key, offset, len(der)))
+            self._refresh()
+            if self._record_count - self._sorted_count > MAX_UNSORTED:
+                self._sort_index()
+
+    def _sort_index(self):
+        records = sorted(RECORD.iter_unpack(
+            self._index[INDEX_HEADER.size:INDEX_HEADER.size + self._record_count * RECORD.size]))
+        _, generation, _ = INDEX_HEADER.unpack_from(self._index)
+        self._write_index(generation, records)
+        self._refresh()
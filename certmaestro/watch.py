@@ -0,0 +1,185 @@
+"""
+    Continuous site checking with a schedule adapted to the state of every certificate.
+"""
+import os
+import json
+import time
+import heapq
+import random
+from pathlib import Path
+from typing import Iterable, Optional
+import attr
+from .check import CheckedSite, CheckResult, format_target, parse_target
+
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+
+@attr.s(slots=True, frozen=True)
+class WatchPolicy:
+    """How often sites are checked in seconds.
+    Healthy certificates are checked after expiry_fraction of their remaining validity passed,
+    but at least every max_interval and at most every min_interval. Failing sites are retried
+    with exponential backoff from min_interval up to failure_max_interval. After a certificate
+    change, the site is watched closely for change_window seconds, in case it is rolled back.
+    """
+    min_interval = attr.ib(default=5 * MINUTE)
+    max_interval = attr.ib(default=12 * HOUR)
+    failure_max_interval = attr.ib(default=30 * MINUTE)
+    expiry_fraction = attr.ib(default=0.05)
+    change_window = attr.ib(default=DAY)
+    change_interval = attr.ib(default=HOUR)
+    jitter = attr.ib(default=0.1)
+
+    def next_interval(self, site: 'WatchedSite', now: float) -> float:
+        if site.failures:
+            interval = min(self.min_interval * 2 ** (site.failures - 1), self.failure_max_interval)
+        elif site.not_valid_after is None:
+            interval = self.min_interval
+        else:
+            remaining = site.not_valid_after - now
+            interval = min(max(remaining * self.expiry_fraction, self.min_interval),
+                           self.max_interval)
+            if site.changed_at is not None and now - site.changed_at < self.change_window:
+                interval = min(interval, self.change_interval)
+            # never sleep over the expiration
+            if remaining > 0:
+                interval = min(interval, max(remaining, self.min_interval))
+        # spread out the checks of sites which were added at the same time
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+@attr.s(slots=True)
+class WatchedSite:
+    target = attr.ib()
+    next_check = attr.ib(default=0.0)
+    last_check = attr.ib(default=None)
+    failures = attr.ib(default=0)
+    message = attr.ib(default=None)
+    serial_number = attr.ib(default=None)
+    not_valid_after = attr.ib(default=None)
+    changed_at = attr.ib(default=None)
+
+
+@attr.s(slots=True, frozen=True)
+class WatchEvent:
+    """Something worth reporting happened with a site since the last check."""
+    target = attr.ib()
+    kind = attr.ib()
+    message = attr.ib(default=None)
+
+    FAILED = 'failed'
+    RECOVERED = 'recovered'
+    CHANGED = 'changed'
+    VALID = 'valid'
+
+
+class SiteScheduler:
+    """Priority queue of sites ordered by their next check time, persisted in a JSON file."""
+
+    def __init__(self, targets: Iterable[str], state_path: Optional[Path]=None,
+                 policy: WatchPolicy=WatchPolicy()):
+        self.policy = policy
+        self.state_path = state_path
+        saved = self._load()
+        # forget about the sites which are not watched anymore
+        self.sites = {target: saved.get(target) or WatchedSite(target) for target in targets}
+        self._queue = [(site.next_check, target) for target, site in self.sites.items()]
+        heapq.heapify(self._queue)
+
+    def __len__(self):
+        return len(self.sites)
+
+    def _load(self):
+        if self.state_path is None or not self.state_path.exists():
+            return {}
+        with self.state_path.open() as f:
+            state = json.load(f)
+        return {values['target']: WatchedSite(**values) for values in state['sites']}
+
+    def save(self):
+        if self.state_path is None:
+            return
+        state = {'sites': [attr.asdict(site) for site in self.sites.values()]}
+        # write to a temporary file first, so a crash can't leave a truncated state behind
+        tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        with tmp_path.open('w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def next_check_time(self) -> Optional[float]:
+        return self._queue[0][0] if self._queue else None
+
+    def pop_due(self, now: float):
+        """Remove and return the targets which should be checked now."""
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue)[1])
+        return due
+
+    def record(self, checked_site, now: float) -> Optional[WatchEvent]:
+        """Update the state of the site with a check result and schedule the next check."""
+        site = self.sites[checked_site.url]
+        event = None
+        was_checked = site.last_check is not None
+        if checked_site.failed:
+            if site.failures == 0:
+                event = WatchEvent(site.target, WatchEvent.FAILED, checked_site.message)
+            site.failures += 1
+        else:
+            if site.failures:
+                event = WatchEvent(site.target, WatchEvent.RECOVERED)
+            site.failures = 0
+            cert = checked_site.cert
+            if cert is not None:
+                serial_number = str(cert.serial_number)
+                if was_checked and site.serial_number not in (None, serial_number):
+                    site.changed_at = now
+                    event = WatchEvent(site.target, WatchEvent.CHANGED,
+                                       f'new certificate: {serial_number}')
+                site.serial_number = serial_number
+                site.not_valid_after = cert.not_valid_after.timestamp()
+            if not was_checked and event is None:
+                event = WatchEvent(site.target, WatchEvent.VALID)
+        site.message = checked_site.message
+        site.last_check = now
+        site.next_check = now + self.policy.next_interval(site, now)
+        heapq.heappush(self._queue, (site.next_check, site.target))
+        return event
+
+
+def normalize_targets(urls):
+    """Unique hostname[:port] strings of the checkable urls, the skipped ones are returned too."""
+    checkable, skipped = {}, []
+    for url in urls:
+        target, skip_reason = parse_target(url)
+        if target is None:
+            skipped.append(CheckedSite(url, CheckResult.SKIPPED, skip_reason))
+        else:
+            checkable[format_target(*target)] = None
+    return list(checkable), skipped
+
+
+def watch(scheduler: SiteScheduler, make_manager, on_event, after_round=None, max_sleep=MINUTE,
+          sleep=time.sleep, clock=time.time):
+    """Run checks forever as they become due. make_manager(targets) should return a
+    CheckSiteManager, on_event(event) is called for every WatchEvent and after_round()
+    after every batch of checks.
+    """
+    while True:
+        now = clock()
+        due = scheduler.pop_due(now)
+        if due:
+            for checked_site in make_manager(due).check_sites():
+                event = scheduler.record(checked_site, clock())
+                if event is not None:
+                    on_event(event)
+            scheduler.save()
+            if after_round is not None:
+                after_round()
+            continue
+        next_check = scheduler.next_check_time()
+        wait = max_sleep if next_check is None else min(next_check - now, max_sleep)
+        sleep(max(wait, 0))
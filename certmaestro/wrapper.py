@@ -1,10 +1,12 @@
 """
     Wrapper around oscrypto and asn1crypto modules for a nicer API.
 """
-import re
+import mmap
+import hashlib
+import binascii
+import weakref
 from pathlib import Path
-from typing import NewType
-from oscrypto.keys import parse_certificate
+from typing import Iterator, NewType
 import asn1crypto.x509 as asn1x509
 import asn1crypto.keys as asn1keys
 import asn1crypto.pem as asn1pem
@@ -14,50 +16,112 @@ import asn1crypto.crl as asn1crl
 SerialHex = NewType('SerialHex', str)
 
 
+class memoized:
+    """Like functools.cached_property, but works with __slots__: the value is stored in the
+    _cached_<name> slot, which has to be declared by the class.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.slot = f'_cached_{func.__name__}'
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.func(obj)
+            setattr(obj, self.slot, value)
+            return value
+
+
 class SerialNumber:
+    """Certificate serial number, which can be used as a dict key or sorted.
+    Stored as an integer, the colonized and hex forms are only made when needed.
+    """
+    __slots__ = ('_value', '_colonized')
 
     def __init__(self, serial: str):
         # might have 0x prefix, and/or colons
-        serial = serial.lower()
+        serial = serial.strip().lower()
         if serial.startswith('0x'):
             serial = serial[2:]
-        serial = serial.replace(':', '')
-        serial = serial.replace('-', '')
-        serial = self._zero_prefix(serial)
-        serial = self.colonize(serial)
-        self._value = serial
+        serial = serial.replace(':', '').replace('-', '')
+        self._value = int(serial, 16)
+        self._colonized = None
 
     @classmethod
     def from_int(cls, serial: int):
-        return cls(hex(serial))
+        obj = cls.__new__(cls)
+        obj._value = serial
+        obj._colonized = None
+        return obj
 
-    def __str__(self):
+    def __int__(self):
         return self._value
 
+    def __str__(self):
+        if self._colonized is None:
+            self._colonized = self._to_bytes().hex(':')
+        return self._colonized
+
     def __repr__(self):
-        return f'<{self.__class__.__name__}: {self._value}>'
+        return f'<{self.__class__.__name__}: {self}>'
+
+    def __hash__(self):
+        return hash(self._value)
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return NotImplemented
         return self._value == other._value
 
+    def __lt__(self, other):
+        if not isinstance(other, self.__class__):
+            return NotImplemented
+        return self._value < other._value
+
+    def __le__(self, other):
+        if not isinstance(other, self.__class__):
+            return NotImplemented
+        return self._value <= other._value
+
+    def __gt__(self, other):
+        if not isinstance(other, self.__class__):
+            return NotImplemented
+        return self._value > other._value
+
+    def __ge__(self, other):
+        if not isinstance(other, self.__class__):
+            return NotImplemented
+        return self._value >= other._value
+
     def as_hex(self, prefix=False):
-        serial_hex = self._value.replace(':', '')
+        serial_hex = self._to_bytes().hex()
         return '0x' + serial_hex if prefix else serial_hex
 
-    @staticmethod
-    def _zero_prefix(serial: SerialHex):
-        if len(serial) % 2 == 1:
-            serial = '0' + serial
-        return serial
+    def _to_bytes(self):
+        # zero is still one byte: 00, broken certificates might have negative serial numbers
+        negative = self._value < 0
+        length = max((self._value.bit_length() + 7 + negative) // 8, 1)
+        return self._value.to_bytes(length, 'big', signed=negative)
 
     @staticmethod
     def colonize(serial: SerialHex):
-        return ':'.join(serial[i:i+2] for i in range(0, len(serial), 2))
+        if len(serial) % 2 == 1:
+            serial = '0' + serial
+        return bytes.fromhex(serial).hex(':')
 
 
 class Name:
+    """Distinguished Name of a certificate subject or issuer.
+    The asn1 form is only built and its native form only computed when needed. Names made
+    from the same OpenSSL style string or DER encoding are the same object while in use,
+    because the same issuer and subject names are repeated a lot within a CA.
+    """
+    __slots__ = ('_values', '_asn1', '_native', '_key', '__weakref__')
     _map = {
         'C': 'country_name',
         'O': 'organization_name',
@@ -67,56 +131,154 @@ class Name:
         'ST': 'state_or_province_name',
         'emailAddress': 'email_address',
     }
-    _name_re = re.compile(r'/([A-Z]+)=([^/]*)')
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, name: str):
+        # OpenSSL format: /C=HU/L=Budapest/CN=example.com
+        obj = cls._interned.get(name)
+        if obj is None:
+            obj = cls._interned[name] = cls._make(values=cls._parse(name))
+        return obj
+
+    @classmethod
+    def _parse(cls, name: str):
+        values = {}
+        for part in name.split('/'):
+            key, sep, value = part.partition('=')
+            field = cls._map.get(key)
+            if sep and field is not None:
+                values[field] = value
+        return values
 
-    def __init__(self, name: str):
-        raw_values = dict(self._name_re.findall(name))
-        values = {self._map[k]: v for k, v in raw_values.items()}
-        self._name = asn1x509.Name.build(values)
+    @classmethod
+    def _make(cls, values=None, asn1=None):
+        obj = object.__new__(cls)
+        obj._values = values
+        obj._asn1 = asn1
+        obj._native = None
+        obj._key = None
+        return obj
 
     def __eq__(self, other):
-        return self._name == other._name
+        if not isinstance(other, Name):
+            return NotImplemented
+        return self is other or self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}: {dict(self.native)}>'
 
     @classmethod
     def from_asn1(cls, name: asn1x509.Name):
-        obj = cls.__new__(cls)
-        obj._name = name
+        der_bytes = name.dump()
+        obj = cls._interned.get(der_bytes)
+        if obj is None:
+            obj = cls._interned[der_bytes] = cls._make(asn1=name)
         return obj
 
     @classmethod
     def from_dict(cls, values):
-        return cls.from_asn1(asn1x509.Name.build(values))
+        return cls._make(values=dict(values))
+
+    @property
+    def asn1(self) -> asn1x509.Name:
+        if self._asn1 is None:
+            self._asn1 = asn1x509.Name.build(self._values)
+        return self._asn1
+
+    @property
+    def native(self):
+        if self._native is None:
+            self._native = self.asn1.native
+        return self._native
+
+    @property
+    def key(self):
+        """Hashable, normalized form of the name for comparison.
+        Values are compared case-insensitively with whitespace collapsed, like in RFC 5280.
+        """
+        if self._key is None:
+            values = self._values if self._values is not None else self.native
+            self._key = tuple(sorted((field, self._normalize(value))
+                                     for field, value in values.items()))
+        return self._key
+
+    @staticmethod
+    def _normalize(value):
+        if isinstance(value, str):
+            return ' '.join(value.lower().split())
+        elif isinstance(value, list):
+            return tuple(Name._normalize(v) for v in value)
+        return value
 
     @property
     def common_name(self):
-        return self._name.native.get('common_name')
+        if self._values is not None:
+            return self._values.get('common_name')
+        return self.native.get('common_name')
 
     @property
     def formatted_lines(self):
-        field_names = [asn1x509.NameType(field).human_friendly for field in self._name.native.keys()]
+        native = self.native
+        field_names = [asn1x509.NameType(field).human_friendly for field in native.keys()]
         max_length = max(len(field) for field in field_names)
         field_names = [f'{field}:'.ljust(max_length + 3) for field in field_names]
-        return (field + val for field, val in zip(field_names, self._name.native.values()))
+        return (field + val for field, val in zip(field_names, native.values()))
 
 
 class FromFileMixin:
+    __slots__ = ()
+
     @classmethod
     def from_file(cls, path):
         return cls(Path(path).read_text())
 
 
 class Cert(FromFileMixin):
+    __slots__ = ('_cert', '_pem_data', '_cached_serial_number', '_cached_signature')
 
     def __init__(self, pem_data: str):
         # OpenSSL have an option to write readable text into the same file with PEM data
         start = self._find_start(pem_data)
         pem_data = pem_data[start:]
+        # oscrypto is slow to import, only needed for parsing PEM
+        from oscrypto.keys import parse_certificate
         self._cert: asn1x509.Certificate = parse_certificate(pem_data.encode())
         self._pem_data = pem_data
 
     def __str__(self):
+        if self._pem_data is None:
+            self._pem_data = asn1pem.armor('CERTIFICATE', self._cert.dump()).decode()
         return self._pem_data
 
+    @classmethod
+    def from_der(cls, der_bytes: bytes):
+        # asn1crypto only parses the parts of the certificate which are accessed,
+        # the PEM form is made when needed
+        obj = cls.__new__(cls)
+        obj._cert = asn1x509.Certificate.load(der_bytes)
+        obj._pem_data = None
+        return obj
+
+    @property
+    def der(self) -> bytes:
+        return self._cert.dump()
+
+    @property
+    def asn1(self) -> asn1x509.Certificate:
+        return self._cert
+
+    @property
+    def key_identifier(self):
+        """Subject Key Identifier as bytes, None if the extension is missing."""
+        return self._cert.key_identifier
+
+    @property
+    def authority_key_identifier(self):
+        return self._cert.authority_key_identifier
+
     @staticmethod
     def _find_start(pem_data):
         start = pem_data.find('-----BEGIN')
@@ -126,7 +288,7 @@ class Cert(FromFileMixin):
                 raise ValueError(f"This doesn't seem like a valid X509 Certificate: {pem_data}")
         return start
 
-    @property
+    @memoized
     def serial_number(self):
         return SerialNumber.from_int(self._cert.serial_number)
 
@@ -180,15 +342,108 @@ class Cert(FromFileMixin):
         return PublicKey.from_asn1(self._cert.public_key)
 
     @property
+    def dns_names(self):
+        """DNS names in the Subject Alternative Name extension."""
+        return [name.native for name in self._subject_alt_names if name.name == 'dns_name']
+
+    @property
+    def ip_addresses(self):
+        """IP addresses in the Subject Alternative Name extension."""
+        return [name.native for name in self._subject_alt_names if name.name == 'ip_address']
+
+    @property
+    def _subject_alt_names(self):
+        general_names = self._cert.subject_alt_name_value
+        return general_names if general_names is not None else []
+
+    @property
+    def sha1_fingerprint(self):
+        return self._cert.sha1.hex(':')
+
+    @property
+    def sha256_fingerprint(self):
+        return self._cert.sha256.hex(':')
+
+    @property
+    def spki_sha256(self):
+        """SHA-256 hash of the DER encoded SubjectPublicKeyInfo, as used for key pinning."""
+        return hashlib.sha256(self._cert.public_key.dump()).digest().hex(':')
+
+    @memoized
     def signature(self):
-        return ':'.join(hex(i)[2:].zfill(2) for i in self._cert.signature)
+        return self._cert.signature.hex(':')
 
     @property
     def signature_algorithm(self):
         return self._cert['signature_algorithm']['algorithm'].native
 
 
+_PEM_CERT_LABELS = {b'CERTIFICATE', b'X509 CERTIFICATE', b'TRUSTED CERTIFICATE'}
+
+
+def iter_certs(path) -> Iterator[Cert]:
+    """Read every certificate from a PEM bundle (chain files, ca-bundle.crt, certifi's
+    cacert.pem) or from concatenated DER certificates. The file is memory-mapped and the
+    certificates are decoded one by one as they are iterated. Text between the PEM blocks,
+    like the output of openssl x509 -text, and other kinds of PEM blocks are skipped.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            return
+    with data:
+        # DER certificates start with a SEQUENCE tag, PEM files with text
+        if data[:1] == b'\x30':
+            yield from _iter_der(data)
+        else:
+            yield from _iter_pem(data)
+
+
+def _iter_pem(data):
+    pos = 0
+    with memoryview(data) as view:
+        while True:
+            begin = data.find(b'-----BEGIN ', pos)
+            if begin == -1:
+                return
+            label_start = begin + len(b'-----BEGIN ')
+            label_end = data.find(b'-----', label_start)
+            if label_end == -1:
+                raise ValueError(f'Truncated PEM block at offset {begin}')
+            label = data[label_start:label_end]
+            end_marker = b'-----END ' + label + b'-----'
+            end = data.find(end_marker, label_end)
+            if end == -1:
+                raise ValueError(f'Truncated PEM block at offset {begin}')
+            if label in _PEM_CERT_LABELS:
+                # a2b_base64 skips the line breaks, so the block doesn't need to be copied first
+                yield Cert.from_der(binascii.a2b_base64(view[label_end + 5:end]))
+            pos = end + len(end_marker)
+
+
+def _iter_der(data):
+    pos, size = 0, len(data)
+    while pos < size:
+        end = pos + _der_length(data, pos)
+        if data[pos] != 0x30 or end > size:
+            raise ValueError(f'Invalid or truncated DER certificate at offset {pos}')
+        yield Cert.from_der(data[pos:end])
+        pos = end
+
+
+def _der_length(data, pos):
+    """Length of the DER encoded value at pos, including the tag and length bytes."""
+    first = data[pos + 1] if pos + 1 < len(data) else 0
+    if first < 0x80:
+        return 2 + first
+    length_bytes = first & 0x7f
+    return 2 + length_bytes + int.from_bytes(data[pos + 2:pos + 2 + length_bytes], 'big')
+
+
 class PrivateKey(FromFileMixin):
+    __slots__ = ('_pem_data',)
 
     def __init__(self, pem_data: str):
         self._pem_data = pem_data
@@ -196,8 +451,16 @@ class PrivateKey(FromFileMixin):
     def __str__(self):
         return self._pem_data
 
+    def matches(self, cert: 'Cert') -> bool:
+        """Is this the private key of the certificate's public key."""
+        from oscrypto import asymmetric
+
+        private_key = asymmetric.load_private_key(self._pem_data.encode())
+        return private_key.public_key.asn1.dump() == cert.asn1.public_key.dump()
+
 
 class PublicKey:
+    __slots__ = ('_public_key', '_cached_modulus', '_cached_exponent')
 
     @classmethod
     def from_asn1(cls, public_key: asn1keys.PublicKeyInfo):
@@ -205,11 +468,12 @@ class PublicKey:
         obj._public_key = public_key
         return obj
 
-    @property
+    @memoized
     def modulus(self):
-        hex_modulus = hex(self._public_key['public_key'].native['modulus'])[2:]
+        modulus = self._public_key['public_key'].parsed['modulus'].native
+        modulus_bytes = modulus.to_bytes((modulus.bit_length() + 7) // 8, 'big')
         # http://stackoverflow.com/questions/15953631/rsa-modulus-prefaced-by-0x00
-        return '00:' + SerialNumber.colonize(hex_modulus)
+        return '00:' + modulus_bytes.hex(':')
 
     @property
     def bit_size(self):
@@ -219,16 +483,18 @@ class PublicKey:
     def algorithm(self):
         return self._public_key.algorithm
 
-    @property
+    @memoized
     def exponent(self):
-        return self._public_key['public_key'].native['public_exponent']
+        # parse only the exponent instead of making the whole key native
+        return self._public_key['public_key'].parsed['public_exponent'].native
 
     @property
     def hex_exponent(self):
-        return hex(self._public_key['public_key'].native['public_exponent'])
+        return hex(self.exponent)
 
 
 class RevokedCert:
+    __slots__ = ('_rev_cert', '_cached_serial_number')
 
     @classmethod
     def from_asn1(cls, revoked_cert: asn1crl.RevokedCertificate):
@@ -237,6 +503,10 @@ class RevokedCert:
         return obj
 
     @property
+    def der(self) -> bytes:
+        return self._rev_cert.dump()
+
+    @memoized
     def serial_number(self):
         return SerialNumber.from_int(self._rev_cert['user_certificate'].native)
 
@@ -254,6 +524,7 @@ class RevokedCert:
 
 
 class Crl(FromFileMixin):
+    __slots__ = ('_crl',)
 
     def __init__(self, crl_pem: str):
         type_name, headers, der_bytes = asn1pem.unarmor(crl_pem.encode())
@@ -268,6 +539,10 @@ class Crl(FromFileMixin):
         obj._crl = crl
         return obj
 
+    @property
+    def der(self) -> bytes:
+        return self._crl.dump()
+
     def __iter__(self):
         return iter(RevokedCert.from_asn1(c)
                     for c in self._crl['tbs_cert_list']['revoked_certificates'])
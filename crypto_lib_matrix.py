@@ -1,146 +1,260 @@
+"""
+Offline conformance and speed benchmark of the TLS libraries used for site checks.
+
+Generates a CA hierarchy and certificates for every scenario at startup, serves each of them
+from a TLS server on the loopback interface and runs the client libraries against all of them
+concurrently, multiple rounds. Reports whether the libraries accepted or refused the servers
+compared to the expected result and the latency percentiles of the handshakes per library.
+
+Usage: python crypto_lib_matrix.py [--rounds 20] [--concurrency 8]
+"""
 import ssl
+import time
 import socket
+import argparse
+import tempfile
+import threading
+import socketserver
+from pathlib import Path
+from concurrent import futures
 import certifi
-from oscrypto.tls import TLSSocket
-from urllib3.connection import VerifiedHTTPSConnection
-
-
-CERTIFI_CA_FILE = certifi.where()
-ALL_BADSSL_SUBDOMAINS = (
-    # 🎫Certificate
-    ('expired', '❌'),
-    ('wrong.host', '❌'),
-    ('self-signed', '❌'),
-    ('untrusted-root', '❌'),
-    ('revoked', '❌'),
-    ('incomplete-chain', '⚠'),
-    ('sha256', '✅'),
-    ('1000-sans', '✅'),
-    ('10000-sans', '✅'),
-    ('ecc256', '✅'),
-    ('ecc384', '✅'),
-    ('rsa8192', '⚠'),
-
-    # 🖼Mixed Content
-    ('mixed-script', '❌'),
-    ('very', '❌'),
-    ('mixed', '⚠'),
-    ('mixed-favicon', '⚠'),
-
-    # ✏️HTTP Input
-    ('http-password', '❌'),
-    ('http-login', '❌'),
-    ('http-dynamic-login', '❌'),
-    ('http-credit-card', '❌'),
-
-    # 🔀Cipher Suite
-    ('cbc', '⚠'),
-    ('rc4-md5', '❌'),
-    ('rc4', '❌'),
-    ('3des', '❌'),
-    ('null', '❌'),
-    ('mozilla-old', '❌'),
-    ('mozilla-intermediate', '⚠'),
-    ('mozilla-modern', '✅'),
-
-    # 🔑Key Exchange
-    ('dh480', '❌'),
-    ('dh512', '❌'),
-    ('dh1024', '⚠'),
-    ('dh2048', '✅'),
-    ('dh-small-subgroup', '❌'),
-    ('dh-composite', '❌'),
-    ('static-rsa', '⚠'),
-
-    # ⬆️Upgrade
-    ('hsts', '✅'),
-    ('upgrade', '✅'),
-    ('preloaded-hsts', '✅'),
-    ('subdomain.preloaded-hsts', '❌'),
-    ('https-everywhere', '✅'),
-
-    # 💬Miscellaneous
-    ('http', '⚠'),
-    ('spoofed-favicon', '⚠'),
-    ('pinning-test', '❌'),
-    ('long-extended-subdomain-name-containing-many-letters-and-dashes', '✅'),
-    ('longextendedsubdomainnamewithoutdashesinordertotestwordwrapping', '✅'),
-
-    # ❌Known Bad
-    ('superfish', '❌'),
-    ('edellroot', '❌'),
-    ('dsdtestprovider', '❌'),
-
-    # ☠️Defunct
-    ('sha1-2016', '❌'),
-    ('sha1-2017', '❌'),
-)
-
-OTHER_DOMAINS = (
-    ('badssl.com', '✅'),
-    ('officecontrol.hu', '✅'),
-    ('google.com', '✅'),
-    ('facebook.com', '✅'),
-    ('twitter.com', '✅'),
-    ('instagram.com', '✅'),
-    ('anteus.hu', '❌'),
-)
-
-
-def with_openssl(domain):
-    # this was always good: ssl.get_server_certificate((domain, 443))
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    context = ssl.create_default_context()
-    ssl_sock = context.wrap_socket(sock, server_hostname=domain)
-    ssl_sock.connect((domain, 443))
-
-
-def with_openssl_certifi(domain):
-    # this was always bad: ssl.get_server_certificate((domain, 443), ca_certs=CERTIFI_CA_FILE)
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    context = ssl.create_default_context(cafile=CERTIFI_CA_FILE)
-    ssl_sock = context.wrap_socket(sock, server_hostname=domain)
-    ssl_sock.connect((domain, 443))
-
-
-def with_oscrypto(domain):
-    TLSSocket(domain, 443)
-
-
-def with_urllib3(domain):
-    conn = VerifiedHTTPSConnection(domain)
-    conn.set_cert(cert_reqs='CERT_REQUIRED')
-    conn.connect()
-
-
-# def with_urllib3_certifi(domain):
-
-
-def run_and_catch(func, domain):
+import asn1crypto.pem as asn1pem
+import asn1crypto.algos as asn1algos
+from oscrypto import asymmetric
+from oscrypto.tls import TLSSocket, TLSSession
+from tests.certmaker import CertMaker
+
+try:
+    from urllib3.connection import HTTPSConnection
+except ImportError:
+    HTTPSConnection = None
+
+
+VALID, INVALID, WARNING = '✅', '❌', '⚠'
+HOSTNAME = 'localhost'
+
+# RFC 2409 Oakley Group 2 (1024 bit) and RFC 3526 Group 14 (2048 bit) MODP primes, generator 2
+DH1024_PRIME = int(
+    'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA63B139B22514A0879'
+    '8E3404DDEF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B'
+    '0BFF5CB6F406B7EDEE386BFB5A899FA5AE9F24117C4B1FE649286651ECE65381FFFFFFFFFFFFFFFF', 16)
+DH2048_PRIME = int(
+    'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA63B139B22514A0879'
+    '8E3404DDEF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B'
+    '0BFF5CB6F406B7EDEE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF0598DA4836'
+    '1C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB9ED529077096966D670C354E4ABC9804'
+    'F1746C08CA18217C32905E462E36CE3BE39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF6'
+    '955817183995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF', 16)
+
+
+def dh_params_pem(prime):
+    return asn1pem.armor('DH PARAMETERS', asn1algos.DHParameters({'p': prime, 'g': 2}).dump())
+
+
+class Scenario:
+    def __init__(self, name, expected, chain, key, dh_prime=None):
+        self.name = name
+        self.expected = expected
+        self.chain = chain
+        self.key = key
+        self.dh_prime = dh_prime
+
+    def server_context(self, workdir: Path):
+        cert_file = workdir / f'{self.name}.crt'
+        key_file = workdir / f'{self.name}.key'
+        cert_file.write_text(''.join(CertMaker.pem(cert) for cert in self.chain))
+        key_file.write_bytes(asymmetric.dump_private_key(self.key, None, target_ms=1))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        # the server should serve anything, it's up to the clients to refuse weak parameters
+        context.set_ciphers('DEFAULT:@SECLEVEL=0')
+        context.load_cert_chain(str(cert_file), str(key_file))
+        if self.dh_prime is not None:
+            # DHE key exchange is only possible up to TLS 1.2
+            dh_file = workdir / f'{self.name}.dh'
+            dh_file.write_bytes(dh_params_pem(self.dh_prime))
+            context.load_dh_params(str(dh_file))
+            context.maximum_version = ssl.TLSVersion.TLSv1_2
+            context.set_ciphers('DHE-RSA-AES128-GCM-SHA256:@SECLEVEL=0')
+        return context
+
+
+def make_scenarios():
+    maker = CertMaker()
+    root, root_key = maker.ca, maker.ca_key
+    inter_key = maker.key()
+    inter = maker.make('Certmaestro Test Intermediate', inter_key, issuer=(root, root_key[1]),
+                       ca=True)
+    other_root_key = maker.key()
+    other_root = maker.make('Untrusted Root', other_root_key, ca=True, self_signed=True,
+                            days=(-10, 3650))
+
+    def leaf(issuer=(inter, inter_key[1]), **kwargs):
+        key_pair = kwargs.pop('key_pair', None) or leaf_key
+        return maker.make(kwargs.pop('common_name', HOSTNAME), key_pair, issuer=issuer,
+                          self_signed=issuer is None, **kwargs), key_pair[1]
+
+    leaf_key = maker.key()
+    ec_key = maker.key('ec')
+    weak_key = maker.key(bit_size=1024)
+
+    scenarios = []
+
+    def add(name, expected, cert_and_key, extra_chain=(inter,), **kwargs):
+        cert, key = cert_and_key
+        scenarios.append(Scenario(name, expected, [cert, *extra_chain], key, **kwargs))
+
+    add('valid', VALID, leaf())
+    add('expired', INVALID, leaf(days=(-60, -30)))
+    add('not-yet-valid', INVALID, leaf(days=(30, 60)))
+    add('wrong.host', INVALID, leaf(common_name='wrong.host.invalid'))
+    add('self-signed', INVALID, leaf(issuer=None), extra_chain=())
+    add('untrusted-root', INVALID, leaf(issuer=(other_root, other_root_key[1])), extra_chain=())
+    add('incomplete-chain', WARNING, leaf(), extra_chain=())
+    add('ecc256', VALID, leaf(key_pair=ec_key))
+    add('rsa1024', INVALID, leaf(key_pair=weak_key))
+    add('sha1', INVALID, leaf(hash_algo='sha1'))
+    add('1000-sans', VALID, leaf(sans=[HOSTNAME] + [f'san{n}.example.com' for n in range(999)]))
+    add('dh1024', WARNING, leaf(), dh_prime=DH1024_PRIME)
+    add('dh2048', VALID, leaf(), dh_prime=DH2048_PRIME)
+    return root, scenarios
+
+
+class TLSServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, context):
+        self.context = context
+        super().__init__(('127.0.0.1', 0), TLSHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class TLSHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            with self.server.context.wrap_socket(self.request, server_side=True) as ssl_sock:
+                ssl_sock.recv(1)
+        except (OSError, ssl.SSLError):
+            pass
+
+
+class Clients:
+    """The libraries to compare, all of them trusting our test root certificate."""
+
+    def __init__(self, root, workdir: Path):
+        self.root_file = workdir / 'root.crt'
+        self.root_file.write_text(CertMaker.pem(root))
+        self.certifi_file = workdir / 'certifi-and-root.crt'
+        self.certifi_file.write_text(Path(certifi.where()).read_text() + CertMaker.pem(root))
+        self.root = root
+
+    def all(self):
+        clients = {
+            'OpenSSL': self.with_openssl,
+            'OpenSSL Certifi': self.with_openssl_certifi,
+            'OSCrypto': self.with_oscrypto,
+        }
+        if HTTPSConnection is not None:
+            clients['urllib3'] = self.with_urllib3
+        return clients
+
+    def with_openssl(self, port):
+        context = ssl.create_default_context()
+        context.load_verify_locations(cafile=str(self.root_file))
+        with socket.create_connection((HOSTNAME, port), timeout=5) as sock:
+            with context.wrap_socket(sock, server_hostname=HOSTNAME):
+                pass
+
+    def with_openssl_certifi(self, port):
+        context = ssl.create_default_context(cafile=str(self.certifi_file))
+        with socket.create_connection((HOSTNAME, port), timeout=5) as sock:
+            with context.wrap_socket(sock, server_hostname=HOSTNAME):
+                pass
+
+    def with_oscrypto(self, port):
+        session = TLSSession(extra_trust_roots=[self.root])
+        TLSSocket(HOSTNAME, port, timeout=5, session=session).close()
+
+    def with_urllib3(self, port):
+        conn = HTTPSConnection(HOSTNAME, port, timeout=5, cert_reqs='CERT_REQUIRED',
+                               ca_certs=str(self.root_file))
+        conn.connect()
+        conn.close()
+
+
+def run_and_measure(func, port):
+    start = time.perf_counter()
     try:
-        func(domain)
-        return '✅'
+        func(port)
+        result = VALID
     except Exception:
-        return '❌'
+        result = INVALID
+    return result, time.perf_counter() - start
 
 
-def print_matrix_line(format_str, domain, marked_as):
-    print(format_str.format(domain[:38],
-                            marked_as,
-                            run_and_catch(with_openssl, domain),
-                            run_and_catch(with_openssl_certifi, domain),
-                            run_and_catch(with_oscrypto, domain),
-                            run_and_catch(with_urllib3, domain)))
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
 
 
 def main():
-    format_str = '{:<40}{:<10}{:<10}{:<20}{:<15}{}'
-    print(format_str.format('Subdomain', 'Marked', 'OpenSSL', 'OpenSSL Certifi',
-                            'OSCrypto', 'urllib3'))
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--rounds', type=int, default=20, help='Handshakes per library/scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel handshakes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = Path(tmpdir)
+        root, scenarios = make_scenarios()
+        servers = {scenario.name: TLSServer(scenario.server_context(workdir))
+                   for scenario in scenarios}
+        for server in servers.values():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        clients = Clients(root, workdir).all()
+        jobs = [(scenario, name, func) for scenario in scenarios for name, func in clients.items()
+                for _ in range(args.rounds)]
+        results, latencies = {}, {name: [] for name in clients}
+        with futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            job_futures = {executor.submit(run_and_measure, func, servers[scenario.name].port):
+                           (scenario.name, name) for scenario, name, func in jobs}
+            for future in futures.as_completed(job_futures):
+                scenario_name, client_name = job_futures[future]
+                result, latency = future.result()
+                results.setdefault((scenario_name, client_name), set()).add(result)
+                latencies[client_name].append(latency)
+
+        for server in servers.values():
+            server.shutdown()
+            server.server_close()
+
+    format_str = '{:<20}{:<10}' + '{:<18}' * len(clients)
+    print(format_str.format('Scenario', 'Expected', *clients))
+    mismatches = {name: 0 for name in clients}
+    for scenario in scenarios:
+        row = []
+        for client_name in clients:
+            outcomes = results[(scenario.name, client_name)]
+            # a flaky result over the rounds is shown as a warning
+            result = outcomes.pop() if len(outcomes) == 1 else WARNING
+            if scenario.expected != WARNING and result != scenario.expected:
+                mismatches[client_name] += 1
+            row.append(result)
+        print(format_str.format(scenario.name, scenario.expected, *row))
 
-    BADSSL_DOMAINS = map(lambda s: (s[0] + '.badssl.com', s[1]), ALL_BADSSL_SUBDOMAINS)
-    for domain, marked_as in tuple(BADSSL_DOMAINS) + OTHER_DOMAINS:
-        print_matrix_line(format_str, domain, marked_as)
+    print()
+    print('{:<18}{:>10}{:>10}{:>10}{:>10}{:>12}'.format('Library', 'p50 ms', 'p90 ms', 'p99 ms',
+                                                        'max ms', 'mismatches'))
+    for client_name, values in latencies.items():
+        values.sort()
+        p50, p90, p99 = (percentile(values, f) * 1000 for f in (0.5, 0.9, 0.99))
+        print('{:<18}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>12}'.format(
+            client_name, p50, p90, p99, values[-1] * 1000, mismatches[client_name]))
 
 
 if __name__ == '__main__':
@@ -11,6 +11,11 @@ install_requires = [
     'Jinja2',
 ]
 
+extras_require = {
+    'postgres': ['psycopg2'],
+    'mysql': ['PyMySQL'],
+}
+
 console_scripts = [
     'certmaestro = certmaestro.cli.groups:main',
 ]
@@ -20,7 +25,7 @@ classifiers = [
     'Development Status :: 1 - Planning',
     'Programming Language :: Python',
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.6',
+    'Programming Language :: Python :: 3.8',
     'Topic :: Security',
 ]
 
@@ -34,6 +39,8 @@ setup(
     url='https://www.certmaestro.com',
     license='MIT',
     packages=find_packages(),
+    python_requires='>=3.8',
     install_requires=install_requires,
+    extras_require=extras_require,
     entry_points={'console_scripts': console_scripts}
 )
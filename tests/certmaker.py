@@ -0,0 +1,93 @@
+"""
+Certificates for the tests, benchmarks and crypto_lib_matrix.py.
+Plain module without pytest, so scripts can import it too.
+"""
+import datetime
+import ipaddress
+import asn1crypto.x509 as asn1x509
+import asn1crypto.pem as asn1pem
+from oscrypto import asymmetric
+
+
+class CertMaker:
+    """Makes certificates signed by a test CA, without needing the openssl binary."""
+
+    def __init__(self):
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+        self._serial = 1000
+        self.ca_key = self.key()
+        self.ca = self.make('Certmaestro Test CA', self.ca_key, ca=True, self_signed=True)
+
+    @staticmethod
+    def key(algorithm='rsa', bit_size=2048):
+        if algorithm == 'ec':
+            return asymmetric.generate_pair('ec', curve='secp256r1')
+        return asymmetric.generate_pair('rsa', bit_size=bit_size)
+
+    def make(self, common_name, key_pair=None, *, ca=False, self_signed=False, sans=None,
+             days=(-1, 30), serial=None, issuer=None, hash_algo='sha256'):
+        """Signed by the test CA, or by issuer, which is a (cert, private_key) pair.
+        days is the validity period relative to now.
+        """
+        public_key, private_key = key_pair or self.ca_key
+        if self_signed:
+            issuer_cert, issuer_key = None, private_key
+        else:
+            issuer_cert, issuer_key = issuer or (self.ca, self.ca_key[1])
+        subject = asn1x509.Name.build({'common_name': common_name})
+        extensions = [
+            {'extn_id': 'basic_constraints', 'critical': True, 'extn_value': {'ca': ca}},
+            {'extn_id': 'key_identifier', 'critical': False,
+             'extn_value': public_key.asn1.sha1},
+            {'extn_id': 'key_usage', 'critical': True,
+             'extn_value': {'key_cert_sign', 'crl_sign'} if ca else
+                           {'digital_signature', 'key_encipherment'}},
+        ]
+        if issuer_cert is not None:
+            extensions.append({'extn_id': 'authority_key_identifier', 'critical': False,
+                               'extn_value': {'key_identifier': issuer_cert.key_identifier}})
+        if not ca:
+            extensions.append({'extn_id': 'subject_alt_name', 'critical': False,
+                               'extn_value': [self._general_name(name)
+                                              for name in (sans or [common_name])]})
+        if serial is None:
+            self._serial += 1
+            serial = self._serial
+        signature_algorithm = f'{hash_algo}_{"ecdsa" if issuer_key.algorithm == "ec" else "rsa"}'
+        not_before, not_after = (self.now + datetime.timedelta(days=d) for d in days)
+        tbs = asn1x509.TbsCertificate({
+            'version': 'v3',
+            'serial_number': serial,
+            'signature': {'algorithm': signature_algorithm},
+            'issuer': issuer_cert.subject if issuer_cert is not None else subject,
+            'validity': {'not_before': asn1x509.Time({'utc_time': not_before}),
+                         'not_after': asn1x509.Time({'utc_time': not_after})},
+            'subject': subject,
+            'subject_public_key_info': public_key.asn1,
+            'extensions': extensions,
+        })
+        if issuer_key.algorithm == 'ec':
+            signature = asymmetric.ecdsa_sign(issuer_key, tbs.dump(), hash_algo)
+        else:
+            signature = asymmetric.rsa_pkcs1v15_sign(issuer_key, tbs.dump(), hash_algo)
+        return asn1x509.Certificate({
+            'tbs_certificate': tbs,
+            'signature_algorithm': {'algorithm': signature_algorithm},
+            'signature_value': signature,
+        })
+
+    @staticmethod
+    def _general_name(name):
+        try:
+            ipaddress.ip_address(name)
+        except ValueError:
+            return asn1x509.GeneralName({'dns_name': name})
+        return asn1x509.GeneralName({'ip_address': name})
+
+    @staticmethod
+    def pem(cert):
+        return asn1pem.armor('CERTIFICATE', cert.dump()).decode()
+
+    @staticmethod
+    def key_pem(key_pair):
+        return asymmetric.dump_private_key(key_pair[1], None, target_ms=1).decode()
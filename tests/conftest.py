@@ -0,0 +1,72 @@
+import pytest
+import collections
+import asn1crypto.crl as asn1crl
+import asn1crypto.x509 as asn1x509
+from certmaestro.backends.interfaces import CertQuery, IBackend
+from certmaestro.csr import CsrPolicy
+from certmaestro.exceptions import BackendError
+from certmaestro.wrapper import Cert, PrivateKey, RevokedCert, SerialNumber
+from certmaker import CertMaker
+
+
+@pytest.fixture(scope='session')
+def cert_maker():
+    return CertMaker()
+
+
+class FakeBackend(IBackend):
+    """Keeps the certificates made by a CertMaker in memory and counts the calls."""
+    name = 'Fake'
+    description = 'Certificates in memory'
+    threadsafe = False
+    init_requires = ()
+    version = 'Fake 1.0'
+
+    def __init__(self, cert_maker):
+        self.cert_maker = cert_maker
+        self.certs = {}
+        self.calls = collections.Counter()
+
+    def get_ca_cert(self):
+        self.calls['get_ca_cert'] += 1
+        return Cert(self.cert_maker.pem(self.cert_maker.ca))
+
+    def get_csr_policy(self):
+        return {'common_name': CsrPolicy.REQUIRED, 'country': CsrPolicy.OPTIONAL}
+
+    def get_csr_defaults(self):
+        return {'country': 'HU'}
+
+    def issue_cert(self, csr):
+        self.calls['issue_cert'] += 1
+        cert = Cert(self.cert_maker.pem(self.cert_maker.make(csr.common_name)))
+        self.certs[cert.serial_number] = cert
+        return PrivateKey('key of ' + csr.common_name), cert
+
+    def revoke_cert(self, serial):
+        serial_number = SerialNumber(serial)
+        if serial_number not in self.certs:
+            raise BackendError(f'No such certificate: {serial}')
+        return RevokedCert.from_asn1(asn1crl.RevokedCertificate({
+            'user_certificate': int(serial_number),
+            'revocation_date': asn1x509.Time({'utc_time': self.cert_maker.now}),
+        }))
+
+    def list_certs(self, query=None):
+        # nothing is revoked for real
+        return (query or CertQuery()).apply(self.certs.values(), set)
+
+    def get_cert(self, serial):
+        self.calls['get_cert'] += 1
+        cert = self.certs.get(SerialNumber(serial))
+        if cert is None:
+            raise BackendError(f'No such certificate: {serial}')
+        return cert
+
+    def get_crl(self):
+        raise ValueError('no CRL')
+
+
+@pytest.fixture
+def fake_backend(cert_maker):
+    return FakeBackend(cert_maker)
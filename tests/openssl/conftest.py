@@ -0,0 +1,10 @@
+import shutil
+import pytest
+from openssl_ca import make_openssl_ca
+
+
+@pytest.fixture
+def openssl_backend(tmp_path):
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl is not installed')
+    return make_openssl_ca(tmp_path)
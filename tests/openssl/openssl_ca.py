@@ -0,0 +1,55 @@
+"""
+A new CA for the OpenSSL backend made with the openssl binary, for the tests and benchmarks.
+Plain module without pytest, so scripts can import it too.
+"""
+import subprocess
+from pathlib import Path
+from certmaestro.backends.openssl import Backend
+
+
+OPENSSL_CNF = """\
+[ ca ]
+default_ca = CA_default
+
+[ CA_default ]
+dir = .
+certs = $dir/certs
+new_certs_dir = $dir/newcerts
+database = $dir/index.txt
+serial = $dir/serial
+certificate = $dir/ca.pem
+private_key = $dir/ca.key
+default_md = sha256
+default_days = 30
+policy = policy_any
+
+[ policy_any ]
+countryName = optional
+stateOrProvinceName = optional
+localityName = optional
+organizationName = optional
+organizationalUnitName = optional
+commonName = supplied
+emailAddress = optional
+
+[ req ]
+default_bits = 2048
+distinguished_name = req_distinguished_name
+
+[ req_distinguished_name ]
+commonName = Common Name
+"""
+
+
+def make_openssl_ca(root_dir: Path) -> Backend:
+    """A new CA in root_dir, with openssl.cnf and the OpenSSL backend using it."""
+    (root_dir / 'certs').mkdir()
+    (root_dir / 'newcerts').mkdir()
+    (root_dir / 'index.txt').touch()
+    (root_dir / 'serial').write_text('1000\n')
+    config_file = root_dir / 'openssl.cnf'
+    config_file.write_text(OPENSSL_CNF)
+    subprocess.run(['openssl', 'req', '-config', config_file, '-x509', '-newkey', 'rsa:2048',
+                    '-nodes', '-subj', '/CN=OpenSSL Test CA', '-keyout', 'ca.key',
+                    '-out', 'ca.pem'], cwd=root_dir, check=True, capture_output=True)
+    return Backend(Path('openssl'), config_file, root_dir, root_dir / 'crl.pem')
@@ -0,0 +1,88 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from click.testing import CliRunner
+from certmaestro.backends.openssl import Backend
+from certmaestro.cli.groups import main
+from certmaestro.csr import CsrBuilder
+
+
+def issue(backend, common_name):
+    csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+    csr['common_name'] = common_name
+    return backend.issue_cert(csr)[1]
+
+
+def test_parallel_issuance(openssl_backend):
+    names = [f'host{i}.example.com' for i in range(8)]
+    with ThreadPoolExecutor(4) as executor:
+        certs = list(executor.map(lambda name: issue(openssl_backend, name), names))
+    assert len({cert.serial_number for cert in certs}) == len(names)
+    listed = {cert.serial_number: cert.subject.common_name
+              for cert in openssl_backend.list_certs()}
+    assert listed == {cert.serial_number: name for cert, name in zip(certs, names)}
+
+
+def _issue_in_process(root_dir, common_name):
+    backend = Backend(Path('openssl'), root_dir / 'openssl.cnf', root_dir, root_dir / 'crl.pem')
+    return issue(backend, common_name).serial_number.as_hex()
+
+
+def test_issuance_from_processes(openssl_backend, tmp_path):
+    # every process has its own backend, only the lock file is shared
+    with ProcessPoolExecutor(2) as executor:
+        serials = list(executor.map(_issue_in_process, [tmp_path] * 4,
+                                    [f'p{i}.example.com' for i in range(4)]))
+    assert len(set(serials)) == 4
+    assert len(list(openssl_backend.list_certs())) == 4
+
+
+def test_query(openssl_backend):
+    from certmaestro.backends.interfaces import CertQuery
+
+    certs = [issue(openssl_backend, name) for name in
+             ('api.example.com', 'www.example.com', 'API-2.example.com', 'mail.example.org')]
+    # revoked like openssl ca -revoke does it, the backend doesn't revoke
+    index_path = openssl_backend._db._file
+    lines = index_path.read_text().splitlines(keepends=True)
+    status, expiration, _, rest = lines[1].split('\t', 3)
+    lines[1] = '\t'.join(['R', expiration, '240101000000Z,superseded', rest])
+    index_path.write_text(''.join(lines))
+
+    def names(**query):
+        query = CertQuery(**query)
+        listed = list(openssl_backend.list_certs(query))
+        revoked = {certs[1].serial_number}
+        assert [c.der for c in listed] == \
+            [c.der for c in query.apply(openssl_backend.list_certs(), lambda: revoked)]
+        return [c.subject.common_name for c in listed]
+
+    assert names(status='revoked') == ['www.example.com']
+    assert names(status='valid', common_name='API*') == ['api.example.com', 'API-2.example.com']
+    assert names(status='expired') == []
+    assert names(common_name='*.org', issued_before=certs[-1].not_valid_before) == \
+        ['mail.example.org']
+    assert names(sort='serial', offset=1, limit=2) == ['www.example.com', 'API-2.example.com']
+    query = CertQuery(sort='expiry', limit=3)
+    first_page = list(openssl_backend.list_certs(query))
+    assert len(first_page) == 3
+    assert [c.subject.common_name for c in openssl_backend.list_certs(
+        query.next_page(first_page[-1]))] == names(sort='expiry')[3:]
+
+
+def test_search_without_crl(openssl_backend, tmp_path):
+    issue(openssl_backend, 'search.example.com')
+    assert not (tmp_path / 'crl.pem').exists()
+    config_path = tmp_path / 'certmaestro.ini'
+    config_path.write_text(f'[certmaestro]\nbackend = OpenSSL\n\n[OpenSSL]\n'
+                           f'openssl_binary = openssl\nconfig_file = {tmp_path}/openssl.cnf\n'
+                           f'root_dir = {tmp_path}\ncrl_file = {tmp_path}/crl.pem\n')
+    result = CliRunner().invoke(main, ['-c', str(config_path), 'cert', 'search', '.example.com'])
+    assert result.exit_code == 0, result.output
+    assert 'search.example.com' in result.stdout and 'valid' in result.stdout
+
+
+def test_pack_certs(openssl_backend):
+    certs = [issue(openssl_backend, f'pack{i}.example.com') for i in range(3)]
+    assert openssl_backend.pack_certs() == 3
+    for cert in certs:
+        assert openssl_backend.get_cert(str(cert.serial_number)).der == cert.der
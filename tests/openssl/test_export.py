@@ -0,0 +1,27 @@
+import subprocess
+from certmaestro.backends.sqlite import Backend as SqliteBackend
+from certmaestro.csr import CsrBuilder
+from certmaestro.migrate import Migration
+
+
+def issue(backend, common_name):
+    csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+    csr['common_name'] = common_name
+    return backend.issue_cert(csr)[1]
+
+
+def test_migrate_to_sqlite(openssl_backend, tmp_path):
+    certs = [issue(openssl_backend, f'host{i}.example.com') for i in range(3)]
+    revoked = certs[1]
+    subprocess.run(['openssl', 'ca', '-config', 'openssl.cnf', '-revoke',
+                    f'newcerts/{revoked.serial_number.as_hex().upper()}.pem',
+                    '-crl_reason', 'keyCompromise'],
+                   cwd=tmp_path, check=True, capture_output=True)
+
+    destination = SqliteBackend(tmp_path / 'migrated.sqlite3', busy_timeout=5, pool_size=2)
+    migration = Migration(openssl_backend, destination, tmp_path / 'checkpoint.json')
+    assert migration.migrate_ca()
+    summary = migration.verify(migration.run())
+    assert (summary.count, summary.revoked, summary.keys) == (3, 1, 3)
+    assert [(rc.serial_number, rc.reason.native) for rc in destination.get_crl()] == \
+        [(revoked.serial_number, 'key_compromise')]
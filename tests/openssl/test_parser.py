@@ -29,3 +29,31 @@ class TestDatabaseParser:
     def test_get_by_serial_on_single_entry(self, data_dir):
         db = OpenSSLDbParser(data_dir / 'one_valid.txt')
         assert db.get_by_serial_number('01').name == Name('/C=HU/L=Budapest/O=asf')
+
+
+class TestConcurrentChanges:
+    LINE = 'V\t300101000000Z\t\t{serial}\tunknown\t/CN=host{serial}\n'
+
+    def test_partial_line_is_not_read(self, tmp_path):
+        db_file = tmp_path / 'index.txt'
+        db_file.write_text(self.LINE.format(serial='01') + self.LINE.format(serial='02')[:10])
+        assert [e.name.common_name for e in OpenSSLDbParser(db_file)] == ['host01']
+
+    def test_last_line_without_newline(self, tmp_path):
+        db_file = tmp_path / 'index.txt'
+        db_file.write_text(self.LINE.format(serial='01') + self.LINE.format(serial='02')[:-1])
+        db = OpenSSLDbParser(db_file)
+        assert [e.name.common_name for e in db] == ['host01', 'host02']
+        assert db.get_by_serial('02').name.common_name == 'host02'
+
+    def test_replaced_file_is_mapped_again(self, tmp_path):
+        db_file = tmp_path / 'index.txt'
+        db_file.write_text(self.LINE.format(serial='01'))
+        db = OpenSSLDbParser(db_file)
+        entries = iter(db)
+        # openssl ca writes index.txt.new and renames it
+        new_file = tmp_path / 'index.txt.new'
+        new_file.write_text(self.LINE.format(serial='01') + self.LINE.format(serial='02'))
+        new_file.rename(db_file)
+        assert [e.name.common_name for e in entries] == ['host01']
+        assert [e.name.common_name for e in db] == ['host01', 'host02']
@@ -0,0 +1,87 @@
+import json
+import threading
+import http.client
+import pytest
+from certmaestro.api import ApiServer, BackendExecutor
+
+
+@pytest.fixture
+def request_api(fake_backend):
+    server = ApiServer(fake_backend, port=0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.start()
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+
+    def request(method, path, body=None):
+        connection.request(method, path, body=json.dumps(body) if body is not None else None)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    yield request
+    connection.close()
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_issue_get_and_revoke(request_api):
+    status, issued = request_api('POST', '/certs', {'common_name': 'api.example.com'})
+    assert status == 200
+    assert issued['key'] == 'key of api.example.com'
+    serial = issued['cert']['serial_number']
+
+    status, cert = request_api('GET', f'/certs/{serial}')
+    assert (status, cert) == (200, issued['cert'])
+    status, certs = request_api('GET', '/certs')
+    assert [c['common_name'] for c in certs] == ['api.example.com']
+
+    status, revoked = request_api('POST', f'/certs/{serial}/revoke')
+    assert (status, revoked['serial_number']) == (200, serial)
+
+
+def test_ca(request_api):
+    status, ca = request_api('GET', '/ca')
+    assert ca['common_name'] == 'Certmaestro Test CA'
+    assert ca['pem'].startswith('-----BEGIN CERTIFICATE-----')
+
+
+@pytest.mark.parametrize('method, path, body, expected', [
+    ('GET', '/nothing', None, (404, 'Not found: GET /nothing')),
+    ('GET', '/certs/ff', None, (400, 'No such certificate: ff')),
+    ('POST', '/certs', {}, (400, 'common_name is required')),
+    ('POST', '/certs', {'common_name': 'a', 'color': 'red'}, (400, 'Unknown subject field: color')),
+    ('POST', '/certs', [], (400, 'Expected a JSON object')),
+])
+def test_errors(request_api, method, path, body, expected):
+    status, response = request_api(method, path, body)
+    assert (status, response['error']) == expected
+
+
+def test_no_crl(request_api, fake_backend):
+    fake_backend.get_crl = lambda: None
+    assert request_api('GET', '/crl') == (404, {'error': 'No CRL has been made yet'})
+
+
+def test_queued_reads_are_coalesced(fake_backend):
+    executor = BackendExecutor(fake_backend)
+    release = threading.Event()
+    # keeps the only backend thread busy, so the others queue up
+    blocking = executor.submit(lambda backend: release.wait())
+    futures = [executor.submit(lambda backend: backend.get_ca_cert(), coalesce=False)]
+    futures += [executor.submit(type(fake_backend).get_ca_cert, coalesce=True) for _ in range(5)]
+    release.set()
+    blocking.result()
+    assert len({f.result().serial_number for f in futures}) == 1
+    assert fake_backend.calls['get_ca_cert'] == 2
+    assert executor.coalesced == 4
+    executor.shutdown()
+
+
+def test_threadsafe_backend_runs_in_parallel(fake_backend):
+    fake_backend.threadsafe = True
+    executor = BackendExecutor(fake_backend, workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+    # would time out if the calls were serialized
+    futures = [executor.submit(lambda backend: barrier.wait()) for _ in range(2)]
+    assert sorted(f.result() for f in futures) == [0, 1]
+    executor.shutdown()
@@ -0,0 +1,69 @@
+import pytest
+from oscrypto import asymmetric
+from certmaestro.chain import ChainValidator, TrustStore, validate_certs
+from certmaestro.exceptions import ChainError
+from certmaestro.wrapper import Cert
+
+
+@pytest.fixture(scope='module')
+def pki(cert_maker):
+    """Root (the test CA) -> intermediate -> leaf, and a leaf signed directly by the root."""
+    other_key = asymmetric.generate_pair('rsa', bit_size=2048)
+    intermediate = cert_maker.make('Intermediate CA', other_key, ca=True)
+    certs = {
+        'root': cert_maker.ca,
+        'intermediate': intermediate,
+        'leaf': cert_maker.make('leaf.example.com',
+                                issuer=(intermediate, other_key[1])),
+        'direct': cert_maker.make('direct.example.com'),
+        'expired': cert_maker.make('expired.example.com', days=(-10, -1)),
+        # claims to be issued by the CA, but signed with another key
+        'forged': cert_maker.make('forged.example.com', issuer=(cert_maker.ca, other_key[1])),
+        'self_signed': cert_maker.make('self.example.com', other_key, self_signed=True),
+    }
+    return {name: Cert(cert_maker.pem(cert)) for name, cert in certs.items()}
+
+
+@pytest.fixture
+def trust_store(pki):
+    return TrustStore([pki['root']], [pki['intermediate']])
+
+
+def test_chain_through_intermediate(pki, trust_store):
+    chain = ChainValidator(trust_store).build_chain(pki['leaf'])
+    assert [c.subject.common_name for c in chain] == ['leaf.example.com', 'Intermediate CA',
+                                                      'Certmaestro Test CA']
+
+
+def test_missing_intermediate(pki):
+    validator = ChainValidator(TrustStore([pki['root']]))
+    with pytest.raises(ChainError, match='Issuer not found: Intermediate CA'):
+        validator.build_chain(pki['leaf'])
+
+
+@pytest.mark.parametrize('name, error', [
+    ('direct', None),
+    ('root', None),
+    ('expired', 'Expired: expired.example.com'),
+    ('forged', 'Signature of forged.example.com does not match the issuer'),
+    ('self_signed', 'Self-signed certificate is not trusted: self.example.com'),
+])
+def test_validate(pki, trust_store, name, error):
+    assert ChainValidator(trust_store).validate(pki[name]).error == error
+
+
+def test_signatures_are_verified_once(pki, trust_store):
+    validator = ChainValidator(trust_store)
+    validator.validate(pki['leaf'])
+    validator.validate(pki['leaf'])
+    assert validator.signature_cache.misses == 2
+    assert validator.signature_cache.hits == 2
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_validate_certs_keeps_order(pki, trust_store, workers):
+    certs = [pki['leaf'], pki['forged'], pki['direct']] * 3
+    results = list(validate_certs(certs, trust_store, workers=workers, batch_size=2))
+    assert [r.cert for r in results] == certs
+    assert [r.valid for r in results] == [True, False, True] * 3
+    assert [c.subject.common_name for c in results[0].chain][-1] == 'Certmaestro Test CA'
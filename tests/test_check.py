@@ -0,0 +1,215 @@
+import ssl
+import time
+import socket
+import threading
+import socketserver
+import pytest
+from certmaestro import check
+from certmaestro.check import CheckSiteManager, CheckError, backoff_delay
+from certmaestro.resolver import Resolver, Timings
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(check.time, 'sleep', lambda seconds: None)
+
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestBackoff:
+    def test_delay_is_capped(self):
+        assert all(0 <= backoff_delay(attempt, cap=2.0) <= 2.0 for attempt in range(20))
+
+    def test_delay_grows_exponentially(self):
+        assert max(backoff_delay(0, base=1) for _ in range(100)) <= 1
+        assert max(backoff_delay(3, base=1) for _ in range(100)) > 1
+
+
+class TestTargets:
+    def test_ports_are_kept_and_duplicates_removed(self):
+        urls = ['https://example.com', 'example.com:443', 'example.com:8443', 'http://insecure.com']
+        manager = CheckSiteManager(urls, redirect=False)
+        assert [target for url, target, reason in manager._parse_urls()] == [
+            ('example.com', 443), ('example.com', 8443), None
+        ]
+
+    def test_invalid_urls_are_skipped(self):
+        assert check.parse_target('example.com:notaport') == (None, 'invalid url')
+        assert check.parse_target('http://example.com') == (None, 'not https://')
+
+
+class TestStreaming:
+    def test_sites_are_checked_with_bounded_concurrency(self, monkeypatch):
+        running, max_running = [], []
+
+        def fake_check(hostname, port, timeout, resolver, handshake, tls_cache, full_handshake):
+            running.append(hostname)
+            max_running.append(len(running))
+            time.sleep(0.001)
+            running.remove(hostname)
+
+        monkeypatch.setattr(check, 'openssl_check_hostname', fake_check)
+        urls = (f'site{n}.com\n' for n in range(200))
+        resolver = Resolver(getaddrinfo=lambda *args: [])
+        manager = CheckSiteManager(urls, False, max_workers=4, max_in_flight=8, resolver=resolver)
+        results = manager.check_sites()
+        first = next(results)
+        assert first.succeeded and manager.total_count < 200
+        assert sum(1 for _ in results) == 199
+        assert manager.total_count == manager.success_count == 200
+        assert max(max_running) <= 4
+
+    def test_sessions_are_only_resumed_on_request(self, monkeypatch):
+        full_handshakes = []
+
+        def fake_check(hostname, port, timeout, resolver, handshake, tls_cache, full_handshake):
+            full_handshakes.append(full_handshake)
+
+        monkeypatch.setattr(check, 'openssl_check_hostname', fake_check)
+        resolver = Resolver(getaddrinfo=lambda *args: [])
+        list(CheckSiteManager(['a.com'], False, resolver=resolver).check_sites())
+        list(CheckSiteManager(['a.com'], False, resolver=resolver,
+                              full_handshake=False).check_sites())
+        assert full_handshakes == [True, False]
+
+    def test_result_as_dict(self):
+        site = check.CheckedSite('a.com:8443', check.CheckResult.FAILED, 'Timed out',
+                                 Timings(dns=0.1), host='a.com', port=8443)
+        assert site.as_dict() == {
+            'url': 'a.com:8443', 'host': 'a.com', 'port': 8443, 'verdict': 'FAILED',
+            'error': 'Timed out', 'expiry': None, 'issuer': None,
+            'timings': {'dns': 0.1, 'connect': None, 'tls': None},
+        }
+
+
+class TestRetries:
+    def _manager(self, monkeypatch, errors, retries):
+        attempts = []
+
+        def fake_check(hostname, port, timeout, resolver, handshake, tls_cache, full_handshake):
+            attempts.append((hostname, port, timeout))
+            return errors[len(attempts) - 1]
+
+        monkeypatch.setattr(check, 'openssl_check_hostname', fake_check)
+        monkeypatch.setattr(check, 'oscrypto_check_hostname', lambda *args: None)
+        resolver = Resolver(getaddrinfo=lambda *args: [])
+        manager = CheckSiteManager(['example.com:8443'], False, timeout=5, retries=retries,
+                                   resolver=resolver)
+        return manager, attempts
+
+    def test_transient_errors_are_retried(self, monkeypatch, no_sleep):
+        timeout = CheckError(check.TIMED_OUT, transient=True)
+        manager, attempts = self._manager(monkeypatch, [timeout, timeout, None], retries=3)
+        results = list(manager.check_sites())
+        assert attempts == [('example.com', 8443, 5)] * 3
+        assert results[0].succeeded and results[0].url == 'example.com:8443'
+
+    def test_retries_are_limited(self, monkeypatch, no_sleep):
+        timeout = CheckError(check.TIMED_OUT, transient=True)
+        manager, attempts = self._manager(monkeypatch, [timeout] * 3, retries=2)
+        results = list(manager.check_sites())
+        assert len(attempts) == 3
+        assert results[0].failed and results[0].message == check.TIMED_OUT
+
+    def test_certificate_errors_are_not_retried(self, monkeypatch, no_sleep):
+        manager, attempts = self._manager(monkeypatch, [CheckError('expired')], retries=3)
+        list(manager.check_sites())
+        assert len(attempts) == 1
+
+
+def test_refused_connection_is_transient(closed_port):
+    handshake = check.Handshake()
+    error = check.openssl_check_hostname('127.0.0.1', closed_port, timeout=1, handshake=handshake)
+    assert error.transient
+    assert handshake.timings.dns is not None and handshake.timings.tls is None
+
+
+@pytest.mark.parametrize('args, per_site', [([], False), (['--per-site-metrics'], True)])
+def test_site_metrics_are_opt_in(monkeypatch, tmp_path, args, per_site):
+    from click.testing import CliRunner
+    from certmaestro.cli.groups import main
+
+    monkeypatch.setattr(check, 'openssl_check_hostname', lambda *args: None)
+    hosts_file = tmp_path / 'hosts'
+    hosts_file.write_text('127.0.0.1 a.com\n')
+    metrics_file = tmp_path / 'sites.prom'
+    result = CliRunner().invoke(main, ['site', 'check', 'a.com', '--hosts-file', str(hosts_file),
+                                       '--metrics-file', str(metrics_file), *args])
+    assert result.exit_code == 0, result.output
+    metrics = metrics_file.read_text()
+    assert 'certmaestro_site_checks_total{verdict="succeeded"} 1' in metrics
+    assert ('certmaestro_site_check_success{' in metrics) == per_site
+
+
+def test_invalid_hostname(no_sleep):
+    resolver = Resolver(getaddrinfo=socket.getaddrinfo)
+    # two names, the second one waits for the failed lookup of the first
+    manager = CheckSiteManager(['a..example.com', 'a..example.com:8443'], False, timeout=1,
+                               retries=0, resolver=resolver)
+    results = list(manager.check_sites())
+    assert [r.failed for r in results] == [True, True]
+    assert results[0].message.startswith('Invalid hostname')
+
+
+@pytest.fixture(scope='module')
+def tls_server(cert_maker, tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('tls')
+    cert_file, key_file = tmp_path / 'localhost.crt', tmp_path / 'localhost.key'
+    cert_file.write_text(cert_maker.pem(cert_maker.make('localhost')))
+    key_file.write_text(cert_maker.key_pem(cert_maker.ca_key))
+    ca_file = tmp_path / 'ca.crt'
+    ca_file.write_text(cert_maker.pem(cert_maker.ca))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(str(cert_file), str(key_file))
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            try:
+                with context.wrap_socket(self.request, server_side=True) as ssl_sock:
+                    ssl_sock.recv(1)
+            except OSError:
+                pass
+
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1], ca_file
+    server.shutdown()
+    server.server_close()
+
+
+class TestTLSClientCache:
+    def check(self, tls_server, tls_cache, full_handshake=False):
+        port, ca_file = tls_server
+        handshake = check.Handshake()
+        resolver = Resolver(getaddrinfo=lambda *args: [(socket.AF_INET, socket.SOCK_STREAM, 6,
+                                                        '', ('127.0.0.1', 0))])
+        error = check.openssl_check_hostname('localhost', port, 2, resolver, handshake, tls_cache,
+                                             full_handshake)
+        assert error is None
+        return handshake
+
+    def test_sessions_are_resumed(self, tls_server):
+        tls_cache = check.TLSClientCache(cafile=tls_server[1])
+        assert not self.check(tls_server, tls_cache).resumed
+        second = self.check(tls_server, tls_cache)
+        assert second.resumed and second.cert.subject.common_name == 'localhost'
+        assert tls_cache.stats.contexts_created == 1 and tls_cache.stats.contexts_reused == 1
+        assert tls_cache.stats.resumed_handshakes == 1
+
+    def test_full_handshake_is_forced(self, tls_server):
+        tls_cache = check.TLSClientCache(cafile=tls_server[1])
+        self.check(tls_server, tls_cache)
+        assert not self.check(tls_server, tls_cache, full_handshake=True).resumed
+
+    def test_old_sessions_are_not_used(self, tls_server):
+        tls_cache = check.TLSClientCache(cafile=tls_server[1], max_session_age=0)
+        self.check(tls_server, tls_cache)
+        assert not self.check(tls_server, tls_cache).resumed
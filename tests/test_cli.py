@@ -0,0 +1,46 @@
+import sys
+import subprocess
+from pathlib import Path
+from click.testing import CliRunner
+from certmaestro.cli.groups import main
+
+
+# microseconds, a lot more than needed, but much less than importing everything eagerly
+STARTUP_IMPORT_BUDGET = 150_000
+SLOW_MODULES = {'jinja2', 'tabulate', 'hvac', 'oscrypto', 'asn1crypto', 'pkg_resources'}
+
+
+def import_times(code):
+    """{module: cumulative import time in microseconds} with python -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=Path(__file__).parent.parent, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_startup_imports():
+    times = import_times('from certmaestro.cli.groups import main')
+    assert times['certmaestro.cli.groups'] < STARTUP_IMPORT_BUDGET
+    imported = {module.split('.')[0] for module in times}
+    assert not imported & SLOW_MODULES
+    assert 'certmaestro.cli.groups.cert' not in times
+
+
+def test_commands_are_listed():
+    result = CliRunner().invoke(main, ['--help'])
+    assert result.exit_code == 0
+    for command in ('api', 'cert', 'config', 'crl', 'daemon', 'migrate', 'site', 'store',
+                    'version'):
+        assert f'  {command} ' in result.output
+
+
+def test_version_without_config(tmp_path):
+    result = CliRunner().invoke(main, ['-c', str(tmp_path / 'missing.ini'), 'version'])
+    assert result.exit_code == 0
+    assert result.output.startswith('Certmaestro ')
@@ -0,0 +1,99 @@
+import stat
+import datetime
+import threading
+import pytest
+from certmaestro.backends.interfaces import CertQuery
+from certmaestro.config import Config
+from certmaestro.csr import CsrBuilder, CsrPolicy
+from certmaestro.daemon import BackendDaemon, ConfigBackendLoader, connect
+from certmaestro.exceptions import BackendError
+from certmaestro.wrapper import Cert
+
+
+@pytest.fixture
+def remote(tmp_path, fake_backend):
+    socket_path = tmp_path / 'certmaestro.sock'
+    backend_daemon = BackendDaemon(socket_path, lambda: fake_backend)
+    thread = threading.Thread(target=backend_daemon.serve_forever)
+    thread.start()
+    remote_backend = connect(socket_path)
+    yield remote_backend
+    remote_backend.close()
+    backend_daemon.shutdown()
+    thread.join()
+    backend_daemon.close()
+
+
+def test_info(remote):
+    assert (remote.name, remote.version) == ('Fake', 'Fake 1.0')
+    assert remote.get_ca_cert().subject.common_name == 'Certmaestro Test CA'
+
+
+def test_issue_and_list(remote):
+    csr = CsrBuilder(remote.get_csr_policy(), {'country': 'HU'})
+    assert csr.policy['common_name'] == CsrPolicy.REQUIRED
+    for name in ('a.example.com', 'b.example.com'):
+        csr['common_name'] = name
+        key, cert = remote.issue_cert(csr)
+        assert str(key) == f'key of {name}'
+    assert [c.subject.common_name for c in remote.list_certs()] == ['a.example.com',
+                                                                     'b.example.com']
+
+
+def test_list_query(remote, fake_backend, cert_maker):
+    for name, days in (('a.example.com', 30), ('b.example.com', 10), ('c.test', 20)):
+        cert = Cert(cert_maker.pem(cert_maker.make(name, days=(-1, days))))
+        fake_backend.certs[cert.serial_number] = cert
+    query = CertQuery(common_name='*.EXAMPLE.com', sort='expiry', limit=1,
+                      expires_after=cert_maker.now)
+    first, = remote.list_certs(query)
+    assert first.subject.common_name == 'b.example.com'
+    second, = remote.list_certs(query.next_page(first))
+    assert second.subject.common_name == 'a.example.com'
+    assert not list(remote.list_certs(CertQuery(
+        expires_before=cert_maker.now + datetime.timedelta(days=5))))
+
+
+def test_errors_are_forwarded(remote):
+    with pytest.raises(BackendError, match='No such certificate: 01'):
+        remote.get_cert('01')
+    with pytest.raises(BackendError, match='ValueError: no CRL'):
+        remote.get_crl()
+    # the connection is still usable
+    assert remote.name == 'Fake'
+
+
+def test_no_crl(remote, fake_backend):
+    fake_backend.get_crl = lambda: None
+    assert remote.get_crl() is None
+
+
+def test_socket_is_private(remote, tmp_path):
+    mode = (tmp_path / 'certmaestro.sock').stat().st_mode
+    assert stat.S_IMODE(mode) == 0o600
+
+
+def test_only_one_daemon(remote, tmp_path):
+    with pytest.raises(BackendError, match='already running'):
+        BackendDaemon(tmp_path / 'certmaestro.sock', lambda: None)
+
+
+def test_no_daemon(tmp_path):
+    assert connect(tmp_path / 'certmaestro.sock') is None
+    # left behind by a killed daemon
+    (tmp_path / 'certmaestro.sock').touch()
+    assert connect(tmp_path / 'certmaestro.sock') is None
+
+
+def test_removed_options_are_forgotten(tmp_path):
+    config_path = tmp_path / 'certmaestro.ini'
+    config_path.write_text(f'[certmaestro]\nbackend = SQLite\n\n'
+                           f'[SQLite]\npath = {tmp_path}/ca.sqlite3\ncolour = red\n')
+    load_backend = ConfigBackendLoader(Config(config_path))
+    with pytest.raises(BackendError, match='Invalid parameters in certmaestro config: colour'):
+        load_backend()
+    config_path.write_text(f'[certmaestro]\nbackend = SQLite\n\n'
+                           f'[SQLite]\npath = {tmp_path}/ca.sqlite3\n')
+    backend = load_backend()
+    assert backend.name == 'SQLite'
+    backend.close()
@@ -0,0 +1,123 @@
+import threading
+import pytest
+from click.testing import CliRunner
+from certmaestro.backends.sqlite import Backend
+from certmaestro.cli.groups import main
+from certmaestro.csr import CsrBuilder
+from certmaestro.federation import Federation
+
+
+def test_unordered_doesnt_wait_for_slow_sources():
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        yield 'slow'
+
+    federation = Federation({'fast': lambda: ['a', 'b'], 'slow': slow})
+    items = federation.unordered()
+    assert [next(items), next(items)] == [('fast', 'a'), ('fast', 'b')]
+    release.set()
+    assert list(items) == [('slow', 'slow')]
+    assert federation.errors == {}
+
+
+def test_merged_in_key_order():
+    federation = Federation({'odd': lambda: [1, 3, 5, 7], 'even': lambda: [2, 4],
+                             'empty': lambda: []}, queue_size=1)
+    assert list(federation.merged(key=lambda n: n)) == \
+        [('odd', 1), ('even', 2), ('odd', 3), ('even', 4), ('odd', 5), ('odd', 7)]
+
+
+def test_failing_and_hanging_sources_are_left_out():
+    hang = threading.Event()
+
+    def failing():
+        yield 1
+        raise ValueError('broken')
+
+    federation = Federation({'ok': lambda: [1, 2], 'failing': failing,
+                             'hanging': lambda: [hang.wait()]}, timeout=0.2)
+    assert sorted(federation.unordered()) == [('failing', 1), ('ok', 1), ('ok', 2)]
+    assert str(federation.errors['failing']) == 'broken'
+    assert isinstance(federation.errors['hanging'], TimeoutError)
+
+    federation = Federation({'ok': lambda: [1, 2], 'hanging': lambda: [hang.wait()]},
+                            timeout=0.2)
+    assert list(federation.merged(key=lambda n: n)) == [('ok', 1), ('ok', 2)]
+    assert list(federation.errors) == ['hanging']
+    hang.set()
+
+
+def _issue(backend, *names):
+    for name in names:
+        csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+        csr['common_name'] = name
+        backend.issue_cert(csr)
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    """Configuration with two SQLite backends, east is the current one."""
+    sections = ['[certmaestro]\nbackend = east\n']
+    for name, hosts in (('east', ['e1.example.com', 'e2.example.com']),
+                        ('west', ['w1.example.com'])):
+        backend = Backend(tmp_path / f'{name}.sqlite3', busy_timeout=5, pool_size=2)
+        backend.setup(common_name=f'{name} CA', ca_days=365, cert_days=30, key_type='ec',
+                      crl_days=7)
+        _issue(backend, *hosts)
+        backend.close()
+        sections.append(f'[{name}]\ntype = SQLite\npath = {tmp_path / name}.sqlite3\n')
+    config_path = tmp_path / 'certmaestro.ini'
+    config_path.write_text('\n'.join(sections))
+    return config_path
+
+
+def _run(config_path, *args):
+    return CliRunner().invoke(main, ['-c', str(config_path), *args])
+
+
+def test_list_all_backends(config_path):
+    result = _run(config_path, 'cert', 'list')
+    assert result.exit_code == 0, result.output
+    assert 'e1.example.com' in result.output and 'w1.example.com' not in result.output
+    assert 'Backend' not in result.output
+
+    result = _run(config_path, 'cert', 'list', '--all-backends', '--sort', 'serial')
+    assert result.exit_code == 0, result.output
+    rows = result.stdout.splitlines()[2:]
+    assert sorted(row.split()[0] for row in rows) == ['east', 'east', 'west']
+    serials = [int(row.split()[-1].replace(':', ''), 16) for row in rows]
+    assert serials == sorted(serials)
+
+    # the limit is for all the backends together
+    result = _run(config_path, 'cert', 'list', '-A', '--sort', 'serial', '--limit', '2')
+    assert result.exit_code == 0, result.output
+    assert [int(row.split()[-1].replace(':', ''), 16) for row in
+            result.stdout.splitlines()[2:]] == serials[:2]
+
+    result = _run(config_path, 'cert', 'expiring', '-b', 'west', '-b', 'east', '--days', '31')
+    assert result.exit_code == 0, result.output
+    assert len(result.stdout.splitlines()) == 5
+
+
+def test_failing_backend_is_reported(config_path, tmp_path):
+    config_path.write_text(config_path.read_text() +
+                           f'\n[broken]\ntype = SQLite\npath = {tmp_path}/missing/x.sqlite3\n')
+    result = _run(config_path, 'cert', 'list', '-A')
+    assert result.exit_code == 1
+    assert 'w1.example.com' in result.output
+    assert "The broken backend failed: The directory of the database doesn't exist" in \
+        result.stderr
+
+
+def test_switch(config_path):
+    result = _run(config_path, 'config', 'switch')
+    assert result.stdout == '* east (SQLite)\n  west (SQLite)\n'
+    assert _run(config_path, 'config', 'switch', 'west').exit_code == 0
+    assert 'backend = west' in config_path.read_text()
+    result = _run(config_path, 'cert', 'list')
+    assert 'w1.example.com' in result.output and 'e1.example.com' not in result.output
+    result = _run(config_path, 'config', 'switch', 'north')
+    assert result.exit_code == 2
+    assert 'No backend named "north"' in result.stderr
@@ -0,0 +1,122 @@
+import base64
+import pytest
+from certmaestro.config import Config
+from certmaestro.csr import CsrBuilder
+from certmaestro.index import CertIndex, IndexEntry, IndexingBackend, guess_fields
+from certmaestro.wrapper import Cert
+
+
+@pytest.fixture(scope='module')
+def certs(cert_maker):
+    made = [
+        cert_maker.make('api.example.com', sans=['api.example.com', '10.0.0.1']),
+        cert_maker.make('wildcard.example.com', sans=['*.example.com', 'example.com']),
+        cert_maker.make('api-v2.example.org'),
+        cert_maker.make('mail.other.net'),
+    ]
+    return [Cert(cert_maker.pem(c)) for c in made]
+
+
+@pytest.fixture
+def index(tmp_path, certs):
+    with CertIndex(tmp_path / 'index.sqlite3') as index:
+        index.rebuild(IndexEntry.from_cert(c) for c in certs)
+        yield index
+
+
+def common_names(results):
+    return sorted(r.common_name for r in results)
+
+
+def test_guess_fields():
+    assert guess_fields('example.com') == ('cn', 'san')
+    assert guess_fields('::1') == ('ip',)
+    assert guess_fields('ab' * 20) == ('sha1',)
+    assert guess_fields(':'.join(['AB'] * 32)) == ('sha256', 'spki')
+
+
+def test_exact_name_matches_wildcard_certs(index):
+    assert common_names(index.search('API.example.com')) == ['api.example.com',
+                                                             'wildcard.example.com']
+
+
+def test_suffix(index):
+    assert common_names(index.search('.example.org')) == ['api-v2.example.org']
+    assert len(common_names(index.search('.example.com'))) == 2
+
+
+def test_glob(index):
+    assert common_names(index.search('api*')) == ['api-v2.example.org', 'api.example.com']
+    assert common_names(index.search('*.net')) == ['mail.other.net']
+    assert common_names(index.search('ma?l.*')) == ['mail.other.net']
+
+
+def test_ip(index):
+    assert common_names(index.search('10.0.0.1')) == ['api.example.com']
+
+
+def test_fingerprints(index, certs):
+    cert = certs[2]
+    assert common_names(index.search(cert.sha1_fingerprint.upper())) == ['api-v2.example.org']
+    assert common_names(index.search(cert.sha256_fingerprint)) == ['api-v2.example.org']
+    # all test certificates have the same key
+    pin = base64.b64encode(bytes.fromhex(cert.spki_sha256.replace(':', ''))).decode()
+    assert len(list(index.search(pin, ['spki']))) == 4
+
+
+def test_issuer(index):
+    assert len(list(index.search('certmaestro test ca', ['issuer']))) == 4
+
+
+def test_incremental_update(index, cert_maker):
+    cert = Cert(cert_maker.pem(cert_maker.make('new.example.org')))
+    index.add(IndexEntry.from_cert(cert))
+    [result] = index.search('new.example.org')
+    assert not result.revoked
+
+    index.mark_revoked(str(cert.serial_number))
+    [result] = index.search('new.example.org')
+    assert result.revoked and result.serial_number == cert.serial_number
+
+    index.remove(str(cert.serial_number))
+    assert list(index.search('new.example.org')) == []
+    assert len(index) == 4
+
+
+def test_writes_through_the_backend_update_the_index(index, fake_backend):
+    backend = IndexingBackend(fake_backend, index.path)
+    csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+    csr['common_name'] = 'issued.example.net'
+    _, cert = backend.issue_cert(csr)
+    [result] = index.search('issued.example.net')
+    assert not result.revoked
+
+    backend.revoke_cert(str(cert.serial_number))
+    [result] = index.search('issued.example.net')
+    assert result.revoked
+
+
+def test_bulk_writes_invalidate_the_index(index, fake_backend):
+    backend = IndexingBackend(fake_backend, index.path)
+    # only the methods of the backend are there
+    assert not hasattr(backend, 'import_certs')
+    fake_backend.import_certs = lambda certs: len(list(certs))
+    assert backend.import_certs([]) == 0
+    assert index.built_at is None
+
+
+def test_nothing_is_done_before_the_first_search(tmp_path, fake_backend):
+    backend = IndexingBackend(fake_backend, tmp_path / 'index.sqlite3')
+    csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+    csr['common_name'] = 'issued.example.net'
+    backend.issue_cert(csr)
+    assert not (tmp_path / 'index.sqlite3').exists()
+
+
+def test_every_backend_has_its_own_index(tmp_path):
+    config = Config.make_new(tmp_path / 'certmaestro.ini')
+    names = ['Prod CA', 'prod-ca', 'PROD CA', 'Ügyfél CA']
+    for name in names:
+        config.add_backend(name, 'SQLite', {'path': str(tmp_path / 'ca.sqlite3')})
+    paths = {config.select(name).index_path for name in names}
+    assert len(paths) == len(names)
@@ -0,0 +1,32 @@
+import threading
+import pytest
+from certmaestro.exceptions import BackendError
+from certmaestro.lock import FileLock
+
+
+def test_timeout(tmp_path):
+    lock = FileLock(tmp_path / 'db.lock', timeout=0.05)
+    with lock:
+        # a separate open file, as if it was another process
+        with pytest.raises(BackendError, match='Timed out waiting for the lock'):
+            lock.acquire()
+    lock.acquire().close()
+
+
+def test_threads_are_excluded(tmp_path):
+    lock = FileLock(tmp_path / 'db.lock')
+    inside = []
+
+    def work():
+        for _ in range(50):
+            with lock:
+                inside.append(1)
+                assert len(inside) == 1
+                inside.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert inside == []
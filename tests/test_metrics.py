@@ -0,0 +1,66 @@
+import datetime
+import urllib.request
+import pytest
+from certmaestro.check import CheckedSite, CheckResult
+from certmaestro.resolver import Timings
+from certmaestro.metrics import SiteCheckMetrics, Histogram
+
+
+NOW = 1_500_000_000.0
+
+
+class FakeCert:
+    not_valid_after = datetime.datetime.fromtimestamp(NOW + 10 * 86400, datetime.timezone.utc)
+
+
+@pytest.fixture
+def metrics():
+    metrics = SiteCheckMetrics(clock=lambda: NOW)
+    metrics.observe(CheckedSite('a.com', CheckResult.SUCCEEDED, None,
+                                Timings(0.002, 0.02, 0.2), FakeCert()))
+    metrics.observe(CheckedSite('b.com:8443', CheckResult.FAILED, 'Timed out', Timings(dns=0.002)))
+    metrics.observe(CheckedSite('http://c.com', CheckResult.SKIPPED, 'not https://'))
+    return metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('h', 'help', buckets=(1, 2))
+    for value in (0.5, 1.5, 1.7, 3):
+        histogram.observe(value)
+    assert list(histogram.samples()) == [
+        ('h_bucket', (('le', '1.0'),), 1),
+        ('h_bucket', (('le', '2.0'),), 3),
+        ('h_bucket', (('le', '+Inf'),), 4),
+        ('h_sum', (), 6.7),
+        ('h_count', (), 4),
+    ]
+
+
+def test_render(metrics):
+    lines = metrics.render().splitlines()
+    assert 'certmaestro_site_checks_total{verdict="succeeded"} 1.0' in lines
+    assert 'certmaestro_site_checks_total{verdict="skipped"} 1.0' in lines
+    assert 'certmaestro_site_dns_duration_seconds_count 2.0' in lines
+    assert 'certmaestro_site_tls_duration_seconds_count 1.0' in lines
+    assert 'certmaestro_site_cert_expiry_days_bucket{le="7.0"} 0.0' in lines
+    assert 'certmaestro_site_cert_expiry_days_bucket{le="14.0"} 1.0' in lines
+    assert 'certmaestro_site_check_success{site="b.com:8443"} 0.0' in lines
+    assert '# TYPE certmaestro_site_tls_duration_seconds histogram' in lines
+
+
+def test_write_textfile(metrics, tmp_path):
+    path = tmp_path / 'certmaestro.prom'
+    metrics.write_textfile(path)
+    assert path.read_text() == metrics.render()
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_serve(metrics):
+    server = metrics.serve(0, '127.0.0.1')
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode() == metrics.render()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,102 @@
+import pytest
+from click.testing import CliRunner
+from certmaestro.backends.sqlite import Backend
+from certmaestro.cli.groups import main
+from certmaestro.csr import CsrBuilder
+from certmaestro.exceptions import MigrationError
+from certmaestro.migrate import Migration, Summary
+
+
+def _sqlite_backend(path):
+    return Backend(path, busy_timeout=5, pool_size=2)
+
+
+def _issue(backend, count):
+    csrs = []
+    for i in range(count):
+        csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+        csr['common_name'] = f'host{i}.example.com'
+        csrs.append(csr)
+    return backend.issue_certs(csrs)
+
+
+@pytest.fixture
+def source(tmp_path):
+    backend = _sqlite_backend(tmp_path / 'source.sqlite3')
+    backend.setup(common_name='Migrated CA', ca_days=365, cert_days=30, key_type='ec',
+                  crl_days=7)
+    issued = _issue(backend, 7)
+    backend.revoke_certs([str(cert.serial_number) for _, cert in issued[:2]], 'superseded')
+    return backend
+
+
+def test_migrate(source, tmp_path):
+    destination = _sqlite_backend(tmp_path / 'destination.sqlite3')
+    migration = Migration(source, destination, tmp_path / 'checkpoint.json', batch_size=3)
+    assert migration.migrate_ca()
+    summary = migration.verify(migration.run())
+    assert (summary.count, summary.revoked, summary.keys) == (7, 2, 7)
+    assert not (tmp_path / 'checkpoint.json').exists()
+    assert destination.get_ca_cert().der == source.get_ca_cert().der
+    assert sorted(rc.serial_number for rc in destination.get_crl()) == \
+        sorted(rc.serial_number for rc in source.get_crl())
+    # the destination can issue with the migrated CA
+    _, cert = _issue(destination, 1)[0]
+    assert cert.issuer == source.get_ca_cert().subject
+    # running again doesn't replace the CA
+    assert not migration.migrate_ca()
+
+
+def test_resume(source, tmp_path):
+    destination = _sqlite_backend(tmp_path / 'destination.sqlite3')
+    migration = Migration(source, destination, tmp_path / 'checkpoint.json', batch_size=3)
+    migration.migrate_ca()
+
+    def interrupt(done):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        migration.run(interrupt)
+    assert len(list(destination.list_certs())) == 3
+    # interrupted after storing a batch, before saving the checkpoint
+    migration.checkpoint_path.write_text(
+        migration.checkpoint_path.read_text().replace('"done": 3', '"done": 0'))
+    done = []
+    summary = migration.verify(migration.run(done.append))
+    assert done == [3, 6, 7]
+    assert summary == Summary.of(source.export_certs())
+
+
+def test_replaces_unused_ca_only(source, tmp_path):
+    destination = _sqlite_backend(tmp_path / 'destination.sqlite3')
+    destination.setup(common_name='Other CA', ca_days=365, cert_days=10, key_type='rsa',
+                      crl_days=1)
+    migration = Migration(source, destination, tmp_path / 'checkpoint.json')
+    assert migration.migrate_ca()
+    assert destination.settings == {'cert_days': 10, 'key_type': 'rsa', 'crl_days': 1}
+
+    other = _sqlite_backend(tmp_path / 'other.sqlite3')
+    other.setup(common_name='Other CA', ca_days=365, cert_days=10, key_type='ec', crl_days=1)
+    _issue(other, 1)
+    with pytest.raises(MigrationError, match='issued by another CA'):
+        Migration(source, other, tmp_path / 'checkpoint.json').migrate_ca()
+
+
+def test_cli(source, tmp_path):
+    config_paths = []
+    for name in ('source', 'destination'):
+        config_path = tmp_path / f'{name}.ini'
+        config_path.write_text(f'[certmaestro]\nbackend = SQLite\n\n'
+                               f'[SQLite]\npath = {tmp_path / name}.sqlite3\n')
+        config_paths.append(str(config_path))
+
+    result = CliRunner().invoke(main, ['migrate', '--from', config_paths[0],
+                                       '--to', config_paths[1], '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'Imported the CA' in result.output
+    assert 'Migrated from SQLite to SQLite: 7 certificates, 2 revoked' in result.output
+
+    result = CliRunner().invoke(main, ['migrate', '--from', config_paths[1],
+                                       '--to', config_paths[1]])
+    assert result.exit_code == 0, result.output
+    assert 'Imported the CA' not in result.output
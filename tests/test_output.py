@@ -0,0 +1,125 @@
+import io
+import csv
+import json
+import contextlib
+import pytest
+from click.testing import CliRunner
+from certmaestro.backends.sqlite import Backend
+from certmaestro.cli.groups import main
+from certmaestro.cli.output import Field, write_rows
+from certmaestro.csr import CsrBuilder
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    backend = Backend(tmp_path / 'ca.sqlite3', busy_timeout=5, pool_size=2)
+    backend.setup(common_name='Output CA', ca_days=365, cert_days=30, key_type='ec',
+                  crl_days=7)
+    csrs = []
+    for host in ('a.example.com', 'b.example.com', 'c.example.com'):
+        csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+        csr['common_name'] = host
+        csrs.append(csr)
+    issued = backend.issue_certs(csrs)
+    backend.revoke_certs([str(issued[0][1].serial_number)], 'superseded')
+    backend.close()
+    config_path = tmp_path / 'certmaestro.ini'
+    config_path.write_text(f'[certmaestro]\nbackend = SQLite\n\n'
+                           f'[SQLite]\npath = {tmp_path}/ca.sqlite3\n')
+    return config_path
+
+
+def _run(config_path, *args):
+    result = CliRunner().invoke(main, ['-c', str(config_path), *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_list_json(config_path):
+    certs = json.loads(_run(config_path, 'cert', 'list', '--format', 'json', '--sort', 'serial'))
+    serials = [int(c['serial_number'].replace(':', ''), 16) for c in certs]
+    assert serials == sorted(serials) and len(serials) == 3
+    assert set(certs[0]) == {'common_name', 'not_valid_before', 'not_valid_after',
+                             'serial_number'}
+    assert certs[0]['not_valid_after'].endswith('+00:00')
+
+
+def test_list_jsonl_and_csv_fields(config_path):
+    lines = _run(config_path, 'cert', 'list', '-o', 'jsonl', '--fields', 'common_name,ca,issuer')
+    certs = [json.loads(line) for line in lines.splitlines()]
+    assert len(certs) == 3
+    assert certs[0]['ca'] is False
+    assert certs[0]['issuer'] == {'common_name': 'Output CA'}
+
+    rows = list(csv.DictReader(_run(config_path, 'cert', 'list', '-o', 'csv',
+                                    '--fields', 'serial_number,dns_names').splitlines()))
+    assert len(rows) == 3
+    assert list(rows[0]) == ['serial_number', 'dns_names']
+
+
+def test_unknown_field(config_path):
+    result = CliRunner().invoke(main, ['-c', str(config_path), 'cert', 'list',
+                                       '--fields', 'common_name,colour'])
+    assert result.exit_code == 2
+    assert 'unknown fields: colour' in result.output
+
+
+def test_show(config_path):
+    serial = json.loads(_run(config_path, 'cert', 'list', '-o', 'json'))[0]['serial_number']
+    cert, = json.loads(_run(config_path, 'cert', 'show', serial, '-o', 'json'))
+    assert cert['serial_number'] == serial
+    assert cert['key_algorithm'] == 'ec'
+    output = _run(config_path, 'cert', 'show', serial, '--fields', 'common_name,version')
+    assert 'Version' in output and 'v3' in output
+
+
+def test_crl_show(config_path):
+    crl = json.loads(_run(config_path, 'crl', 'show', '-o', 'json'))
+    assert crl['issuer_common_name'] == 'Output CA'
+    revoked, = crl['revoked_certs']
+    assert revoked['reason'] == 'superseded'
+    assert revoked['invalidity_date'] is None
+    rows = _run(config_path, 'crl', 'show', '-o', 'csv', '--fields', 'reason').splitlines()
+    assert rows == ['reason', 'superseded']
+
+
+def test_list_query(config_path):
+    def names(*args):
+        lines = _run(config_path, 'cert', 'list', '-o', 'jsonl', '--fields', 'common_name',
+                     *args).splitlines()
+        return [json.loads(line)['common_name'] for line in lines]
+
+    assert names('--status', 'revoked') == ['a.example.com']
+    assert sorted(names('--status', 'valid')) == ['b.example.com', 'c.example.com']
+    assert names('--cn', 'C*') == ['c.example.com']
+    assert len(names('--limit', '2', '--sort', 'expiry')) == 2
+
+
+def test_search(config_path):
+    output = _run(config_path, 'cert', 'search', 'b.example.com')
+    assert 'b.example.com' in output and 'a.example.com' not in output
+    assert 'revoked' in _run(config_path, 'cert', 'search', '--field', 'cn', 'a.example.com')
+
+
+class FlushedLines(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.flushed = ''
+
+    def flush(self):
+        self.flushed = self.getvalue()
+
+
+@pytest.mark.parametrize('output_format', ['jsonl', 'csv'])
+def test_rows_are_flushed(output_format):
+    stream = FlushedLines()
+
+    def items():
+        for number in range(3):
+            # the previous rows are out before the next one is read
+            assert stream.flushed.count('\n') == number + (output_format == 'csv')
+            yield number
+
+    with contextlib.redirect_stdout(stream):
+        write_rows(items(), [Field('number', 'Number', lambda n: n)], output_format)
+    assert stream.flushed == stream.getvalue()
@@ -0,0 +1,103 @@
+import socket
+import threading
+import pytest
+from certmaestro.resolver import Resolver, interleave_families, happy_eyeballs_connect
+
+
+class StubGetaddrinfo:
+    def __init__(self, records):
+        self.records = records
+        self.calls = []
+
+    def __call__(self, hostname, port, family, type):
+        self.calls.append(hostname)
+        if hostname not in self.records:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(family, socket.SOCK_STREAM, 6, '', (ip, 0)) for family, ip in
+                self.records[hostname]]
+
+
+@pytest.fixture
+def listening_port():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    yield server.getsockname()[1]
+    server.close()
+
+
+class TestResolver:
+    def test_results_are_cached(self):
+        stub = StubGetaddrinfo({'lb.example.com': [(socket.AF_INET, '10.0.0.1')]})
+        resolver = Resolver(getaddrinfo=stub)
+        assert resolver.resolve('lb.example.com') == [(socket.AF_INET, '10.0.0.1')]
+        assert resolver.resolve('LB.example.com') == [(socket.AF_INET, '10.0.0.1')]
+        assert stub.calls == ['lb.example.com']
+
+    def test_expired_entries_are_resolved_again(self):
+        stub = StubGetaddrinfo({'lb.example.com': [(socket.AF_INET, '10.0.0.1')]})
+        resolver = Resolver(ttl=0, getaddrinfo=stub)
+        resolver.resolve('lb.example.com')
+        resolver.resolve('lb.example.com')
+        assert len(stub.calls) == 2
+
+    def test_failures_are_cached(self):
+        stub = StubGetaddrinfo({})
+        resolver = Resolver(getaddrinfo=stub)
+        for _ in range(2):
+            with pytest.raises(socket.gaierror):
+                resolver.resolve('missing.example.com')
+        assert len(stub.calls) == 1
+
+    def test_concurrent_lookups_are_made_once(self):
+        started = threading.Event()
+
+        def slow_getaddrinfo(hostname, port, family, type):
+            started.wait(1)
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 0))]
+
+        calls = []
+        resolver = Resolver(getaddrinfo=lambda *args: calls.append(1) or slow_getaddrinfo(*args))
+        threads = [threading.Thread(target=resolver.resolve, args=('a.com',)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        started.set()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+
+    def test_unexpected_errors_are_raised_to_waiting_threads(self):
+        # the real getaddrinfo raises UnicodeError for names which can't be IDNA encoded
+        resolver = Resolver(getaddrinfo=socket.getaddrinfo)
+        resolver.prefetch(['a..example.com'])
+        for _ in range(2):
+            with pytest.raises(UnicodeError):
+                resolver.resolve('a..example.com')
+        assert not resolver._in_flight
+        resolver.close()
+
+    def test_hosts_file(self, tmp_path):
+        hosts_file = tmp_path / 'hosts'
+        hosts_file.write_text('# comment\n127.0.0.1 localhost site.test\n::1 site.test\n')
+        resolver = Resolver(hosts_file=hosts_file, getaddrinfo=StubGetaddrinfo({}))
+        assert resolver.resolve('site.test') == [(socket.AF_INET, '127.0.0.1'),
+                                                 (socket.AF_INET6, '::1')]
+
+
+class TestHappyEyeballs:
+    def test_families_are_interleaved(self):
+        v6, v4 = socket.AF_INET6, socket.AF_INET
+        addresses = [(v6, '::1'), (v6, '::2'), (v4, '1.1.1.1'), (v4, '1.1.1.2'), (v4, '1.1.1.3')]
+        assert interleave_families(addresses) == [
+            (v6, '::1'), (v4, '1.1.1.1'), (v6, '::2'), (v4, '1.1.1.2'), (v4, '1.1.1.3')
+        ]
+
+    def test_falls_back_to_next_address(self, listening_port):
+        # 127.0.0.2 is not listening on the port, so that connection will be refused
+        addresses = [(socket.AF_INET, '127.0.0.2'), (socket.AF_INET, '127.0.0.1')]
+        with happy_eyeballs_connect(addresses, listening_port, timeout=2) as sock:
+            assert sock.getpeername() == ('127.0.0.1', listening_port)
+
+    def test_all_refused(self, listening_port):
+        with pytest.raises(ConnectionRefusedError):
+            happy_eyeballs_connect([(socket.AF_INET, '127.0.0.2')], listening_port, timeout=2)
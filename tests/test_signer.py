@@ -0,0 +1,49 @@
+import datetime
+import pytest
+from certmaestro.chain import ChainValidator, TrustStore
+from certmaestro.csr import CsrBuilder, CsrPolicy
+from certmaestro.signer import Signer, generate_key
+
+
+@pytest.fixture(scope='module', params=['rsa', 'ec'])
+def signer(request):
+    return Signer.create_ca({'common_name': 'Signer CA', 'org_name': 'Certmaestro'},
+                            key_type=request.param)[0]
+
+
+def _csr(common_name, **values):
+    csr = CsrBuilder({'common_name': CsrPolicy.REQUIRED}, values)
+    csr['common_name'] = common_name
+    return csr
+
+
+def test_ca(signer):
+    assert signer.ca_cert.ca
+    assert signer.ca_cert.subject.common_name == 'Signer CA'
+    assert ChainValidator(TrustStore([signer.ca_cert])).validate(signer.ca_cert).valid
+
+
+@pytest.mark.parametrize('key_type', ['rsa', 'ec'])
+def test_issue(signer, key_type):
+    key, cert = signer.issue(_csr('10.0.0.1', country='HU'), days=10, key_type=key_type)
+    assert str(key).startswith('-----BEGIN')
+    assert cert.subject.common_name == '10.0.0.1'
+    assert list(cert.ip_addresses) == ['10.0.0.1']
+    assert cert.authority_key_identifier == signer.ca_cert.key_identifier
+    assert (cert.not_valid_after - cert.not_valid_before).days == 10
+    assert ChainValidator(TrustStore([signer.ca_cert])).validate(cert).valid
+
+
+def test_crl(signer):
+    _, cert = signer.issue(_csr('revoked.example.com'), key_type='ec')
+    revoked_at = datetime.datetime(2030, 1, 2, tzinfo=datetime.timezone.utc)
+    crl = signer.make_crl([(cert.serial_number, revoked_at, 'superseded')], days=3, number=7)
+    assert [(rc.serial_number, rc.revocation_date, rc.reason.native) for rc in crl] == \
+        [(cert.serial_number, revoked_at, 'superseded')]
+    assert (crl.next_update - crl.this_update).days == 3
+    assert list(signer.make_crl([])) == []
+
+
+def test_unknown_key_type():
+    with pytest.raises(ValueError, match='Unknown key type: dsa'):
+        generate_key('dsa')
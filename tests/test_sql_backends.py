@@ -0,0 +1,404 @@
+"""
+    The SQL backends against real databases. SQLite always runs, the servers are only
+    available if their connection strings are given,
+    e.g. CERTMAESTRO_TEST_POSTGRES_DSN=postgresql://localhost/certmaestro_test
+    or CERTMAESTRO_TEST_MYSQL_URL=mysql://root@localhost/certmaestro_test (MySQL or MariaDB).
+    The tables of the backend are dropped before and after the tests.
+"""
+import io
+import os
+import csv
+import sqlite3
+import datetime
+import contextlib
+import threading
+import types
+import pytest
+from certmaestro.backends.interfaces import CertQuery
+from certmaestro.backends.sql import CA_TABLE, CERT_COLUMNS, CERTS_TABLE, ConnectionPool, serial_hex
+from certmaestro.chain import ChainValidator, TrustStore
+from certmaestro.csr import CsrBuilder
+from certmaestro.exceptions import BackendError
+from certmaestro.wrapper import SerialNumber
+
+
+def _sqlite_backend(tmp_path):
+    from certmaestro.backends.sqlite import Backend
+    return Backend(tmp_path / 'certmaestro.sqlite3', busy_timeout=5, pool_size=4)
+
+
+def _postgres_backend(tmp_path):
+    pytest.importorskip('psycopg2')
+    dsn = os.environ.get('CERTMAESTRO_TEST_POSTGRES_DSN')
+    if not dsn:
+        pytest.skip('CERTMAESTRO_TEST_POSTGRES_DSN is not set')
+    from certmaestro.backends.postgres import Backend
+    return Backend(dsn, pool_size=4)
+
+
+def _mysql_backend(tmp_path):
+    pytest.importorskip('pymysql')
+    url = os.environ.get('CERTMAESTRO_TEST_MYSQL_URL')
+    if not url:
+        pytest.skip('CERTMAESTRO_TEST_MYSQL_URL is not set')
+    from certmaestro.backends.mysql import Backend
+    return Backend(url, pool_size=4)
+
+
+BACKENDS = {
+    'sqlite': _sqlite_backend,
+    'postgres': _postgres_backend,
+    'mysql': _mysql_backend,
+}
+
+
+def _drop_tables(backend):
+    with backend._connection() as connection:
+        for table in (CERTS_TABLE, CA_TABLE):
+            backend._execute(connection, f'DROP TABLE IF EXISTS {table}')
+
+
+@pytest.fixture(params=list(BACKENDS))
+def sql_backend(request, tmp_path):
+    backend = BACKENDS[request.param](tmp_path)
+    _drop_tables(backend)
+    backend.setup(common_name='SQL Test CA', ca_days=365, cert_days=30, key_type='ec',
+                  crl_days=7)
+    yield backend
+    _drop_tables(backend)
+    backend.close()
+
+
+def _csr(backend, common_name):
+    csr = CsrBuilder(backend.get_csr_policy(), backend.get_csr_defaults())
+    csr['common_name'] = common_name
+    return csr
+
+
+def test_setup_only_once(sql_backend):
+    with pytest.raises(ValueError, match='already has a CA'):
+        sql_backend.validate_setup(key_type='ec')
+
+
+def test_issue_and_get(sql_backend):
+    key, cert = sql_backend.issue_cert(_csr(sql_backend, 'sql.example.com'))
+    assert str(key).startswith('-----BEGIN')
+    stored = sql_backend.get_cert(str(cert.serial_number))
+    assert stored.der == cert.der
+    trust_store = TrustStore([sql_backend.get_ca_cert()])
+    assert ChainValidator(trust_store).validate(stored).valid
+    with pytest.raises(BackendError, match='No such certificate'):
+        sql_backend.get_cert('01')
+
+
+def test_list_is_ordered_by_serial(sql_backend):
+    issued = sql_backend.issue_certs([_csr(sql_backend, f'host{i}.example.com')
+                                      for i in range(5)])
+    # more than one page for the paginating backends
+    sql_backend.page_size = 2
+    listed = list(sql_backend.list_certs())
+    assert [c.serial_number for c in listed] == sorted(cert.serial_number for _, cert in issued)
+
+
+def test_import(sql_backend, cert_maker):
+    from certmaestro.wrapper import Cert
+
+    certs = [Cert(cert_maker.pem(cert_maker.make(f'imported{i}.example.com')))
+             for i in range(7)]
+    assert sql_backend.import_certs(certs, batch_size=3) == 7
+    assert {c.subject.common_name for c in sql_backend.list_certs()} == \
+        {f'imported{i}.example.com' for i in range(7)}
+
+
+def test_revoke_and_crl(sql_backend):
+    _, cert = sql_backend.issue_cert(_csr(sql_backend, 'revoked.example.com'))
+    sql_backend.issue_cert(_csr(sql_backend, 'valid.example.com'))
+    assert list(sql_backend.get_crl()) == []
+    revoked = sql_backend.revoke_cert(str(cert.serial_number), reason='key_compromise')
+    assert revoked.serial_number == cert.serial_number
+    with pytest.raises(BackendError, match='No valid certificate'):
+        sql_backend.revoke_cert(str(cert.serial_number))
+    crl = sql_backend.get_crl()
+    assert [(rc.serial_number, rc.reason.native) for rc in crl] == \
+        [(cert.serial_number, 'key_compromise')]
+    assert crl.issuer == sql_backend.get_ca_cert().subject
+
+
+def test_revoke_many(sql_backend):
+    issued = sql_backend.issue_certs([_csr(sql_backend, f'bulk{i}.example.com')
+                                      for i in range(5)])
+    serials = [str(cert.serial_number) for _, cert in issued]
+    assert sql_backend.revoke_certs(serials[:3], batch_size=2) == 3
+    # already revoked ones are not counted again
+    assert sql_backend.revoke_certs(serials[2:4]) == 1
+    assert len(list(sql_backend.get_crl())) == 4
+
+
+def test_query(sql_backend, cert_maker):
+    import datetime
+    from certmaestro.backends.interfaces import CertQuery
+    from certmaestro.wrapper import Cert
+
+    # (common name, validity days relative to now)
+    specs = [('api.example.com', (-10, 5)), ('www.example.com', (-1, 30)),
+             ('old.example.org', (-40, -5)), ('API-2.example.com', (-1, 60)),
+             ('revoked.example.com', (-2, 20)), ('a%i.example.com', (-3, 10))]
+    certs = {cn: Cert(cert_maker.pem(cert_maker.make(cn, days=days))) for cn, days in specs}
+    sql_backend.import_certs(certs.values())
+    sql_backend.revoke_cert(str(certs['revoked.example.com'].serial_number))
+    sql_backend.page_size = 2
+
+    def names(**query):
+        query = CertQuery(**query)
+        listed = list(sql_backend.list_certs(query))
+        # the same as doing everything in Python
+        revoked = lambda: {c.serial_number for c in sql_backend.get_crl()}  # noqa: E731
+        assert [c.der for c in listed] == \
+            [c.der for c in query.apply(sql_backend.list_certs(), revoked)]
+        return [c.subject.common_name for c in listed]
+
+    assert len(names(status='valid')) == 4
+    assert names(status='revoked') == ['revoked.example.com']
+    assert names(status='expired') == ['old.example.org']
+    assert sorted(names(common_name='api*')) == ['API-2.example.com', 'api.example.com']
+    assert names(common_name='a%i.example.com') == ['a%i.example.com']
+    assert names(common_name='a_i.example.com') == []
+    assert len(names(common_name='*.example.co?')) == 5
+    now = cert_maker.now
+    assert names(expires_after=now, expires_before=now + datetime.timedelta(days=15),
+                 sort='expiry') == ['api.example.com', 'a%i.example.com']
+    assert names(issued_before=now - datetime.timedelta(days=5), sort='expiry') == [
+        'old.example.org', 'api.example.com']
+    by_expiry = [cn for cn, _ in sorted(specs, key=lambda spec: spec[1][1])]
+    assert names(sort='expiry') == by_expiry
+    assert names(sort='expiry', offset=1, limit=2) == by_expiry[1:3]
+    # paging with the cursor
+    query, paged = CertQuery(sort='expiry', limit=4), []
+    while True:
+        page = list(sql_backend.list_certs(query))
+        paged += [c.subject.common_name for c in page]
+        if len(page) < query.limit:
+            break
+        query = query.next_page(page[-1])
+    assert paged == by_expiry
+
+
+def test_sqlite_reads_while_writing(tmp_path):
+    from certmaestro.backends.sqlite import Backend
+
+    writer = _sqlite_backend(tmp_path)
+    writer.setup(common_name='SQLite CA', ca_days=365, cert_days=30, key_type='ec', crl_days=7)
+    _, first = writer.issue_cert(_csr(writer, 'first.example.com'))
+    # like another CLI or API process, with its own connections
+    reader = Backend(tmp_path / 'certmaestro.sqlite3', busy_timeout=0.1, pool_size=1)
+    assert reader.version.startswith('SQLite ')
+    _, second = writer.signer.issue(_csr(writer, 'second.example.com'), 30, 'ec')
+    with writer._connection() as connection:
+        writer._insert_rows(connection, [writer._cert_row(second)])
+        # the write transaction is open, the reader sees the last committed state
+        assert [c.subject.common_name for c in reader.list_certs()] == ['first.example.com']
+        assert reader.get_cert(str(first.serial_number)).der == first.der
+        # only one writer at a time, the other waits busy_timeout
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            reader.revoke_cert(str(first.serial_number))
+    assert reader.get_cert(str(second.serial_number)).der == second.der
+    reader.close()
+    writer.close()
+
+
+def test_connection_pool(tmp_path):
+    db_path = tmp_path / 'pool.sqlite3'
+    connections = []
+
+    def connect():
+        connections.append(sqlite3.connect(str(db_path), check_same_thread=False))
+        return connections[-1]
+
+    pool = ConnectionPool(connect, max_size=2)
+    with pool.connection() as connection:
+        connection.execute('CREATE TABLE t (x INTEGER)')
+    with pytest.raises(ZeroDivisionError):
+        with pool.connection() as connection:
+            connection.execute('INSERT INTO t VALUES (1)')
+            1 / 0
+    # rolled back and thrown away
+    with pool.connection() as connection:
+        assert connection.execute('SELECT COUNT(*) FROM t').fetchone() == (0,)
+    assert len(connections) == 2
+
+    # only max_size connections at once
+    release = threading.Event()
+    got_third = threading.Event()
+
+    def hold():
+        with pool.connection():
+            release.wait()
+
+    def third():
+        with pool.connection():
+            got_third.set()
+
+    threads = [threading.Thread(target=hold) for _ in range(2)] + [threading.Thread(target=third)]
+    for thread in threads:
+        thread.start()
+    assert not got_third.wait(0.1)
+    release.set()
+    assert got_third.wait(5)
+    for thread in threads:
+        thread.join()
+    assert len(connections) == 3
+    pool.close()
+
+
+class FakeConnection:
+    """Enough of a DB-API connection for the pool, the cursor is given by the tests."""
+    closed = 0
+
+    def __init__(self, cursor=None):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def test_postgres_waits_for_a_free_connection(monkeypatch):
+    from certmaestro.backends import postgres
+
+    lock = threading.Lock()
+    counter = {'made': 0, 'in_use': 0, 'max_in_use': 0}
+
+    def connect(dsn):
+        with lock:
+            counter['made'] += 1
+        return FakeConnection()
+
+    monkeypatch.setattr(postgres, 'psycopg2', types.SimpleNamespace(
+        connect=connect, Error=Exception, InterfaceError=Exception))
+    backend = postgres.Backend('postgresql://localhost/certmaestro', pool_size=2)
+    errors = []
+
+    def use():
+        try:
+            with backend._connection():
+                with lock:
+                    counter['in_use'] += 1
+                    counter['max_in_use'] = max(counter['max_in_use'], counter['in_use'])
+                threading.Event().wait(0.01)
+                with lock:
+                    counter['in_use'] -= 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert counter['max_in_use'] == 2 and counter['made'] == 2
+    backend.close()
+
+
+class CopyCursor:
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def copy_expert(self, sql, file):
+        self.statements.append((sql, file.read()))
+
+
+def test_postgres_copy_rows():
+    from certmaestro.backends import postgres
+
+    # without connecting, psycopg2 is not needed for encoding the rows
+    backend = postgres.Backend.__new__(postgres.Backend)
+    cursor = CopyCursor()
+    not_after = datetime.datetime(2030, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    backend._insert_rows(FakeConnection(cursor), [
+        ('0a', 'a, "quoted" name', not_after, not_after, 'V', None, None, b'\x00\xff', None),
+        ('0b', '', not_after, not_after, 'R', not_after, 'superseded', b'', 'KEY'),
+    ])
+    (sql, data), = cursor.statements
+    assert sql == (f'COPY {CERTS_TABLE} ({", ".join(CERT_COLUMNS)}) '
+                   f"FROM STDIN WITH (FORMAT csv, NULL '\\N')")
+    first, second = csv.reader(io.StringIO(data))
+    assert first == ['0a', 'a, "quoted" name', '2030-01-02T03:04:05+00:00',
+                     '2030-01-02T03:04:05+00:00', 'V', '\\N', '\\N', '\\x00ff', '\\N']
+    # an empty string stays an empty string, not NULL
+    assert second[1] == '' and second[5:] == ['2030-01-02T03:04:05+00:00', 'superseded',
+                                              '\\x', 'KEY']
+
+
+class PagingCursor:
+    """Runs the queries of the MySQL backend on a list of (serial, not after, name) rows,
+    with the CertQuery given to the patched _select_certs instead of the SQL parameters.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self._result = None
+
+    def execute(self, sql, query):
+        self.queries.append(query)
+        rows = sorted(self.rows, key=lambda row: query.key(*self._key_values(row)))
+        if query.after is not None:
+            rows = [row for row in rows if query.key(*self._key_values(row)) > query.after]
+        self._result = list(query.page(rows))
+
+    def fetchall(self):
+        return self._result
+
+    @staticmethod
+    def _key_values(row):
+        # MySQL gives back the UTC DATETIMEs without a time zone
+        serial, not_after, _ = row
+        return SerialNumber.from_int(int(serial, 16)), \
+            not_after.replace(tzinfo=datetime.timezone.utc)
+
+
+def test_mysql_keyset_paging():
+    from certmaestro.backends import mysql
+
+    start = datetime.datetime(2030, 1, 1)
+    # expiring in the opposite order of the serial numbers, two on the same day
+    rows = [(serial_hex(SerialNumber.from_int(serial)),
+             start + datetime.timedelta(days=min(10 - serial, 5)), f'cert {serial}')
+            for serial in range(1, 10)]
+    cursor = PagingCursor(rows)
+    backend = mysql.Backend.__new__(mysql.Backend)
+    backend.page_size = 2
+    backend._connection = lambda: contextlib.nullcontext(FakeConnection(cursor))
+    backend._select_certs = lambda columns, query: ('SELECT', query)
+
+    def names(query):
+        cursor.queries.clear()
+        return [name for name, in backend._iter_query_rows('common_name', query)]
+
+    assert names(CertQuery()) == [f'cert {serial}' for serial in range(1, 10)]
+    # 5 pages of 2, the last one is not full
+    assert len(cursor.queries) == 5
+    by_expiry = names(CertQuery(sort='expiry'))
+    assert by_expiry == [f'cert {serial}' for serial in (9, 8, 7, 6, 1, 2, 3, 4, 5)]
+    assert names(CertQuery(sort='expiry', offset=3, limit=3)) == by_expiry[3:6]
+    assert [query.limit for query in cursor.queries] == [2, 1]
+    assert cursor.queries[1].offset == 0 and cursor.queries[1].after is not None
+    after = CertQuery(sort='expiry').key(SerialNumber.from_int(1),
+                                         start.replace(tzinfo=datetime.timezone.utc) +
+                                         datetime.timedelta(days=5))
+    assert names(CertQuery(sort='expiry', after=after)) == by_expiry[5:]
@@ -0,0 +1,59 @@
+import pytest
+from certmaestro import store as store_module
+from certmaestro.store import PackedCertStore
+from certmaestro.wrapper import Cert, SerialNumber
+
+
+@pytest.fixture(scope='module')
+def certs(cert_maker):
+    return [Cert(cert_maker.pem(cert_maker.make(f'host{i}.example.com', serial=serial)))
+            for i, serial in enumerate([5, 1, 0x1000, 3])]
+
+
+@pytest.fixture
+def packed(tmp_path, certs):
+    return PackedCertStore.create(tmp_path / 'certs.pack', certs)
+
+
+def test_lookup(packed, certs):
+    for cert in certs:
+        assert bytes(packed.get_der(cert.serial_number)) == cert.der
+        assert packed.get(cert.serial_number).subject == cert.subject
+    assert packed.get(SerialNumber('02')) is None
+    assert SerialNumber('03') in packed
+    assert len(packed) == 4
+
+
+def test_iteration_keeps_order(packed, certs):
+    assert [c.serial_number for c in packed] == [c.serial_number for c in certs]
+
+
+def test_add(packed, cert_maker, certs):
+    new = Cert(cert_maker.pem(cert_maker.make('new.example.com', serial=2)))
+    packed.add(new)
+    assert packed.get(SerialNumber('02')).subject.common_name == 'new.example.com'
+    with pytest.raises(ValueError):
+        packed.add(certs[0])
+    # another reader sees the new certificate too
+    assert SerialNumber('02') in PackedCertStore(packed.path)
+
+
+def test_tail_is_sorted_in(packed, cert_maker, monkeypatch):
+    monkeypatch.setattr(store_module, 'MAX_UNSORTED', 1)
+    for serial in (100, 50, 75):
+        packed.add(Cert(cert_maker.pem(cert_maker.make('tail.example.com', serial=serial))))
+    assert packed._sorted_count >= 6
+    assert all(SerialNumber.from_int(s) in packed for s in (1, 3, 5, 50, 75, 100, 0x1000))
+
+
+def test_repack_is_noticed(packed, certs):
+    reader = PackedCertStore(packed.path)
+    assert len(reader) == 4
+    PackedCertStore.create(packed.path, certs[:2])
+    assert len(reader) == 2
+    assert reader.get(certs[3].serial_number) is None
+
+
+def test_duplicate_serials(tmp_path, certs):
+    with pytest.raises(ValueError):
+        PackedCertStore.create(tmp_path / 'certs.pack', [certs[0], certs[0]])
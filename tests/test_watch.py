@@ -0,0 +1,90 @@
+import datetime
+import pytest
+from certmaestro.check import CheckedSite, CheckResult
+from certmaestro.watch import (SiteScheduler, WatchPolicy, WatchedSite, WatchEvent, DAY, HOUR,
+                               MINUTE, normalize_targets)
+
+
+NOW = 1_500_000_000.0
+
+
+class FakeCert:
+    def __init__(self, serial_number, days_left):
+        self.serial_number = serial_number
+        self.not_valid_after = datetime.datetime.fromtimestamp(NOW + days_left * DAY,
+                                                               datetime.timezone.utc)
+
+
+def valid(target, serial='01', days_left=60):
+    return CheckedSite(target, CheckResult.SUCCEEDED, cert=FakeCert(serial, days_left))
+
+
+def failed(target):
+    return CheckedSite(target, CheckResult.FAILED, 'Timed out')
+
+
+@pytest.fixture
+def policy():
+    return WatchPolicy(jitter=0)
+
+
+class TestPolicy:
+    def test_healthy_far_from_expiry_is_checked_rarely(self, policy):
+        site = WatchedSite('a.com', not_valid_after=NOW + 60 * DAY)
+        assert policy.next_interval(site, NOW) == policy.max_interval
+
+    def test_near_expiry_is_checked_often(self, policy):
+        site = WatchedSite('a.com', not_valid_after=NOW + DAY)
+        assert policy.next_interval(site, NOW) < 2 * HOUR
+
+    def test_failures_back_off(self, policy):
+        intervals = [policy.next_interval(WatchedSite('a.com', failures=n), NOW)
+                     for n in range(1, 10)]
+        assert intervals[0] == policy.min_interval
+        assert intervals == sorted(intervals)
+        assert intervals[-1] == policy.failure_max_interval
+
+
+class TestScheduler:
+    def test_new_sites_are_due_immediately(self, policy):
+        scheduler = SiteScheduler(['a.com', 'b.com'], policy=policy)
+        assert sorted(scheduler.pop_due(NOW)) == ['a.com', 'b.com']
+        assert scheduler.pop_due(NOW) == []
+
+    def test_events(self, policy):
+        scheduler = SiteScheduler(['a.com'], policy=policy)
+        assert scheduler.record(valid('a.com'), NOW).kind == WatchEvent.VALID
+        assert scheduler.record(valid('a.com'), NOW) is None
+        assert scheduler.record(failed('a.com'), NOW).kind == WatchEvent.FAILED
+        assert scheduler.record(failed('a.com'), NOW) is None
+        assert scheduler.record(valid('a.com'), NOW).kind == WatchEvent.RECOVERED
+        assert scheduler.record(valid('a.com', serial='02'), NOW).kind == WatchEvent.CHANGED
+
+    def test_state_survives_restarts(self, policy, tmp_path):
+        state_path = tmp_path / 'state.json'
+        scheduler = SiteScheduler(['a.com', 'b.com'], state_path, policy)
+        scheduler.pop_due(NOW)
+        scheduler.record(valid('a.com'), NOW)
+        scheduler.record(failed('b.com'), NOW)
+        scheduler.save()
+
+        restarted = SiteScheduler(['a.com', 'b.com', 'c.com'], state_path, policy)
+        assert restarted.sites['b.com'].failures == 1
+        assert restarted.pop_due(NOW + 10 * MINUTE) == ['c.com', 'b.com']
+
+    def test_handshake_volume_is_reduced(self, policy):
+        # healthy sites checked for a day compared to a cron job running every 5 minutes
+        scheduler = SiteScheduler([f'site{n}.com' for n in range(10)], policy=policy)
+        checks = 0
+        for minute in range(0, 24 * 60, 5):
+            now = NOW + minute * MINUTE
+            for target in scheduler.pop_due(now):
+                scheduler.record(valid(target), now)
+                checks += 1
+        assert checks * 10 <= 10 * 24 * 60 / 5
+
+
+def test_normalize_targets():
+    targets, skipped = normalize_targets(['https://A.com', 'a.com:443', 'a.com:8443', 'http://b'])
+    assert targets == ['a.com', 'a.com:8443']
+    assert [s.url for s in skipped] == ['http://b']
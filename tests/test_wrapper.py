@@ -1,5 +1,5 @@
 import pytest
-from certmaestro.wrapper import Name
+from certmaestro.wrapper import Cert, Name, SerialNumber, iter_certs
 import asn1crypto.x509 as asn1x509
 
 
@@ -36,3 +36,106 @@ class TestName:
 
     def test_names_are_equal_with_different_order(self):
         assert Name('/C=HU/L=Budapest/O=asf') == Name('/O=asf/C=HU/L=Budapest')
+
+    def test_same_string_gives_same_object(self):
+        name = Name('/C=HU/O=Interned/CN=example.com')
+        assert Name('/C=HU/O=Interned/CN=example.com') is name
+
+    def test_names_are_hashable(self):
+        names = {Name('/C=HU/O=asf'), Name('/O=asf/C=HU'), Name('/C=HU/O=other')}
+        assert len(names) == 2
+
+    def test_name_from_str_equals_name_from_asn1(self):
+        asn1name = asn1x509.Name.build({'country_name': 'HU', 'common_name': 'Example.com'})
+        name = Name('/C=HU/CN=example.com')
+        assert name == Name.from_asn1(asn1name)
+        assert hash(name) == hash(Name.from_asn1(asn1name))
+        assert Name('/C=HU/CN=Example.com').asn1.dump() == asn1name.dump()
+
+
+class TestSerialNumber:
+    @pytest.mark.parametrize('serial', ['0x0a1b', '0A:1B', 'a1b', '0a-1b', ' 0a1b\n'])
+    def test_formats_are_parsed(self, serial):
+        serial_number = SerialNumber(serial)
+        assert str(serial_number) == '0a:1b'
+        assert serial_number.as_hex() == '0a1b'
+        assert serial_number.as_hex(prefix=True) == '0x0a1b'
+
+    def test_from_int(self):
+        assert SerialNumber.from_int(0xa1b) == SerialNumber('0a:1b')
+        assert str(SerialNumber.from_int(0)) == '00'
+        assert int(SerialNumber('ff')) == 255
+
+    def test_serials_are_hashable(self):
+        serials = {SerialNumber('01'), SerialNumber.from_int(1), SerialNumber('0x02')}
+        assert serials == {SerialNumber('1'), SerialNumber('2')}
+
+    def test_serials_are_ordered(self):
+        serials = [SerialNumber('ff'), SerialNumber('1'), SerialNumber('0x1ff')]
+        assert [s.as_hex() for s in sorted(serials)] == ['01', 'ff', '01ff']
+
+
+@pytest.fixture(scope='module')
+def cert(cert_maker):
+    return Cert(cert_maker.pem(cert_maker.make('wrapper.example.com')))
+
+
+class TestCert:
+    def test_derived_fields_are_formatted(self, cert):
+        raw_signature = cert._cert.signature
+        assert cert.signature == ':'.join(f'{byte:02x}' for byte in raw_signature)
+        public_key = cert.public_key
+        assert public_key.modulus == '00:' + SerialNumber.colonize(
+            hex(public_key._public_key['public_key'].native['modulus'])[2:])
+        assert public_key.exponent == 65537
+        assert public_key.hex_exponent == '0x10001'
+
+    def test_derived_fields_are_memoized(self, cert):
+        assert cert.signature is cert.signature
+        assert cert.serial_number is cert.serial_number
+        public_key = cert.public_key
+        assert public_key.modulus is public_key.modulus
+
+
+@pytest.fixture(scope='module')
+def chain(cert_maker):
+    return [cert_maker.make('leaf.example.com'), cert_maker.ca]
+
+
+class TestIterCerts:
+    def test_pem_bundle_with_text_and_keys(self, tmp_path, cert_maker, chain):
+        bundle = tmp_path / 'chain.pem'
+        bundle.write_text(
+            'Certificate:\n    Data:\n        Version: 3 (0x2)\n' + cert_maker.pem(chain[0]) +
+            '\n# comment\n' + cert_maker.key_pem(cert_maker.ca_key) + cert_maker.pem(chain[1])
+        )
+        certs = list(iter_certs(bundle))
+        assert [c.subject.common_name for c in certs] == ['leaf.example.com',
+                                                          'Certmaestro Test CA']
+        assert str(certs[1]) == cert_maker.pem(chain[1])
+
+    def test_concatenated_der(self, tmp_path, chain):
+        bundle = tmp_path / 'chain.der'
+        bundle.write_bytes(b''.join(c.dump() for c in chain))
+        assert [c.serial_number for c in iter_certs(bundle)] == [
+            SerialNumber.from_int(c.serial_number) for c in chain]
+
+    def test_empty_file(self, tmp_path):
+        empty = tmp_path / 'empty.pem'
+        empty.touch()
+        assert list(iter_certs(empty)) == []
+
+    def test_truncated(self, tmp_path, cert_maker, chain):
+        bundle = tmp_path / 'truncated.pem'
+        bundle.write_text(cert_maker.pem(chain[0])[:-30])
+        with pytest.raises(ValueError):
+            list(iter_certs(bundle))
+
+    def test_truncated_begin_line(self, tmp_path, cert_maker, chain):
+        bundle = tmp_path / 'truncated.pem'
+        bundle.write_text(cert_maker.pem(chain[0]) + '-----BEGIN CERTIF')
+        with pytest.raises(ValueError, match='Truncated PEM block at offset'):
+            list(iter_certs(bundle))
+        bundle.write_bytes(chain[0].dump()[:-30])
+        with pytest.raises(ValueError):
+            list(iter_certs(bundle))